@@ -0,0 +1,218 @@
+"""
+Índice de admissão em memória por evento
+
+Antes da abertura de portas (gates_open) os bilhetes do evento são carregados
+para um índice compacto (ids ordenados em array + bitset de estado + colunas
+com valores repetidos codificadas em tabelas de strings), permitindo servir
+scans sem ir ao Postgres. As escritas (reserve_ticket) são write-through:
+primeiro na tabela tickets, depois no índice.
+
+Nas admissões o bit de estado funciona como reserva sem locks: como o event
+loop é single-threaded, verificar e marcar o bit é atómico, e uma segunda
+leitura do mesmo bilhete é rejeitada sem chegar à base de dados.
+"""
+import asyncio
+import os
+from array import array
+from bisect import bisect_left
+from datetime import datetime
+from database import get_db_connection
+
+# Modo opt-in: carregar automaticamente os eventos cuja abertura de portas se aproxima
+ADMISSION_INDEX_ENABLED = os.getenv("ADMISSION_INDEX_ENABLED", "false").lower() == "true"
+# Minutos antes de gates_open em que o evento é carregado
+ADMISSION_INDEX_PREWARM_MINUTES = int(os.getenv("ADMISSION_INDEX_PREWARM_MINUTES", "60"))
+# Horas após gates_open em que o evento é mantido em memória
+ADMISSION_INDEX_RETAIN_HOURS = int(os.getenv("ADMISSION_INDEX_RETAIN_HOURS", "6"))
+# Intervalo (segundos) entre verificações do ciclo de pré-aquecimento
+ADMISSION_INDEX_REFRESH_SECONDS = float(os.getenv("ADMISSION_INDEX_REFRESH_SECONDS", "60"))
+
+
+class InternedColumn:
+    """Coluna de baixa cardinalidade: códigos uint16 + tabela de valores"""
+    __slots__ = ("codes", "values", "_lookup")
+
+    def __init__(self):
+        self.codes = array("H")
+        self.values = []
+        self._lookup = {}
+
+    def append(self, value):
+        code = self._lookup.get(value)
+        if code is None:
+            code = len(self.values)
+            self._lookup[value] = code
+            self.values.append(value)
+        self.codes.append(code)
+
+    def __getitem__(self, pos: int):
+        return self.values[self.codes[pos]]
+
+
+class EventIndex:
+    """Índice compacto dos bilhetes de um evento (ordenado por id)"""
+    __slots__ = ("event_id", "ids", "state", "deleted", "gates_open", "gate_id",
+                 "sector_id", "ticket_type", "row_id", "seat_id", "seat_node_id", "admitted_at")
+
+    def __init__(self, event_id: int, rows: list[dict]):
+        rows = sorted(rows, key=lambda r: r["id"])
+        size = (len(rows) + 7) // 8
+        self.event_id = event_id
+        self.ids = array("q", (r["id"] for r in rows))
+        self.state = bytearray(size)
+        self.deleted = bytearray(size)
+        self.gates_open = InternedColumn()
+        self.gate_id = InternedColumn()
+        self.sector_id = InternedColumn()
+        self.ticket_type = InternedColumn()
+        self.row_id = []
+        self.seat_id = []
+        self.seat_node_id = []
+        self.admitted_at = []
+        for pos, row in enumerate(rows):
+            if row["state"]:
+                self.state[pos >> 3] |= 1 << (pos & 7)
+            self.gates_open.append(row["gates_open"])
+            self.gate_id.append(row["gate_id"])
+            self.sector_id.append(row["sector_id"])
+            self.ticket_type.append(row["ticket_type"])
+            self.row_id.append(row["row_id"])
+            self.seat_id.append(row["seat_id"])
+            self.seat_node_id.append(row["seat_node_id"])
+            self.admitted_at.append(row["admitted_at"])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def position(self, ticket_id: int) -> int | None:
+        """Posição do bilhete no índice (pesquisa binária) ou None"""
+        pos = bisect_left(self.ids, ticket_id)
+        if pos == len(self.ids) or self.ids[pos] != ticket_id:
+            return None
+        if self.deleted[pos >> 3] >> (pos & 7) & 1:
+            return None
+        return pos
+
+    def is_admitted(self, pos: int) -> bool:
+        return bool(self.state[pos >> 3] >> (pos & 7) & 1)
+
+    def set_state(self, pos: int, admitted: bool, admitted_at: datetime | None = None):
+        if admitted:
+            self.state[pos >> 3] |= 1 << (pos & 7)
+        else:
+            self.state[pos >> 3] &= ~(1 << (pos & 7)) & 0xFF
+        self.admitted_at[pos] = admitted_at
+
+    def discard(self, pos: int):
+        self.deleted[pos >> 3] |= 1 << (pos & 7)
+
+    def reset(self):
+        self.state = bytearray(len(self.state))
+        self.admitted_at = [None] * len(self.ids)
+
+    def ticket(self, pos: int) -> dict:
+        """Reconstrói a linha do bilhete no formato do modelo Ticket"""
+        return {
+            "id": self.ids[pos],
+            "event_id": self.event_id,
+            "gates_open": self.gates_open[pos],
+            "gate_id": self.gate_id[pos],
+            "row_id": self.row_id[pos],
+            "seat_id": self.seat_id[pos],
+            "sector_id": self.sector_id[pos],
+            "ticket_type": self.ticket_type[pos],
+            "state": self.is_admitted(pos),
+            "seat_node_id": self.seat_node_id[pos],
+            "admitted_at": self.admitted_at[pos],
+        }
+
+
+class AdmissionIndex:
+    """Conjunto dos índices de eventos carregados em memória"""
+
+    def __init__(self):
+        self.events: dict[int, EventIndex] = {}
+
+    def locate(self, ticket_id: int) -> tuple[EventIndex, int] | None:
+        """Procura o bilhete nos eventos carregados (normalmente um ou dois)"""
+        for event_index in self.events.values():
+            pos = event_index.position(ticket_id)
+            if pos is not None:
+                return event_index, pos
+        return None
+
+    def get(self, ticket_id: int) -> dict | None:
+        found = self.locate(ticket_id)
+        if found is None:
+            return None
+        event_index, pos = found
+        return event_index.ticket(pos)
+
+    def set_state(self, ticket_id: int, admitted: bool, admitted_at: datetime | None = None):
+        found = self.locate(ticket_id)
+        if found is not None:
+            event_index, pos = found
+            event_index.set_state(pos, admitted, admitted_at)
+
+    def claim(self, ticket_id: int) -> tuple[bool, datetime | None] | None:
+        """Marca o bilhete como admitido em memória (sem await, logo atómico).
+        Devolve None se o bilhete não estiver no índice, senão (já_usado, admitted_at)"""
+        found = self.locate(ticket_id)
+        if found is None:
+            return None
+        event_index, pos = found
+        if event_index.is_admitted(pos):
+            return True, event_index.admitted_at[pos]
+        event_index.set_state(pos, True)
+        return False, None
+
+    def discard(self, ticket_id: int):
+        found = self.locate(ticket_id)
+        if found is not None:
+            event_index, pos = found
+            event_index.discard(pos)
+
+    def reset(self):
+        for event_index in self.events.values():
+            event_index.reset()
+
+    async def load_event(self, event_id: int) -> EventIndex:
+        """Carrega (ou recarrega) todos os bilhetes de um evento"""
+        async with get_db_connection() as conn:
+            cursor = await conn.execute("SELECT * FROM tickets WHERE event_id = %s", (event_id,))
+            rows = await cursor.fetchall()
+        event_index = EventIndex(event_id, rows)
+        self.events[event_id] = event_index
+        return event_index
+
+    def unload_event(self, event_id: int) -> bool:
+        return self.events.pop(event_id, None) is not None
+
+    async def refresh(self):
+        """Carrega eventos próximos da abertura de portas e liberta eventos antigos"""
+        async with get_db_connection() as conn:
+            cursor = await conn.execute(
+                """SELECT event_id FROM tickets
+                   GROUP BY event_id
+                   HAVING min(gates_open) <= localtimestamp + make_interval(mins => %s)
+                      AND max(gates_open) >= localtimestamp - make_interval(hours => %s)""",
+                (ADMISSION_INDEX_PREWARM_MINUTES, ADMISSION_INDEX_RETAIN_HOURS)
+            )
+            active = {row["event_id"] for row in await cursor.fetchall()}
+        for event_id in list(self.events):
+            if event_id not in active:
+                self.unload_event(event_id)
+        for event_id in active - self.events.keys():
+            await self.load_event(event_id)
+
+
+admission_index = AdmissionIndex()
+
+async def prewarm_loop():
+    """Tarefa de fundo do modo opt-in (ADMISSION_INDEX_ENABLED)"""
+    while True:
+        try:
+            await admission_index.refresh()
+        except Exception as e:
+            print(f"Erro ao pré-aquecer índice de admissão: {e}")
+        await asyncio.sleep(ADMISSION_INDEX_REFRESH_SECONDS)
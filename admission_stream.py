@@ -0,0 +1,119 @@
+"""
+Stream de admissões para o Map-Service (Server-Sent Events)
+
+As mudanças de estado dos lugares (admissão, reserva e reset) são
+acumuladas durante ADMISSION_STREAM_WINDOW_MS e enviadas num único lote a
+todos os subscritores; dentro de uma janela só o estado mais recente de
+cada bilhete é enviado.
+
+Cada subscritor tem uma fila limitada de lotes. Um subscritor lento que a
+deixe encher perde os lotes pendentes e recebe um evento "resync", sinal
+para voltar a ler o estado completo em vez de continuar a partir do
+stream. Assim um cliente lento nunca faz crescer a memória do servidor nem
+atrasa os restantes.
+"""
+import asyncio
+import json
+import os
+from datetime import datetime
+from typing import AsyncIterator
+
+ADMISSION_STREAM_WINDOW_MS = int(os.getenv("ADMISSION_STREAM_WINDOW_MS", "250"))
+# Lotes em espera por subscritor antes de o considerar lento
+ADMISSION_STREAM_QUEUE_SIZE = int(os.getenv("ADMISSION_STREAM_QUEUE_SIZE", "64"))
+# Comentário SSE enviado quando não há atividade (mantém proxies abertos)
+ADMISSION_STREAM_KEEPALIVE = float(os.getenv("ADMISSION_STREAM_KEEPALIVE", "15"))
+
+RESYNC = {"type": "resync"}
+
+
+class Subscriber:
+    """Fila limitada de lotes de um cliente, opcionalmente filtrada por evento"""
+    __slots__ = ("event_id", "queue", "dropped")
+
+    def __init__(self, event_id: int | None, queue_size: int):
+        self.event_id = event_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+
+    def offer(self, message: dict):
+        """Entrega sem bloquear; com a fila cheia descarta tudo e pede resync"""
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+                self.dropped += 1
+            self.queue.put_nowait(RESYNC)
+
+
+class AdmissionBroadcaster:
+    """Agrupa as mudanças de estado em janelas e distribui-as pelos subscritores"""
+
+    def __init__(self, window_ms: int = ADMISSION_STREAM_WINDOW_MS, queue_size: int = ADMISSION_STREAM_QUEUE_SIZE):
+        self.window = window_ms / 1000
+        self.queue_size = queue_size
+        self.subscribers: set[Subscriber] = set()
+        # ticket_id -> alteração mais recente na janela atual
+        self._pending: dict[int, dict] = {}
+        self._flush_handle = None
+
+    def subscribe(self, event_id: int = None) -> Subscriber:
+        subscriber = Subscriber(event_id, self.queue_size)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self.subscribers.discard(subscriber)
+
+    def publish(self, ticket: dict, admitted: bool):
+        """Regista a mudança de estado de um bilhete (sem custo se ninguém estiver a ouvir)"""
+        if not self.subscribers:
+            return
+        self._pending[ticket["id"]] = {
+            "ticket_id": ticket["id"],
+            "event_id": ticket["event_id"],
+            "seat_node_id": ticket["seat_node_id"],
+            "sector_id": ticket["sector_id"],
+            "gate_id": ticket["gate_id"],
+            "state": admitted,
+        }
+        if self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.window, self.flush)
+
+    def flush(self):
+        self._flush_handle = None
+        changes, self._pending = list(self._pending.values()), {}
+        if not changes:
+            return
+        sent_at = datetime.now().isoformat()
+        by_event = {}
+        for change in changes:
+            by_event.setdefault(change["event_id"], []).append(change)
+        for subscriber in list(self.subscribers):
+            if subscriber.event_id is None:
+                selected = changes
+            else:
+                selected = by_event.get(subscriber.event_id)
+            if selected:
+                subscriber.offer({"type": "admissions", "sent_at": sent_at, "changes": selected})
+
+
+admission_stream = AdmissionBroadcaster()
+
+def format_sse(message: dict) -> str:
+    return f"event: {message['type']}\ndata: {json.dumps(message, separators=(',', ':'))}\n\n"
+
+async def sse_events(subscriber: Subscriber, broadcaster: AdmissionBroadcaster = admission_stream,
+                     keepalive: float = ADMISSION_STREAM_KEEPALIVE) -> AsyncIterator[str]:
+    """Corpo da resposta SSE; o subscritor é removido quando o cliente desliga"""
+    try:
+        while True:
+            try:
+                message = await asyncio.wait_for(subscriber.queue.get(), keepalive)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            yield format_sse(message)
+    finally:
+        broadcaster.unsubscribe(subscriber)
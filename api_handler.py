@@ -1,190 +1,847 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from psycopg2 import pool
-from psycopg2.extras import RealDictCursor
+from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, ORJSONResponse, Response, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field, model_validator
+from psycopg_pool import PoolTimeout, TooManyRequests
+from psycopg.rows import tuple_row
+from contextlib import asynccontextmanager
 import os
+import re
+from typing import Callable
 from dotenv import load_dotenv
-import hmac
-import hashlib
 from datetime import datetime
+from database import get_db_connection, get_read_connection, current_wal_lsn, close_db_pool, pool_stats, API_WORKERS
+from models import Ticket, TICKET_SELECT, ticket_record
+from import_tickets import import_tickets, IMPORT_FORMATS
+from generate_qr import render_qr_bytes, QR_IMAGE_FORMATS
+from http_cache import LRUCache, make_etag, etag_matches
+from qr_tokens import generate_qr_token, parse_qr_token, MAX_TOKEN_LENGTH, InvalidQRToken, InvalidQRSignature
+from scan_guard import rejected_tokens, missing_tickets, scan_rate_limiter, batch_scan_rate_limiter, retry_after
+from admission_index import admission_index, prewarm_loop, ADMISSION_INDEX_ENABLED
+from migrate import apply_migrations, MIGRATE_ON_STARTUP
+from ticket_listing import fetch_page, export_tickets, parse_fields, EXPORT_FORMATS, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from occupancy import occupancy, reconcile_loop
+from admission_stream import admission_stream, sse_events
+from load_shedding import Overloaded, concurrency_limit, limiters
+from scan_log import scan_log, flush_loop
+from seat_reset import ResetJob, reset_seats, start_reset_job, get_reset_job as fetch_reset_job, cancel_reset_job, RESET_CHUNK_SIZE
+from metrics import (registry, GaugeCallback, MetricsMiddleware, scan_results, scans_rate_limited,
+                     qr_verify_duration, serialization_duration, sync_loop as metrics_sync_loop,
+                     CONTENT_TYPE as METRICS_CONTENT_TYPE, METRICS_ENABLED, METRICS_DIR)
+from change_bus import change_bus, listen_loop, ADMIT, CREATE, DELETE, IMPORT, RESYNC
+from gate_bundle import (build_snapshot, build_changes, encode_bundle, prune_loop, ExpiredCursor,
+                         SNAPSHOT_MAGIC, DELTA_MAGIC, MAX_BUNDLE_EVENT_ID)
+from profiler import profiler, PROFILER_ENABLED, PROFILER_INTERVAL_MS, PROFILER_MAX_SECONDS
+import asyncio
 
 load_dotenv()
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if MIGRATE_ON_STARTUP:
+        for name in await apply_migrations():
+            print(f"Migração aplicada: {name}")
+    prewarm_task = asyncio.create_task(prewarm_loop()) if ADMISSION_INDEX_ENABLED else None
+    reconcile_task = asyncio.create_task(reconcile_loop())
+    scan_log_task = asyncio.create_task(flush_loop())
+    listen_task = asyncio.create_task(listen_loop()) if change_bus.enabled else None
+    bundle_prune_task = asyncio.create_task(prune_loop())
+    # Com vários workers cada um publica as suas métricas para /metrics as somar
+    metrics_task = asyncio.create_task(metrics_sync_loop()) if METRICS_ENABLED and METRICS_DIR else None
+    yield
+    if metrics_task is not None:
+        metrics_task.cancel()
+        await asyncio.gather(metrics_task, return_exceptions=True)
+    if listen_task is not None:
+        listen_task.cancel()
+    tasks = (reconcile_task, bundle_prune_task, scan_log_task)
+    for task in tasks:
+        task.cancel()
+    # Esperar pelas tarefas que usam o pool: um flush cancelado a meio devolve o lote ao
+    # buffer antes do flush final. O listener tem conexão própria e não é esperado
+    # (no psycopg 3.1 o cancelamento de notifies() só é visto na notificação seguinte)
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await change_bus.close()
+    await scan_log.close()
+    if prewarm_task is not None:
+        prewarm_task.cancel()
+    await close_db_pool()
 
-# QR Security Configuration
-QR_SECRET = os.getenv("QR_SECRET", "change-this-secret-key")
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
 
-def generate_qr_token(ticket_id: int) -> str:
-    """Gera token seguro para QR code (ticket_id + assinatura HMAC)"""
-    signature = hmac.new(
-        QR_SECRET.encode(),
-        str(ticket_id).encode(),
-        hashlib.sha256
-    ).hexdigest()[:16]  # Usar apenas 16 chars para QR menor
-    return f"{ticket_id}:{signature}"
+# Classes de concorrência (load_shedding): os scans nunca disputam capacidade com operações em massa
+SCAN_LIMIT = Depends(concurrency_limit("scan"))
+API_LIMIT = Depends(concurrency_limit("api"))
+ADMIN_LIMIT = Depends(concurrency_limit("admin"))
+
+async def listing_limit(format: str = "json"):
+    """Páginas na classe api; a exportação em streaming (format=ndjson|csv) segura uma
+    conexão até ao fim, por isso conta como operação em massa (classe admin)"""
+    limiter = limiters["admin" if format in EXPORT_FORMATS else "api"]
+    await limiter.acquire()
+    try:
+        yield
+    finally:
+        limiter.release()
+
+LISTING_LIMIT = Depends(listing_limit)
+
+# Resultados possíveis de um scan em lote
+SCAN_OK = "ok"
+SCAN_BAD_FORMAT = "bad_format"
+SCAN_BAD_SIGNATURE = "bad_signature"
+SCAN_NOT_FOUND = "not_found"
+
+# Resultados possíveis de uma admissão
+ADMITTED = "admitted"
+ALREADY_USED = "already_used"
+
+# Transição condicional numa só instrução: o FOR UPDATE serializa leituras
+# concorrentes do mesmo bilhete e devolve sempre a versão mais recente da
+# linha, pelo que uma segunda entrada vê o admitted_at original.
+# ORDER BY id evita deadlocks entre lotes com bilhetes em comum.
+# Os event_ids limitam a leitura e o UPDATE às partições dos eventos do lote.
+ADMIT_SQL = """
+WITH target AS (
+    SELECT id, event_id, sector_id, gate_id, seat_node_id, admitted_at FROM tickets
+    WHERE id = ANY(%(ids)s) AND event_id = ANY(%(event_ids)s) ORDER BY id FOR UPDATE
+), admitted AS (
+    UPDATE tickets SET state = true, admitted_at = localtimestamp
+    FROM target
+    WHERE tickets.id = target.id AND tickets.event_id = target.event_id
+      AND tickets.event_id = ANY(%(event_ids)s) AND NOT tickets.state
+    RETURNING tickets.id, tickets.admitted_at
+)
+SELECT target.id, target.event_id, target.sector_id, target.gate_id, target.seat_node_id,
+       admitted.id IS NOT NULL AS admitted,
+       COALESCE(admitted.admitted_at, target.admitted_at) AS admitted_at
+FROM target LEFT JOIN admitted USING (id)
+"""
+
+# Reserva de um lugar; devolve também o estado anterior para os contadores de ocupação
+RESERVE_SQL = """
+WITH previous AS (
+    SELECT id, event_id, state FROM tickets WHERE id = %(id)s AND event_id = %(event_id)s FOR UPDATE
+)
+UPDATE tickets SET state = true, admitted_at = COALESCE(tickets.admitted_at, localtimestamp)
+FROM previous
+WHERE tickets.id = previous.id AND tickets.event_id = %(event_id)s
+RETURNING tickets.*, previous.state AS was_admitted
+"""
+
+# event_id dos bilhetes pelo índice global ticket_ids (migração 0009): com a chave
+# primária (id, event_id) uma query só por id percorre todas as partições, e com o
+# event_id como parâmetro o Postgres lê só a do evento
+EVENT_ID_SQL = "SELECT event_id FROM ticket_ids WHERE id = %s"
+EVENT_IDS_SQL = "SELECT DISTINCT event_id FROM ticket_ids WHERE id = ANY(%s)"
+
+# Tempo máximo (segundos) de espera por uma conexão no readiness check
+HEALTH_CHECK_TIMEOUT = float(os.getenv("HEALTH_CHECK_TIMEOUT", "1"))
+
+# Imagens QR renderizadas: (ticket_id, formato) -> (event_id, token, etag, bytes)
+QR_IMAGE_CACHE_SIZE = int(os.getenv("QR_IMAGE_CACHE_SIZE", "10000"))
+QR_IMAGE_MAX_AGE = int(os.getenv("QR_IMAGE_MAX_AGE", "3600"))
+QR_MEDIA_TYPES = {"png": "image/png", "svg": "image/svg+xml"}
+qr_image_cache = LRUCache(QR_IMAGE_CACHE_SIZE)
+
+def discard_qr_images(ticket: dict):
+    for image_format in QR_IMAGE_FORMATS:
+        qr_image_cache.discard((ticket["id"], image_format))
+
+change_bus.register(DELETE, discard_qr_images)
+change_bus.register(RESYNC, qr_image_cache.clear)
+
+# Bilhetes mudam de estado: por omissão o cliente revalida sempre (barato com If-None-Match)
+TICKET_MAX_AGE = int(os.getenv("TICKET_MAX_AGE", "0"))
+TICKET_CACHE_CONTROL = f"private, max-age={TICKET_MAX_AGE}" if TICKET_MAX_AGE > 0 else "private, no-cache"
+
+# Read-your-writes com réplicas: posição do WAL devolvida pelas escritas e aceite nas leituras
+READ_AFTER_HEADER = "X-Read-After-LSN"
+LSN_FORMAT = re.compile(r"^[0-9A-Fa-f]{1,8}/[0-9A-Fa-f]{1,8}$")
+
+# Porta do leitor que faz o scan (registada no scan_log)
+GATE_HEADER = "X-Gate-Id"
+# Identificador do leitor (torniquete); com a porta, separa os limites por dispositivo
+DEVICE_HEADER = "X-Device-Id"
+# Comprimento máximo do identificador do leitor usado na chave do limite
+MAX_READER_ID_LENGTH = 64
+
+# Exportação de GET /tickets?format=...
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+# Número máximo de tokens aceites num único pedido de scan em lote
+MAX_BATCH_SCAN = int(os.getenv("MAX_BATCH_SCAN", "500"))
+
+# Lookup de lugares por seat_node_id: ids por pedido e linhas devolvidas por prefixo
+MAX_SEAT_LOOKUP = int(os.getenv("MAX_SEAT_LOOKUP", "5000"))
+SEAT_LOOKUP_MAX_ROWS = int(os.getenv("SEAT_LOOKUP_MAX_ROWS", "20000"))
+SEAT_LOOKUP_FIELDS = ("seat_node_id", "ticket_id", "state")
+
+def validate_qr_token_event(qr_data: str) -> tuple[int, int | None]:
+    """Valida token do QR (v1 ou v2) e retorna (ticket_id, event_id); event_id só existe em v2.
+    Tokens rejeitados ficam em cache negativa e são recusados sem recalcular o HMAC"""
+    rejection = rejected_tokens.get(qr_data)
+    if rejection is not None:
+        raise HTTPException(status_code=rejection[0], detail=rejection[1])
+    try:
+        with qr_verify_duration.time():
+            return parse_qr_token(qr_data)
+    except InvalidQRToken as e:
+        status_code = 401 if isinstance(e, InvalidQRSignature) else 400
+        if len(qr_data) <= MAX_TOKEN_LENGTH:
+            rejected_tokens.put(qr_data, (status_code, str(e)))
+        raise HTTPException(status_code=status_code, detail=str(e))
 
 def validate_qr_token(qr_data: str) -> int:
     """Valida token do QR e retorna ticket_id"""
+    return validate_qr_token_event(qr_data)[0]
+
+def client_host(request: Request) -> str:
+    return request.client.host if request.client else "unknown"
+
+def scan_client(request: Request) -> str:
+    """Chave do limite por cliente: IP e, se vier, o dispositivo ou a porta do leitor"""
+    reader = request.headers.get(DEVICE_HEADER) or request.headers.get(GATE_HEADER)
+    host = client_host(request)
+    return f"{host}/{reader[:MAX_READER_ID_LENGTH]}" if reader else host
+
+def check_scan_rate(request: Request, limiter=None):
+    """Token bucket por cliente à frente da validação dos tokens (pedidos recusados não vão para o scan_log)"""
+    wait = (limiter or scan_rate_limiter).acquire(scan_client(request))
+    if wait:
+        scans_rate_limited.inc()
+        raise HTTPException(status_code=429, detail="Too many scans", headers={"Retry-After": retry_after(wait)})
+
+def log_scan(request: Request, source: str, result: str, token: str = None, ticket_id: int = None,
+             event_id: int = None, gate_id: str = None):
+    """Regista a tentativa no scan_log e no contador scan_results_total;
+    a porta do leitor (X-Gate-Id) prevalece sobre a do bilhete"""
+    scan_results.inc(source, result)
+    scan_log.record(source, result, token, ticket_id, event_id,
+                    request.headers.get(GATE_HEADER) or gate_id, client_host(request))
+
+def fast_response(route: str, content, headers: dict = None) -> ORJSONResponse:
+    """ORJSONResponse com o tempo de serialização registado (o orjson serializa no construtor)"""
+    with serialization_duration.time(route):
+        return ORJSONResponse(content, headers=headers)
+
+def check_qr_token(qr_data: str) -> tuple[str, int | None, int | None]:
+    """Versão sem exceções de validate_qr_token para processamento em lote.
+    Retorna (status, ticket_id, event_id) com status em: ok, bad_format, bad_signature"""
     try:
-        parts = qr_data.strip().split(':')
-        if len(parts) != 2:
-            raise HTTPException(status_code=400, detail="Invalid QR format")
-        
-        ticket_id_str, provided_sig = parts
-        ticket_id = int(ticket_id_str)
-        
-        # Calcular assinatura esperada
-        expected_sig = hmac.new(
-            QR_SECRET.encode(),
-            str(ticket_id).encode(),
-            hashlib.sha256
-        ).hexdigest()[:16]
-        
-        # Comparação segura contra timing attacks
-        if not hmac.compare_digest(provided_sig, expected_sig):
-            raise HTTPException(status_code=401, detail="Invalid QR signature")
-        
-        return ticket_id
-    except ValueError:
-        raise HTTPException(status_code=400, detail="Invalid ticket ID format")
+        return SCAN_OK, *validate_qr_token_event(qr_data)
+    except HTTPException as e:
+        if e.status_code == 401:
+            return SCAN_BAD_SIGNATURE, None, None
+        return SCAN_BAD_FORMAT, None, None
+
+class BatchScanRequest(BaseModel):
+    tokens: list[str] = Field(..., min_length=1, max_length=MAX_BATCH_SCAN)
+
+class ScanResult(BaseModel):
+    token: str
+    status: str
+    ticket: Ticket | None = None
+
+class BatchScanResponse(BaseModel):
+    results: list[ScanResult]
 
-class Ticket(BaseModel):
-    id: int
+class AdmissionResult(BaseModel):
+    ticket_id: int
+    status: str
+    admitted_at: datetime | None = None
+
+class BatchAdmissionRequest(BaseModel):
+    ticket_ids: list[int] = Field(..., min_length=1, max_length=MAX_BATCH_SCAN)
+
+class BatchAdmissionResponse(BaseModel):
+    results: list[AdmissionResult]
+
+class SeatLookupRequest(BaseModel):
+    """Lista de seat_node_ids ou prefixo (setor/bancada), um dos dois"""
+    seat_node_ids: list[str] | None = Field(None, min_length=1, max_length=MAX_SEAT_LOOKUP)
+    prefix: str | None = Field(None, min_length=1)
+
+    @model_validator(mode="after")
+    def one_selector(self):
+        if (self.seat_node_ids is None) == (self.prefix is None):
+            raise ValueError("Provide either seat_node_ids or prefix")
+        return self
+
+class SeatLookupResponse(BaseModel):
+    """Formato compacto: uma linha [seat_node_id, ticket_id, state] por lugar"""
     event_id: int
-    gates_open: datetime
-    gate_id: str
-    row_id: str
-    seat_id: str
-    sector_id: str
-    ticket_type: str
-    state: bool
-    seat_node_id: str | None = None  # ID do seat no Map-Service (ex: Seat-Norte-T0-R05-12)
-    
-    class Config:
-        json_encoders = {
-            datetime: lambda v: v.isoformat()
-        }
-
-db_pool = None
-
-def get_db_pool():
-    """Inicializa pool de conexões de forma lazy"""
-    global db_pool
-    if db_pool is None:
-        db_pool = pool.SimpleConnectionPool(1, 20,
-            host=os.getenv("DB_HOST"),
-            database=os.getenv("DB_NAME"),
-            user=os.getenv("DB_USER"),
-            password=os.getenv("DB_PASSWORD")
-        )
-    return db_pool
+    fields: list[str] = list(SEAT_LOOKUP_FIELDS)
+    rows: list[tuple[str, int, bool]]
+    missing: list[str] = []
+    truncated: bool = False
+
+
+def read_after_lsn(request: Request) -> str | None:
+    """LSN devolvido por uma escrita anterior: a leitura só usa uma réplica que já o tenha aplicado"""
+    lsn = request.headers.get(READ_AFTER_HEADER)
+    if lsn is not None and not LSN_FORMAT.match(lsn):
+        raise HTTPException(status_code=400, detail=f"Invalid {READ_AFTER_HEADER}")
+    return lsn
+
+def ticket_etag(ticket_id: int, version: int) -> str:
+    """ETag forte a partir da versão da linha (sem serializar o bilhete)"""
+    return f'"{ticket_id}-{version}"'
 
-def get_db_connection():
-    return get_db_pool().getconn()
+def ticket_cache_headers(ticket_id: int, version: int) -> dict:
+    return {"ETag": ticket_etag(ticket_id, version), "Cache-Control": TICKET_CACHE_CONTROL}
 
-def release_db_connection(conn):
-    get_db_pool().putconn(conn)
 
+async def ticket_event_id(conn, ticket_id: int) -> int | None:
+    """event_id do bilhete, ou None se não existir"""
+    cursor = await conn.execute(EVENT_ID_SQL, (ticket_id,))
+    row = await cursor.fetchone()
+    return None if row is None else row["event_id"]
 
-@app.get("/ticket/scan/{qr_data}", response_model=Ticket)
-async def get_ticket_by_qr(qr_data: str):
-    """Endpoint seguro para ler QR code e obter dados do bilhete"""
-    ticket_id = validate_qr_token(qr_data)
+async def ticket_event_ids(conn, ticket_ids: list[int]) -> list[int]:
+    """event_ids distintos dos bilhetes (os inexistentes são ignorados)"""
+    cursor = await conn.execute(EVENT_IDS_SQL, (ticket_ids,))
+    return [row["event_id"] for row in await cursor.fetchall()]
+
+
+async def admit_tickets(ticket_ids: list[int]) -> list[dict]:
+    """Admite bilhetes de forma atómica, distinguindo primeira entrada de repetição.
+    Bilhetes repetidos no mesmo lote contam como already_used a partir da segunda vez"""
+    outcomes = {}
+    claimed = []
+    pending = []
+    for ticket_id in dict.fromkeys(ticket_ids):
+        claim = admission_index.claim(ticket_id)
+        if claim is None:
+            pending.append(ticket_id)
+        elif claim[0]:
+            outcomes[ticket_id] = (ALREADY_USED, claim[1])
+        else:
+            claimed.append(ticket_id)
+            pending.append(ticket_id)
     
-    conn = get_db_connection()
-    try:
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        cursor.execute("SELECT * FROM tickets WHERE id = %s", (ticket_id,))
-        ticket = cursor.fetchone()
-        cursor.close()
-        
-        if not ticket:
-            raise HTTPException(status_code=404, detail="Ticket not found")
+    if pending:
+        # Eventos pré-carregados no índice dispensam a consulta a ticket_ids
+        indexed = [admission_index.get(ticket_id) for ticket_id in pending]
+        try:
+            async with get_db_connection() as conn:
+                if all(indexed):
+                    event_ids = list({ticket["event_id"] for ticket in indexed})
+                else:
+                    event_ids = await ticket_event_ids(conn, pending)
+                rows = []
+                if event_ids:
+                    cursor = await conn.execute(ADMIT_SQL, {"ids": pending, "event_ids": event_ids})
+                    rows = await cursor.fetchall()
+        except Exception:
+            # Desfazer as reservas em memória se a escrita falhar
+            for ticket_id in claimed:
+                admission_index.set_state(ticket_id, False)
+            raise
         
-        return dict(ticket)
-    finally:
-        release_db_connection(conn)
+        for row in rows:
+            outcomes[row["id"]] = (ADMITTED if row["admitted"] else ALREADY_USED, row["admitted_at"])
+            if not row["admitted"]:
+                admission_index.set_state(row["id"], True, row["admitted_at"])
+        change_bus.publish(ADMIT, [row for row in rows if row["admitted"]])
+        for ticket_id in claimed:
+            if ticket_id not in outcomes:
+                admission_index.discard(ticket_id)
+    
+    results = []
+    seen = set()
+    for ticket_id in ticket_ids:
+        status, admitted_at = outcomes.get(ticket_id, (SCAN_NOT_FOUND, None))
+        if ticket_id in seen and status == ADMITTED:
+            status = ALREADY_USED
+        seen.add(ticket_id)
+        results.append({"ticket_id": ticket_id, "status": status, "admitted_at": admitted_at})
+    return results
 
 
-@app.get("/ticket/{ticket_id}", response_model=Ticket)
-async def get_ticket(ticket_id: int):
-    conn = get_db_connection()
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    """Corte de carga: recusar já com 503 em vez de acumular pedidos à espera"""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": f"Server overloaded ({exc.limiter}), retry later"},
+        headers={"Retry-After": retry_after(exc.retry_after)}
+    )
+
+@app.exception_handler(TooManyRequests)
+@app.exception_handler(PoolTimeout)
+async def pool_timeout_handler(request: Request, exc: PoolTimeout):
+    """Pool esgotado: responder 503 em vez de bloquear o pedido indefinidamente"""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Database busy, retry later"},
+        headers={"Retry-After": "1"}
+    )
+
+
+@app.get("/health/live")
+async def liveness():
+    """O processo está a responder (não depende da base de dados)"""
+    return {"status": "alive"}
+
+@app.get("/health/pool")
+async def health_pool():
+    """Estado dos pools de conexões, dos limites de concorrência por classe, do scan_log e do change_bus"""
+    return {**pool_stats(), "limits": {name: limiter.stats() for name, limiter in limiters.items()},
+            "scan_log": scan_log.stats(), "change_bus": change_bus.stats()}
+
+def pool_gauge(value) -> Callable[[], dict]:
+    """Callback de gauge com um valor por pool (primary, replica0, ...) a partir de get_stats()"""
+    def collect() -> dict:
+        stats = pool_stats()
+        pools = {"primary": stats["primary"]} if stats["primary"] is not None else {}
+        pools.update((f"replica{index}", replica) for index, replica in enumerate(stats["replicas"]))
+        return {(name,): value(pool) for name, pool in pools.items()}
+    return collect
+
+def limiter_gauge(key: str) -> Callable[[], dict]:
+    return lambda: {(name,): limiter.stats()[key] for name, limiter in limiters.items()}
+
+registry.register(GaugeCallback(
+    "db_pool_connections_in_use", "Conexões emprestadas a pedidos", ("pool",),
+    pool_gauge(lambda pool: pool.get("pool_size", 0) - pool.get("pool_available", 0))))
+registry.register(GaugeCallback(
+    "db_pool_connections_idle", "Conexões livres no pool", ("pool",),
+    pool_gauge(lambda pool: pool.get("pool_available", 0))))
+registry.register(GaugeCallback(
+    "db_pool_requests_waiting", "Pedidos à espera de uma conexão", ("pool",),
+    pool_gauge(lambda pool: pool.get("requests_waiting", 0))))
+registry.register(GaugeCallback(
+    "concurrency_active", "Pedidos em execução por classe de endpoint", ("class",), limiter_gauge("active")))
+registry.register(GaugeCallback(
+    "concurrency_waiting", "Pedidos na fila por classe de endpoint", ("class",), limiter_gauge("waiting")))
+registry.register(GaugeCallback(
+    "concurrency_shed", "Pedidos recusados por excesso de carga desde o arranque", ("class",), limiter_gauge("shed")))
+registry.register(GaugeCallback(
+    "scan_log_buffered", "Entradas do scan_log por escrever", (), lambda: {(): len(scan_log.entries)}))
+
+@app.get("/metrics")
+async def get_metrics():
+    """Métricas no formato de texto do Prometheus"""
+    return Response(registry.render(), media_type=METRICS_CONTENT_TYPE)
+
+def require_profiler():
+    if not PROFILER_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiler disabled (PROFILER_ENABLED=false)")
+    if API_WORKERS > 1:
+        # Cada pedido calha a um worker diferente: o stop não encontraria a sessão do start
+        raise HTTPException(status_code=409, detail="Profiler requires a single worker (API_WORKERS=1)")
+
+@app.get("/debug/profiler")
+async def profiler_status():
+    require_profiler()
+    return profiler.stats()
+
+@app.post("/debug/profiler", status_code=202)
+async def start_profiler(interval_ms: float = PROFILER_INTERVAL_MS, seconds: float = PROFILER_MAX_SECONDS):
+    """Liga o profiler de amostragem sobre a thread do event loop"""
+    require_profiler()
+    if not 1 <= interval_ms <= 1000 or not 0 < seconds <= PROFILER_MAX_SECONDS:
+        raise HTTPException(status_code=400,
+                            detail=f"interval_ms must be 1-1000 and seconds at most {PROFILER_MAX_SECONDS}")
     try:
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        cursor.execute("SELECT * FROM tickets WHERE id = %s", (ticket_id,))
-        ticket = cursor.fetchone()
-        cursor.close()
-        
-        if not ticket:
-            raise HTTPException(status_code=404, detail="Ticket not found")
-        
-        return dict(ticket)
-    finally:
-        release_db_connection(conn)
+        profiler.start(interval_ms, seconds)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return profiler.stats()
 
+@app.delete("/debug/profiler")
+async def stop_profiler():
+    """Desliga o profiler e devolve as stacks amostradas (formato collapsed, para flamegraphs)"""
+    require_profiler()
+    return Response(await run_in_threadpool(profiler.stop), media_type="text/plain; charset=utf-8")
 
-@app.put("/ticket/{ticket_id}", response_model=Ticket)
-async def reserve_ticket(ticket_id: int):
-    conn = get_db_connection()
+@app.get("/health/ready")
+async def readiness():
+    """Pronto para tráfego: base de dados acessível e schema criado"""
     try:
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        cursor.execute("UPDATE tickets SET state = true WHERE id = %s RETURNING *", (ticket_id,))
-        updated_ticket = cursor.fetchone()
-        conn.commit()
-        cursor.close()
-        
-        if not updated_ticket:
+        async with get_db_connection(timeout=HEALTH_CHECK_TIMEOUT) as conn:
+            await conn.execute("SELECT 1 FROM tickets LIMIT 1")
+    except Exception as e:
+        return JSONResponse(status_code=503, content={"status": "unavailable", "detail": str(e)})
+    return {"status": "ready"}
+
+
+@app.get("/ticket/scan/{qr_data}", response_model=Ticket, dependencies=[SCAN_LIMIT])
+async def get_ticket_by_qr(qr_data: str, request: Request):
+    """Endpoint seguro para ler QR code e obter dados do bilhete.
+    Caminho rápido: tupla -> TicketRecord -> orjson, sem passar pelo response_model"""
+    check_scan_rate(request)
+    try:
+        ticket_id, event_id = validate_qr_token_event(qr_data)
+    except HTTPException as e:
+        log_scan(request, "scan", SCAN_BAD_SIGNATURE if e.status_code == 401 else SCAN_BAD_FORMAT, qr_data)
+        raise
+    
+    # Caminho rápido: evento pré-carregado no índice de admissão
+    # (sem ETag: o índice não guarda a versão da linha)
+    ticket = admission_index.get(ticket_id)
+    if ticket is not None:
+        log_scan(request, "scan", SCAN_OK, qr_data, ticket_id, ticket["event_id"], ticket["gate_id"])
+        return fast_response("scan", ticket)
+    
+    if ticket_id in missing_tickets:
+        log_scan(request, "scan", SCAN_NOT_FOUND, qr_data, ticket_id, event_id)
+        raise HTTPException(status_code=404, detail="Ticket not found")
+    
+    async with get_read_connection(read_after_lsn(request)) as conn:
+        if event_id is None:
+            # Token v1: o event_id vem de ticket_ids
+            event_id = await ticket_event_id(conn, ticket_id)
+        ticket = None
+        if event_id is not None:
+            async with conn.cursor(row_factory=ticket_record) as cursor:
+                # O event_id permite ao Postgres ler só a partição do evento
+                await cursor.execute(f"{TICKET_SELECT} WHERE id = %s AND event_id = %s", (ticket_id, event_id))
+                ticket = await cursor.fetchone()
+    
+    if not ticket:
+        missing_tickets.put(ticket_id)
+        log_scan(request, "scan", SCAN_NOT_FOUND, qr_data, ticket_id, event_id)
+        raise HTTPException(status_code=404, detail="Ticket not found")
+    
+    log_scan(request, "scan", SCAN_OK, qr_data, ticket_id, ticket.event_id, ticket.gate_id)
+    headers = ticket_cache_headers(ticket.id, ticket.version)
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    return fast_response("scan", ticket, headers)
+
+
+@app.post("/tickets/scan", response_model=BatchScanResponse, dependencies=[SCAN_LIMIT])
+async def batch_scan_tickets(batch: BatchScanRequest, request: Request):
+    """Scan em lote: valida todos os HMACs e obtém os bilhetes válidos numa só query"""
+    # Bucket próprio, um token por pedido: o lote não gasta o limite dos scans unitários
+    check_scan_rate(request, batch_scan_rate_limiter)
+    checked = [(token, *check_qr_token(token)) for token in batch.tokens]
+    valid_ids = {ticket_id for _, status, ticket_id, _ in checked
+                 if status == SCAN_OK and ticket_id not in missing_tickets}
+    event_ids = {event_id for _, status, _, event_id in checked if status == SCAN_OK}
+    
+    tickets = {}
+    for ticket_id in valid_ids:
+        ticket = admission_index.get(ticket_id)
+        if ticket is not None:
+            tickets[ticket_id] = ticket
+    
+    missing_ids = list(valid_ids - tickets.keys())
+    if missing_ids:
+        async with get_read_connection(read_after_lsn(request)) as conn:
+            if None in event_ids:
+                # Tokens v1 no lote: event_ids de ticket_ids
+                event_ids = set(await ticket_event_ids(conn, missing_ids))
+            async with conn.cursor(row_factory=ticket_record) as cursor:
+                # Limitar às partições dos eventos presentes no lote
+                await cursor.execute(
+                    f"{TICKET_SELECT} WHERE id = ANY(%s) AND event_id = ANY(%s)", (missing_ids, list(event_ids))
+                )
+                tickets.update((record.id, record) for record in await cursor.fetchall())
+        for ticket_id in missing_ids:
+            if ticket_id not in tickets:
+                missing_tickets.put(ticket_id)
+    
+    results = []
+    for token, status, ticket_id, event_id in checked:
+        if status == SCAN_OK and ticket_id not in tickets:
+            status = SCAN_NOT_FOUND
+        log_scan(request, "batch_scan", status, token, ticket_id, event_id)
+        results.append({"token": token, "status": status, "ticket": tickets.get(ticket_id)})
+    
+    return fast_response("batch_scan", {"results": results})
+
+
+@app.get("/tickets", dependencies=[LISTING_LIMIT])
+async def list_tickets(request: Request, event_id: int = None, sector_id: str = None, gate_id: str = None,
+                       state: bool = None, fields: str = None, after: int = 0, limit: int = DEFAULT_PAGE_SIZE,
+                       format: str = "json"):
+    """Lista bilhetes com paginação keyset (after=next_after da página anterior);
+    format=ndjson|csv exporta todos os que respeitam os filtros em streaming"""
+    try:
+        columns = parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    filters = {"event_id": event_id, "sector_id": sector_id, "gate_id": gate_id, "state": state}
+    min_lsn = read_after_lsn(request)
+    
+    if format in EXPORT_FORMATS:
+        return StreamingResponse(
+            export_tickets(filters, columns, format, after, min_lsn),
+            media_type=EXPORT_MEDIA_TYPES[format],
+            headers={"Content-Disposition": f'attachment; filename="tickets.{format}"'}
+        )
+    if format != "json":
+        raise HTTPException(status_code=400, detail=f"format must be one of json, {', '.join(EXPORT_FORMATS)}")
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    return await fetch_page(filters, columns, after, limit, min_lsn)
+
+
+@app.get("/ticket/{ticket_id}", response_model=Ticket, dependencies=[API_LIMIT])
+async def get_ticket(ticket_id: int, request: Request):
+    """Bilhete com ETag da versão da linha; If-None-Match só lê a versão e responde 304"""
+    if_none_match = request.headers.get("if-none-match")
+    async with get_read_connection(read_after_lsn(request)) as conn:
+        event_id = await ticket_event_id(conn, ticket_id)
+        if event_id is None:
             raise HTTPException(status_code=404, detail="Ticket not found")
+        if if_none_match:
+            cursor = await conn.execute("SELECT id, version FROM tickets WHERE id = %s AND event_id = %s",
+                                        (ticket_id, event_id))
+            current = await cursor.fetchone()
+            if current and etag_matches(if_none_match, ticket_etag(current["id"], current["version"])):
+                return Response(status_code=304, headers=ticket_cache_headers(current["id"], current["version"]))
         
-        return dict(updated_ticket)
-    finally:
-        release_db_connection(conn)
+        async with conn.cursor(row_factory=ticket_record) as cursor:
+            await cursor.execute(f"{TICKET_SELECT} WHERE id = %s AND event_id = %s", (ticket_id, event_id))
+            ticket = await cursor.fetchone()
+        
+        if not ticket:
+            raise HTTPException(status_code=404, detail="Ticket not found")
+    
+    return fast_response("ticket", ticket, ticket_cache_headers(ticket.id, ticket.version))
+
+
+@app.get("/ticket/{ticket_id}/qr", dependencies=[API_LIMIT])
+async def get_ticket_qr(ticket_id: int, request: Request, format: str = "png"):
+    """Imagem do QR do bilhete (PNG ou SVG), servida de cache com ETag forte"""
+    if format not in QR_IMAGE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(QR_IMAGE_FORMATS)}")
+    
+    cached = qr_image_cache.get((ticket_id, format))
+    # O token faz parte da entrada: se a chave ativa mudar a imagem é redesenhada
+    if cached is None or cached[1] != generate_qr_token(ticket_id, cached[0]):
+        ticket = admission_index.get(ticket_id)
+        if ticket is None:
+            async with get_read_connection() as conn:
+                cursor = await conn.execute(EVENT_ID_SQL, (ticket_id,))
+                ticket = await cursor.fetchone()
+            if ticket is None:
+                raise HTTPException(status_code=404, detail="Ticket not found")
+        token = generate_qr_token(ticket_id, ticket["event_id"])
+        # Renderização é CPU-bound: fora do event loop
+        content = await run_in_threadpool(render_qr_bytes, token, format)
+        cached = (ticket["event_id"], token, make_etag(content), content)
+        qr_image_cache.put((ticket_id, format), cached)
+    
+    _, _, etag, content = cached
+    headers = {"ETag": etag, "Cache-Control": f"private, max-age={QR_IMAGE_MAX_AGE}"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=content, media_type=QR_MEDIA_TYPES[format], headers=headers)
+
+
+@app.put("/ticket/{ticket_id}", response_model=Ticket, dependencies=[API_LIMIT])
+async def reserve_ticket(ticket_id: int, response: Response):
+    """Reserva o lugar no primário; com réplicas devolve X-Read-After-LSN para leituras read-your-writes"""
+    async with get_db_connection() as conn:
+        event_id = await ticket_event_id(conn, ticket_id)
+        updated_ticket = None
+        if event_id is not None:
+            cursor = await conn.execute(RESERVE_SQL, {"id": ticket_id, "event_id": event_id})
+            updated_ticket = await cursor.fetchone()
+        # Na mesma conexão, depois do commit
+        lsn = await current_wal_lsn(conn) if updated_ticket else None
+    
+    if not updated_ticket:
+        raise HTTPException(status_code=404, detail="Ticket not found")
+    
+    # Write-through: o índice só é atualizado depois do commit
+    if updated_ticket["was_admitted"]:
+        admission_index.set_state(ticket_id, True, updated_ticket["admitted_at"])
+    else:
+        change_bus.publish(ADMIT, [updated_ticket])
+    if lsn is not None:
+        response.headers[READ_AFTER_HEADER] = lsn
+    return updated_ticket
+
+
+@app.post("/ticket/{ticket_id}/admit", response_model=AdmissionResult, dependencies=[SCAN_LIMIT])
+async def admit_ticket(ticket_id: int, request: Request):
+    """Admissão atómica: admitted na primeira entrada, already_used (com a hora original) nas seguintes"""
+    result = (await admit_tickets([ticket_id]))[0]
+    log_scan(request, "admit", result["status"], ticket_id=ticket_id)
+    if result["status"] == SCAN_NOT_FOUND:
+        raise HTTPException(status_code=404, detail="Ticket not found")
+    return result
+
 
+@app.post("/tickets/admit", response_model=BatchAdmissionResponse, dependencies=[SCAN_LIMIT])
+async def batch_admit_tickets(batch: BatchAdmissionRequest, request: Request):
+    """Admissão em lote numa só instrução SQL"""
+    results = await admit_tickets(batch.ticket_ids)
+    for result in results:
+        log_scan(request, "batch_admit", result["status"], ticket_id=result["ticket_id"])
+    return {"results": results}
 
-@app.post("/ticket/", response_model=Ticket)
+
+@app.post("/ticket/", response_model=Ticket, dependencies=[API_LIMIT])
 async def create_ticket(ticket: Ticket):
-    conn = get_db_connection()
-    try:
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        cursor.execute(
+    async with get_db_connection() as conn:
+        cursor = await conn.execute(
             "INSERT INTO tickets (event_id, gates_open, gate_id, row_id, seat_id, sector_id, ticket_type, state, seat_node_id) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING *",
             (ticket.event_id, ticket.gates_open, ticket.gate_id, ticket.row_id, ticket.seat_id, ticket.sector_id, ticket.ticket_type, ticket.state, ticket.seat_node_id)
         )
-        new_ticket = cursor.fetchone()
-        conn.commit()
-        cursor.close()
-        
-        return dict(new_ticket)
-    finally:
-        release_db_connection(conn)
+        new_ticket = await cursor.fetchone()
+    
+    change_bus.publish(CREATE, [new_ticket])
+    return new_ticket
+
+@app.post("/tickets/bulk", dependencies=[ADMIN_LIMIT])
+async def bulk_create_tickets(request: Request, format: str = "ndjson", qr_tokens: bool = False):
+    """Importação em massa (CSV com cabeçalho ou NDJSON) lida em streaming e copiada via COPY;
+    devolve os ids atribuídos e, com qr_tokens=true, os tokens dos QR"""
+    if format not in IMPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(IMPORT_FORMATS)}")
+    report = await import_tickets(request.stream(), format, with_qr_tokens=qr_tokens)
+    change_bus.publish(IMPORT)
+    return report
 
-@app.delete("/ticket/{ticket_id}")
+@app.delete("/ticket/{ticket_id}", dependencies=[API_LIMIT])
 async def delete_ticket(ticket_id: int):
-    conn = get_db_connection()
-    try:
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM tickets WHERE id = %s", (ticket_id,))
-        conn.commit()
-        
-        if cursor.rowcount == 0:
-            raise HTTPException(status_code=404, detail="Ticket not found")
-        
-        cursor.close()
-        return {"message": "Ticket deleted"}
-    finally:
-        release_db_connection(conn)
+    async with get_db_connection() as conn:
+        event_id = await ticket_event_id(conn, ticket_id)
+        deleted = None
+        if event_id is not None:
+            cursor = await conn.execute(
+                "DELETE FROM tickets WHERE id = %s AND event_id = %s "
+                "RETURNING id, event_id, sector_id, gate_id, seat_node_id, state",
+                (ticket_id, event_id)
+            )
+            deleted = await cursor.fetchone()
+    
+    if deleted is None:
+        raise HTTPException(status_code=404, detail="Ticket not found")
+    
+    change_bus.publish(DELETE, [deleted])
+    return {"message": "Ticket deleted"}
+
+@app.patch("/tickets/reset", dependencies=[ADMIN_LIMIT])
+async def reset_all_seats(event_id: int = None, sector_id: str = None, gate_id: str = None,
+                          chunk_size: int = RESET_CHUNK_SIZE):
+    """Liberta os lugares (opcionalmente só de um evento/setor/porta) em blocos de chunk_size"""
+    if chunk_size < 1:
+        raise HTTPException(status_code=400, detail="chunk_size must be positive")
+    job = ResetJob({"event_id": event_id, "sector_id": sector_id, "gate_id": gate_id}, chunk_size)
+    affected_rows = await reset_seats(job)
+    return {"message": f"Reset {affected_rows} tickets to unoccupied", "chunks": job.chunks}
+
+@app.post("/tickets/reset-jobs", status_code=202, dependencies=[ADMIN_LIMIT])
+async def create_reset_job(event_id: int = None, sector_id: str = None, gate_id: str = None,
+                           chunk_size: int = RESET_CHUNK_SIZE):
+    """Reset em segundo plano; o progresso é consultado em GET /tickets/reset-jobs/{job_id}"""
+    if chunk_size < 1:
+        raise HTTPException(status_code=400, detail="chunk_size must be positive")
+    job = await start_reset_job({"event_id": event_id, "sector_id": sector_id, "gate_id": gate_id}, chunk_size)
+    return job.as_dict()
+
+@app.get("/tickets/reset-jobs/{job_id}")
+async def get_reset_job(job_id: str):
+    """Progresso do job (tabela reset_jobs: responde qualquer worker)"""
+    job = await fetch_reset_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Reset job not found")
+    return job
+
+@app.delete("/tickets/reset-jobs/{job_id}")
+async def cancel_reset(job_id: str):
+    """Cancela o reset entre blocos; os blocos já confirmados mantêm-se"""
+    status = await cancel_reset_job(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Reset job not found")
+    if status != "running":
+        raise HTTPException(status_code=409, detail=f"Reset job already {status}")
+    return {"message": "Reset job cancelled"}
+
+@app.get("/admissions/stream")
+async def stream_admissions(event_id: int = None):
+    """Server-Sent Events com as mudanças de estado dos lugares, em lotes por janela de tempo"""
+    subscriber = admission_stream.subscribe(event_id)
+    return StreamingResponse(
+        sse_events(subscriber),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/events/{event_id}/seats/lookup", response_model=SeatLookupResponse, dependencies=[API_LIMIT])
+async def lookup_seats(event_id: int, lookup: SeatLookupRequest, request: Request):
+    """Estado dos bilhetes por seat_node_id (lista ou prefixo) numa só consulta indexada"""
+    if lookup.seat_node_ids is not None:
+        sql = "SELECT seat_node_id, id, state FROM tickets WHERE event_id = %s AND seat_node_id = ANY(%s) ORDER BY seat_node_id"
+        params = (event_id, lookup.seat_node_ids)
+    else:
+        prefix = lookup.prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        sql = "SELECT seat_node_id, id, state FROM tickets WHERE event_id = %s AND seat_node_id LIKE %s ORDER BY seat_node_id LIMIT %s"
+        params = (event_id, prefix + "%", SEAT_LOOKUP_MAX_ROWS + 1)
+    async with get_read_connection(read_after_lsn(request)) as conn:
+        async with conn.cursor(row_factory=tuple_row) as cursor:
+            await cursor.execute(sql, params)
+            rows = await cursor.fetchall()
+    
+    response = {"event_id": event_id, "rows": rows}
+    if lookup.seat_node_ids is not None:
+        found = {row[0] for row in rows}
+        response["missing"] = [seat for seat in dict.fromkeys(lookup.seat_node_ids) if seat not in found]
+    elif len(rows) > SEAT_LOOKUP_MAX_ROWS:
+        response["rows"] = rows[:SEAT_LOOKUP_MAX_ROWS]
+        response["truncated"] = True
+    return response
 
-@app.patch("/tickets/reset")
-async def reset_all_seats():
-    conn = get_db_connection()
+@app.get("/events/{event_id}/occupancy", dependencies=[API_LIMIT])
+async def get_event_occupancy(event_id: int):
+    """Admitidos vs total por setor e porta, servido dos contadores em memória"""
+    event_occupancy = await occupancy.get(event_id)
+    if not event_occupancy.cells:
+        occupancy.invalidate(event_id)
+        raise HTTPException(status_code=404, detail="Event has no tickets")
+    return event_occupancy.summary()
+
+def check_bundle_scope(event_id: int, gate_id: str | None):
+    if not 0 <= event_id <= MAX_BUNDLE_EVENT_ID:
+        raise HTTPException(status_code=400, detail="Offline bundles need an event_id that fits a v2 token")
+    if gate_id and len(gate_id.encode()) > 255:
+        raise HTTPException(status_code=400, detail="gate_id too long")
+
+def bundle_response(bundle: bytes, cursor: int) -> Response:
+    return Response(bundle, media_type="application/octet-stream",
+                    headers={"X-Bundle-Cursor": str(cursor), "Cache-Control": "no-store"})
+
+@app.get("/events/{event_id}/gate-bundle", dependencies=[ADMIN_LIMIT])
+async def get_gate_bundle(event_id: int, gate_id: str = None):
+    """Snapshot assinado para validação offline nas portas (evento inteiro ou uma porta)"""
+    check_bundle_scope(event_id, gate_id)
+    cursor, tickets = await build_snapshot(event_id, gate_id)
+    if not tickets:
+        raise HTTPException(status_code=404, detail="No tickets for this event/gate")
+    # Um HMAC e um SHA-256 por bilhete e chave: fora do event loop
+    bundle = await run_in_threadpool(encode_bundle, SNAPSHOT_MAGIC, event_id, gate_id, 0, cursor, tickets)
+    return bundle_response(bundle, cursor)
+
+@app.get("/events/{event_id}/gate-bundle/changes", dependencies=[API_LIMIT])
+async def get_gate_bundle_changes(event_id: int, since: int, gate_id: str = None):
+    """Delta assinado desde o cursor since (X-Bundle-Cursor do snapshot ou do delta anterior)"""
+    check_bundle_scope(event_id, gate_id)
+    if not 0 <= since < 2 ** 64:
+        raise HTTPException(status_code=400, detail="since must be a bundle cursor")
     try:
-        cursor = conn.cursor()
-        cursor.execute("UPDATE tickets SET state = false")
-        conn.commit()
-        affected_rows = cursor.rowcount
-        cursor.close()
-        
-        return {"message": f"Reset {affected_rows} tickets to unoccupied"}
-    finally:
-        release_db_connection(conn)
+        cursor, tickets, removed = await build_changes(event_id, since, gate_id)
+    except ExpiredCursor:
+        raise HTTPException(status_code=410, detail="Bundle cursor expired, fetch a new snapshot")
+    bundle = await run_in_threadpool(encode_bundle, DELTA_MAGIC, event_id, gate_id, since, cursor, tickets, removed)
+    return bundle_response(bundle, cursor)
+
+@app.post("/events/{event_id}/admission-index", dependencies=[ADMIN_LIMIT])
+async def load_admission_index(event_id: int):
+    """Pré-carrega os bilhetes do evento no índice de admissão em memória"""
+    event_index = await admission_index.load_event(event_id)
+    return {"event_id": event_id, "tickets": len(event_index)}
+
+@app.delete("/events/{event_id}/admission-index")
+async def unload_admission_index(event_id: int):
+    if not admission_index.unload_event(event_id):
+        raise HTTPException(status_code=404, detail="Event not loaded")
+    return {"message": "Admission index unloaded"}
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+Teste de carga dos caminhos de scan e admissão contra uma API em execução
+Uso: python benchmarks/load_test.py [--url URL] [--tickets N] [--duration S] [--peak RPS]
+                                    [--curve gate_open|ramp|steady] [--mix scan=80,reserve=10,...]
+                                    [--prewarm] [--keep] [--seed N] [--output FICHEIRO] [--compare FICHEIRO]
+
+1. Cria um evento sintético na base de dados configurada (DB_*) com N
+   bilhetes distribuídos por setores, anéis, filas e portas, no formato de
+   db/dml.sql (seat_node_id "Seat-<setor>-T<anel>-R<fila>-<lugar>").
+2. Gera a curva de chegadas (processo de Poisson com taxa variável ao longo
+   do teste, entre 0 e --peak pedidos/s) e a mistura de pedidos, de forma
+   determinística a partir de --seed.
+3. Reproduz as chegadas em malha aberta com um cliente httpx assíncrono: os
+   pedidos são enviados à hora marcada, esteja o servidor lento ou não, e a
+   latência conta a partir dessa hora (o tempo em fila no cliente também
+   conta, para não esconder a cauda).
+4. Mostra RPS e p50/p95/p99/máximo por tipo de pedido, guarda o resultado em
+   JSON (benchmarks/results/<data>-<commit>.json por omissão) e, com
+   --compare, a variação em relação a um resultado anterior.
+5. Remove o evento e os bilhetes no fim (exceto com --keep).
+
+A API tem de usar o mesmo QR_SECRET/QR_KEYS que este script, e o limite de
+scans por cliente (SCAN_RATE_LIMIT/SCAN_RATE_BURST) deve ser aumentado, senão
+todos os pedidos vindos desta máquina acabam em 429.
+"""
+import argparse
+import asyncio
+import bisect
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+from collections import Counter
+from datetime import datetime, timedelta
+import httpx
+import psycopg
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from database import get_conninfo
+from qr_tokens import generate_qr_token
+
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+# Curvas de chegada: (fração do teste, fração do pico), interpoladas linearmente.
+# gate_open: fila à porta na abertura, acalmia e nova onda antes do apito inicial
+CURVES = {
+    "gate_open": [(0, 0.1), (0.05, 1.0), (0.2, 0.5), (0.6, 0.7), (0.85, 1.0), (1, 0.3)],
+    "ramp": [(0, 0.05), (1, 1.0)],
+    "steady": [(0, 1.0), (1, 1.0)],
+}
+
+DEFAULT_MIX = "scan=80,reserve=10,batch_scan=5,batch_admit=5"
+BATCH_SIZE = 50
+PERCENTILES = (50, 95, 99)
+
+SECTORS = ("Norte", "Sul", "Este", "Oeste")
+TIERS = 3
+SEATS_PER_ROW = 50
+
+# Dois portões por setor; o lugar é único por (setor, anel, fila, lugar)
+SEED_SQL = """
+INSERT INTO tickets (event_id, gates_open, gate_id, row_id, seat_id, sector_id, ticket_type, state, seat_node_id)
+SELECT %(event_id)s, %(gates_open)s,
+       'Gate ' || chr(65 + p.sector * 2 + p.tier %% 2),
+       'Row ' || p.row_number, 'Seat ' || p.seat_number,
+       (%(sectors)s::text[])[p.sector + 1],
+       CASE WHEN s %% 20 = 0 THEN 'VIP' ELSE 'Standard' END,
+       false,
+       'Seat-' || (%(sectors)s::text[])[p.sector + 1] || '-T' || p.tier
+           || '-R' || lpad(p.row_number::text, greatest(2, length(p.row_number::text)), '0')
+           || '-' || lpad(p.seat_number::text, 2, '0')
+FROM generate_series(0, %(tickets)s - 1) s,
+     LATERAL (SELECT s %% %(sector_count)s AS sector,
+                     (s / %(sector_count)s) %% %(tiers)s AS tier,
+                     (s / (%(sector_count)s * %(tiers)s)) / %(seats)s + 1 AS row_number,
+                     (s / (%(sector_count)s * %(tiers)s)) %% %(seats)s + 1 AS seat_number) p
+"""
+
+
+def seed_stadium(conn, tickets: int) -> tuple[int, list[int]]:
+    """Cria o evento e os bilhetes; devolve (event_id, ids dos bilhetes)"""
+    event_date = datetime.now().replace(microsecond=0) + timedelta(hours=2)
+    event_id = conn.execute(
+        "INSERT INTO events (event_name, event_date) VALUES (%s, %s) RETURNING id",
+        (f"Teste de carga {event_date:%Y-%m-%d %H:%M}", event_date)
+    ).fetchone()[0]
+    conn.execute(SEED_SQL, {"event_id": event_id, "gates_open": event_date - timedelta(hours=1),
+                            "tickets": tickets, "sectors": list(SECTORS), "sector_count": len(SECTORS), "tiers": TIERS, "seats": SEATS_PER_ROW})
+    conn.execute("ANALYZE tickets")
+    ids = [row[0] for row in conn.execute("SELECT id FROM tickets WHERE event_id = %s ORDER BY id", (event_id,))]
+    return event_id, ids
+
+def drop_stadium(conn, event_id: int):
+    conn.execute("DELETE FROM tickets WHERE event_id = %s", (event_id,))
+    conn.execute(f"DROP TABLE IF EXISTS tickets_event_{int(event_id)}")
+    conn.execute("DELETE FROM events WHERE id = %s", (event_id,))
+
+
+def parse_mix(spec: str) -> dict[str, float]:
+    mix = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        kind, _, weight = item.partition("=")
+        if kind not in REQUESTS or not weight:
+            raise ValueError(f"Invalid mix entry: {item!r} (types: {', '.join(REQUESTS)})")
+        mix[kind] = float(weight)
+    return mix
+
+def curve_rate(points: list[tuple[float, float]], fraction: float) -> float:
+    index = bisect.bisect_right([x for x, _ in points], fraction)
+    if index >= len(points):
+        return points[-1][1]
+    (x0, y0), (x1, y1) = points[index - 1], points[index]
+    return y0 + (y1 - y0) * (fraction - x0) / (x1 - x0)
+
+def build_schedule(curve: str, duration: float, peak: float, mix: dict[str, float],
+                   rng: random.Random) -> list[tuple[float, str]]:
+    """Instantes de envio (segundos desde o início) e tipo de cada pedido"""
+    points = CURVES[curve]
+    kinds, weights = list(mix), list(mix.values())
+    schedule = []
+    offset = 0.0
+    while True:
+        rate = max(peak * curve_rate(points, offset / duration), 0.1)
+        offset += rng.expovariate(rate)
+        if offset >= duration:
+            return schedule
+        schedule.append((offset, rng.choices(kinds, weights)[0]))
+
+
+# Cada tipo de pedido: (método, path, corpo) a partir do gerador e dos bilhetes semeados
+def scan_request(rng, ids, tokens):
+    return "GET", f"/ticket/scan/{tokens[rng.randrange(len(ids))]}", None
+
+def reserve_request(rng, ids, tokens):
+    return "PUT", f"/ticket/{rng.choice(ids)}", None
+
+def batch_scan_request(rng, ids, tokens):
+    return "POST", "/tickets/scan", {"tokens": rng.sample(tokens, min(BATCH_SIZE, len(tokens)))}
+
+def batch_admit_request(rng, ids, tokens):
+    return "POST", "/tickets/admit", {"ticket_ids": rng.sample(ids, min(BATCH_SIZE, len(ids)))}
+
+REQUESTS = {
+    "scan": scan_request,
+    "reserve": reserve_request,
+    "batch_scan": batch_scan_request,
+    "batch_admit": batch_admit_request,
+}
+
+
+async def replay(url: str, schedule: list[tuple[float, str]], ids: list[int], tokens: list[str],
+                 rng: random.Random, max_connections: int) -> tuple[dict, float]:
+    """Envia os pedidos à hora marcada; devolve {tipo: [(latência, status), ...]} e a duração real"""
+    results = {kind: [] for kind in REQUESTS}
+    limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+    requests = [(offset, kind, *REQUESTS[kind](rng, ids, tokens)) for offset, kind in schedule]
+
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30) as client:
+        loop = asyncio.get_running_loop()
+
+        async def fire(scheduled: float, kind: str, method: str, path: str, body):
+            try:
+                response = await client.request(method, path, json=body)
+                status = response.status_code
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            results[kind].append((loop.time() - scheduled, status))
+
+        start = loop.time()
+        tasks = []
+        for offset, kind, method, path, body in requests:
+            delay = start + offset - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(fire(start + offset, kind, method, path, body)))
+        await asyncio.gather(*tasks)
+        return results, loop.time() - start
+
+
+def percentile(ordered: list[float], p: float) -> float:
+    """Percentil pelo método nearest-rank"""
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+def is_ok(status: str) -> bool:
+    return status.startswith("2") or status == "304"
+
+def summarize(samples: list[tuple[float, object]], elapsed: float) -> dict:
+    latencies = sorted(latency * 1000 for latency, _ in samples)
+    statuses = Counter(str(status) for _, status in samples)
+    summary = {
+        "requests": len(samples),
+        "ok": sum(count for status, count in statuses.items() if is_ok(status)),
+        "statuses": dict(statuses),
+        "rps": len(samples) / elapsed if elapsed else 0,
+    }
+    if latencies:
+        summary.update({f"p{p}_ms": percentile(latencies, p) for p in PERCENTILES})
+        summary["max_ms"] = latencies[-1]
+    return summary
+
+def git_revision() -> str:
+    try:
+        revision = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                  capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                               capture_output=True, text=True).stdout.strip()
+        return revision + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def print_report(report: dict, baseline: dict | None = None):
+    print("=" * 100)
+    print(f"{'pedido':<14}{'total':>8}{'ok':>8}{'RPS':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'máx ms':>10}"
+          f"   outros status")
+    print("=" * 100)
+    for kind, summary in report["summary"].items():
+        if not summary["requests"]:
+            continue
+        others = {status: count for status, count in summary["statuses"].items() if not is_ok(status)}
+        print(f"{kind:<14}{summary['requests']:>8}{summary['ok']:>8}{summary['rps']:>9.1f}"
+              f"{summary['p50_ms']:>10.2f}{summary['p95_ms']:>10.2f}{summary['p99_ms']:>10.2f}"
+              f"{summary['max_ms']:>10.2f}   {others or ''}")
+        previous = (baseline or {}).get("summary", {}).get(kind)
+        if previous and previous.get("requests"):
+            deltas = "".join(
+                f"{(summary[key] / previous[key] - 1) * 100 if previous[key] else 0:>+9.1f}%"
+                for key in ("p50_ms", "p95_ms", "p99_ms", "max_ms")
+            )
+            print(f"{'  vs ' + baseline['revision']:<39}{deltas}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de carga dos caminhos de scan e admissão")
+    parser.add_argument("--url", default=os.getenv("LOAD_TEST_URL", "http://localhost:8000"))
+    parser.add_argument("--tickets", type=int, default=50000)
+    parser.add_argument("--duration", type=float, default=60, help="segundos")
+    parser.add_argument("--peak", type=float, default=500, help="pedidos/s no pico da curva")
+    parser.add_argument("--curve", choices=CURVES, default="gate_open")
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument("--connections", type=int, default=200)
+    parser.add_argument("--prewarm", action="store_true", help="carrega o evento no índice de admissão antes")
+    parser.add_argument("--keep", action="store_true", help="não remove o evento no fim")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output")
+    parser.add_argument("--compare", help="resultado anterior (JSON) para comparar")
+    args = parser.parse_args()
+
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+    rng = random.Random(args.seed)
+    schedule = build_schedule(args.curve, args.duration, args.peak, mix, rng)
+
+    print(f"\n🏟️  A criar evento com {args.tickets} bilhetes...")
+    with psycopg.connect(get_conninfo(), autocommit=True) as conn:
+        event_id, ids = seed_stadium(conn, args.tickets)
+        try:
+            tokens = [generate_qr_token(ticket_id, event_id) for ticket_id in ids]
+            if args.prewarm:
+                httpx.post(f"{args.url}/events/{event_id}/admission-index", timeout=60).raise_for_status()
+            print(f"🚀 {len(schedule)} pedidos em {args.duration:.0f}s (curva {args.curve}, pico {args.peak:.0f}/s) "
+                  f"contra {args.url}, evento {event_id}")
+            started_at = datetime.now()
+            results, elapsed = asyncio.run(replay(args.url, schedule, ids, tokens, rng, args.connections))
+        finally:
+            if not args.keep:
+                drop_stadium(conn, event_id)
+
+    all_samples = [sample for samples in results.values() for sample in samples]
+    report = {
+        "revision": git_revision(),
+        "started_at": started_at.isoformat(timespec="seconds"),
+        "params": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "elapsed_s": elapsed,
+        "summary": {**{kind: summarize(samples, elapsed) for kind, samples in results.items()},
+                    "total": summarize(all_samples, elapsed)},
+    }
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{started_at:%Y%m%d-%H%M%S}-{report['revision']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n💾 Resultado guardado em {output}")
+
+    if report["summary"]["total"]["ok"] < report["summary"]["total"]["requests"]:
+        print("⚠️  Houve pedidos sem resposta 2xx (ver 'outros status')")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Compara planos e latências das queries por evento/lugar antes e depois das migrações
+Uso: python benchmarks/query_plans.py [eventos] [bilhetes_por_evento] [--plans]
+
+Cria dois schemas temporários na base de dados configurada (DB_*):
+bench_before só com db/ddl.sql e bench_after com ddl.sql + migrations/,
+carrega os mesmos dados sintéticos em ambos e mede cada query com
+EXPLAIN ANALYZE. Os schemas são removidos no fim.
+"""
+import os
+import re
+import statistics
+import sys
+import psycopg
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from database import get_conninfo
+from migrate import discover_migrations
+
+RUNS = 20
+
+QUERIES = {
+    # Com a chave (id, event_id) percorre todas as partições: a API usa event_id de ticket_ids
+    "bilhete por id": "SELECT * FROM tickets WHERE id = %(ticket_id)s",
+    # Token v2 traz o event_id: o pruning reduz o lookup a uma partição
+    "bilhete por id+evento": "SELECT * FROM tickets WHERE id = %(ticket_id)s AND event_id = %(event_id)s",
+    "bilhetes do evento": "SELECT count(*) FROM tickets WHERE event_id = %(event_id)s",
+    "ocupação por setor": (
+        "SELECT sector_id, count(*) FILTER (WHERE state) FROM tickets "
+        "WHERE event_id = %(event_id)s GROUP BY sector_id"
+    ),
+    "lugar do Map-Service": "SELECT * FROM tickets WHERE seat_node_id = %(seat_node_id)s",
+    "porta do evento": "SELECT count(*) FROM tickets WHERE event_id = %(event_id)s AND gate_id = %(gate_id)s",
+}
+
+# Só existem depois das migrações (0009: índice global id -> event_id)
+AFTER_QUERIES = {
+    "event_id do bilhete": "SELECT event_id FROM ticket_ids WHERE id = %(ticket_id)s",
+}
+
+SEED_SQL = ["""
+INSERT INTO events (event_name, event_date)
+SELECT 'Jogo ' || e, timestamp '2024-08-01 20:00' + e * interval '7 days'
+FROM generate_series(1, %(events)s) e
+""", """
+INSERT INTO tickets (event_id, gates_open, gate_id, row_id, seat_id, sector_id, ticket_type, state, seat_node_id)
+SELECT e.id,
+       e.event_date - interval '1 hour',
+       'Gate ' || chr(65 + s %% 8),
+       'Row ' || (s / 100),
+       'Seat ' || (s %% 100),
+       (ARRAY['Norte', 'Sul', 'Este', 'Oeste'])[1 + s %% 4],
+       'Standard',
+       random() < 0.5,
+       'Seat-E' || e.id || '-R' || (s / 100) || '-' || (s %% 100)
+FROM events e, generate_series(1, %(tickets)s) s
+""", "ANALYZE"]
+
+def read(path: str) -> str:
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+def setup_schema(conn, schema: str, migrated: bool, events: int, tickets: int):
+    conn.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+    conn.execute(f"CREATE SCHEMA {schema}")
+    conn.execute(f"SET search_path TO {schema}")
+    conn.execute(read(os.path.join(ROOT, "db", "ddl.sql")))
+    if migrated:
+        for _, _, path in discover_migrations():
+            conn.execute(read(path))
+    for statement in SEED_SQL:
+        conn.execute(statement, {"events": events, "tickets": tickets})
+
+def measure(conn, schema: str, queries: dict, params: dict, show_plans: bool) -> dict:
+    conn.execute(f"SET search_path TO {schema}")
+    results = {}
+    for name, sql in queries.items():
+        timings = []
+        for _ in range(RUNS):
+            plan = conn.execute(f"EXPLAIN (ANALYZE, FORMAT JSON) {sql}", params).fetchone()[0][0]
+            timings.append(plan["Execution Time"])
+        results[name] = (statistics.median(timings), plan["Plan"])
+        if show_plans:
+            text = conn.execute(f"EXPLAIN {sql}", params).fetchall()
+            print(f"\n[{schema}] {name}")
+            for (line,) in text:
+                print(f"    {line}")
+    return results
+
+def summarize(node: dict) -> str:
+    """Resumo do plano: tipos de nó distintos, do topo para as folhas"""
+    kinds = []
+    stack = [node]
+    while stack:
+        current = stack.pop(0)
+        kind = current["Node Type"]
+        if "Index Name" in current:
+            # Agrupar o mesmo índice de partições diferentes
+            kind += f" ({re.sub(r'_event_[0-9]+_', '_event_*_', current['Index Name'])})"
+        if kind not in kinds:
+            kinds.append(kind)
+        stack.extend(current.get("Plans", []))
+    return " > ".join(kinds)
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    show_plans = "--plans" in sys.argv
+    events = int(args[0]) if args else 20
+    tickets = int(args[1]) if len(args) > 1 else 20000
+
+    print(f"\n📊 A preparar {events} eventos x {tickets} bilhetes em bench_before e bench_after...")
+    with psycopg.connect(get_conninfo(), autocommit=True) as conn:
+        try:
+            setup_schema(conn, "bench_before", False, events, tickets)
+            setup_schema(conn, "bench_after", True, events, tickets)
+            event_id = events // 2 or 1
+            ticket_id = conn.execute(
+                "SELECT min(id) + %s FROM bench_before.tickets WHERE event_id = %s", (tickets // 2, event_id)
+            ).fetchone()[0]
+            params = {"ticket_id": ticket_id, "event_id": event_id,
+                      "seat_node_id": f"Seat-E{event_id}-R10-10", "gate_id": "Gate C"}
+            before = measure(conn, "bench_before", QUERIES, params, show_plans)
+            after = measure(conn, "bench_after", {**QUERIES, **AFTER_QUERIES}, params, show_plans)
+        finally:
+            conn.execute("DROP SCHEMA IF EXISTS bench_before CASCADE")
+            conn.execute("DROP SCHEMA IF EXISTS bench_after CASCADE")
+
+    print("=" * 100)
+    print(f"{'query':<24}{'antes (ms)':>12}{'depois (ms)':>13}{'ganho':>9}   plano depois")
+    print("=" * 100)
+    for name in QUERIES:
+        before_ms, _ = before[name]
+        after_ms, plan = after[name]
+        print(f"{name:<24}{before_ms:>12.3f}{after_ms:>13.3f}{before_ms / after_ms:>8.1f}x   {summarize(plan)}")
+        print(f"{'':<58}antes: {summarize(before[name][1])}")
+    for name in AFTER_QUERIES:
+        after_ms, plan = after[name]
+        print(f"{name:<24}{'-':>12}{after_ms:>13.3f}{'':>9}   {summarize(plan)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark da serialização da resposta do scan (GET /ticket/scan/{qr})
+Uso: python benchmarks/serialization.py [iterações]
+
+Mede o CPU por pedido (time.process_time) dos dois caminhos, a partir da
+mesma linha devolvida pelo Postgres (sem rede nem base de dados):
+
+- antes: linha como dict (dict_row) -> validação do response_model=Ticket
+  pelo FastAPI (serialize_response) -> JSONResponse (json.dumps)
+- depois: tupla -> TicketRecord com slots -> ORJSONResponse
+"""
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import datetime
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from models import Ticket, TicketRecord, TICKET_COLUMNS
+
+ROUNDS = 5
+
+ROW = (
+    123456, 7, datetime(2024, 9, 15, 19, 0), "Gate A", "Row 5", "Seat 12", "Norte", "Standard",
+    True, "Seat-Norte-T0-R05-12", datetime(2024, 9, 15, 19, 42, 7, 123456), 3, datetime(2024, 9, 15, 19, 42, 7),
+)
+
+
+async def before(iterations: int) -> bytes:
+    field = create_response_field("response", Ticket)
+    for _ in range(iterations):
+        row = dict(zip(TICKET_COLUMNS, ROW))
+        content = await serialize_response(field=field, response_content=row)
+        body = JSONResponse(content).body
+    return body
+
+async def after(iterations: int) -> bytes:
+    for _ in range(iterations):
+        body = ORJSONResponse(TicketRecord(*ROW)).body
+    return body
+
+def measure(path, iterations: int) -> tuple[float, bytes]:
+    """Mediana de CPU por pedido (µs) em ROUNDS rondas"""
+    samples = []
+    for _ in range(ROUNDS):
+        start = time.process_time()
+        body = asyncio.run(path(iterations))
+        samples.append((time.process_time() - start) / iterations * 1e6)
+    return statistics.median(samples), body
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    before_us, before_body = measure(before, iterations)
+    after_us, after_body = measure(after, iterations)
+
+    print("=" * 60)
+    print(f"{'caminho':<36}{'CPU/pedido (µs)':>18}")
+    print("=" * 60)
+    print(f"{'dict -> response_model -> json':<36}{before_us:>18.2f}")
+    print(f"{'tupla -> TicketRecord -> orjson':<36}{after_us:>18.2f}")
+    print(f"\nGanho: {before_us / after_us:.1f}x")
+    # Os dois caminhos têm de produzir o mesmo JSON
+    if json.loads(before_body) != json.loads(after_body):
+        print("❌ Respostas diferentes entre os dois caminhos")
+        sys.exit(1)
+    print("✅ Respostas equivalentes")
+
+if __name__ == "__main__":
+    main()
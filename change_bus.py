@@ -0,0 +1,266 @@
+"""
+Coerência do estado em memória entre workers (Postgres LISTEN/NOTIFY)
+
+Cada worker guarda estado derivado da tabela tickets: o índice de admissão,
+a cache negativa de bilhetes inexistentes, os contadores de ocupação, as
+imagens QR e os subscritores do stream de admissões. Depois do commit de
+uma escrita, publish() aplica a mudança localmente e acumula-a para os
+outros workers; a cada CHANGE_BUS_WINDOW_MS as mudanças pendentes são
+enviadas com pg_notify no canal CHANGE_BUS_CHANNEL, em mensagens abaixo do
+limite de 8000 bytes do NOTIFY. Cada worker tem uma conexão dedicada em
+LISTEN e aplica as mudanças dos outros (as suas próprias são ignoradas
+pela origem).
+
+O NOTIFY não vai na transação da escrita: notificar dentro de cada
+transação serializa os commits de todas as admissões num lock global do
+Postgres. Se uma mensagem se perder (worker a terminar, listener
+desligado) o pior caso é estado em memória desatualizado, nunca uma dupla
+entrada: a admissão é sempre decidida pelo UPDATE condicional. Quando o
+listener volta a ligar, os handlers de RESYNC descartam ou recarregam o
+estado em memória, porque não se sabe o que foi perdido entretanto.
+"""
+import asyncio
+import inspect
+import json
+import os
+import socket
+from collections import defaultdict
+from datetime import datetime
+from typing import Callable
+import psycopg
+from psycopg import sql
+from admission_index import admission_index
+from admission_stream import admission_stream
+from database import get_conninfo, get_db_connection
+from occupancy import occupancy
+from scan_guard import missing_tickets
+
+CHANGE_BUS_ENABLED = os.getenv("CHANGE_BUS_ENABLED", "true").lower() == "true"
+CHANGE_BUS_CHANNEL = os.getenv("CHANGE_BUS_CHANNEL", "ticket_changes")
+# Janela de agrupamento das mudanças num só pg_notify
+CHANGE_BUS_WINDOW_MS = int(os.getenv("CHANGE_BUS_WINDOW_MS", "10"))
+# Espera antes de voltar a ligar o listener depois de um erro
+CHANGE_BUS_RECONNECT_SECONDS = float(os.getenv("CHANGE_BUS_RECONNECT_SECONDS", "1"))
+
+# Limite do payload do NOTIFY (8000 bytes) com margem para o envelope
+MAX_PAYLOAD_BYTES = 7800
+
+# Tipos de mudança
+ADMIT = "admit"      # bilhetes que passaram a ocupados (admissão ou reserva)
+RESET = "reset"      # bilhetes libertados
+CREATE = "create"
+DELETE = "delete"
+IMPORT = "import"    # importação em massa: sem linhas, invalida por inteiro
+RESYNC = "resync"    # local: o listener (re)ligou e podem ter-se perdido mensagens
+
+# Campos de cada linha enviada, por esta ordem
+CHANGE_FIELDS = ("id", "event_id", "sector_id", "gate_id", "seat_node_id", "state", "admitted_at")
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def encode_row(row: dict) -> list:
+    values = [row.get(field) for field in CHANGE_FIELDS]
+    if isinstance(values[-1], datetime):
+        values[-1] = values[-1].isoformat()
+    return values
+
+def decode_row(values: list) -> dict:
+    row = dict(zip(CHANGE_FIELDS, values))
+    if row["admitted_at"] is not None:
+        row["admitted_at"] = datetime.fromisoformat(row["admitted_at"])
+    return row
+
+def build_payloads(origin: str, changes: list[list], max_bytes: int = MAX_PAYLOAD_BYTES) -> list[str]:
+    """Divide as mudanças ([tipo, *valores]) em payloads JSON abaixo de max_bytes"""
+    payloads = []
+    envelope = len(json.dumps({"o": origin, "c": []}))
+    encoded = []
+    size = envelope
+    for change in changes:
+        item = json.dumps(change, separators=(",", ":"))
+        if encoded and size + len(item.encode()) + 1 > max_bytes:
+            payloads.append(f'{{"o":{json.dumps(origin)},"c":[{",".join(encoded)}]}}')
+            encoded = []
+            size = envelope
+        encoded.append(item)
+        size += len(item.encode()) + 1
+    if encoded:
+        payloads.append(f'{{"o":{json.dumps(origin)},"c":[{",".join(encoded)}]}}')
+    return payloads
+
+
+class ChangeBus:
+    """Aplica mudanças localmente e propaga-as aos outros workers"""
+
+    def __init__(self, channel: str = CHANGE_BUS_CHANNEL, enabled: bool = CHANGE_BUS_ENABLED,
+                 window_ms: int = CHANGE_BUS_WINDOW_MS, origin: str = WORKER_ID):
+        self.channel = channel
+        self.enabled = enabled
+        self.window = window_ms / 1000
+        self.origin = origin
+        self.handlers: dict[str, list[Callable]] = defaultdict(list)
+        self._pending: list[list] = []
+        self._flush_handle: asyncio.TimerHandle | None = None
+        self._flush_task: asyncio.Task | None = None
+        self.connected = False
+        self.sent = 0
+        self.received = 0
+        self.failed_sends = 0
+        self.resyncs = 0
+
+    def register(self, change: str, handler: Callable):
+        """handler(row) para mudanças de bilhetes; handler() para IMPORT e RESYNC (pode ser async)"""
+        self.handlers[change].append(handler)
+
+    def apply(self, change: str, rows: list[dict] | None = None):
+        handlers = self.handlers[change]
+        if rows is None:
+            for handler in handlers:
+                handler()
+            return
+        for row in rows:
+            for handler in handlers:
+                handler(row)
+
+    def publish(self, change: str, rows: list[dict] | None = None):
+        """Depois do commit: aplica a mudança neste worker e agenda o envio aos restantes.
+        rows=None para mudanças sem linhas (IMPORT)"""
+        if rows is not None and not rows:
+            return
+        self.apply(change, rows)
+        if not self.enabled:
+            return
+        if rows is None:
+            self._pending.append([change])
+        else:
+            self._pending.extend([change, *encode_row(row)] for row in rows)
+        if self._flush_handle is None and self._flush_task is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.window, self._start_flush)
+
+    def _start_flush(self):
+        self._flush_handle = None
+        self._flush_task = asyncio.get_running_loop().create_task(self._flush_in_background())
+
+    async def _flush_in_background(self):
+        try:
+            # Mudanças publicadas durante o envio seguem na volta seguinte
+            while self._pending:
+                await self.flush()
+        except Exception as e:
+            print(f"Erro ao propagar mudanças aos outros workers: {e}")
+        finally:
+            self._flush_task = None
+
+    async def flush(self) -> int:
+        """Envia as mudanças pendentes numa só instrução; devolve o número de mensagens"""
+        changes, self._pending = self._pending, []
+        payloads = build_payloads(self.origin, changes)
+        if not payloads:
+            return 0
+        try:
+            async with get_db_connection() as conn:
+                await conn.execute("SELECT pg_notify(%s, payload) FROM unnest(%s::text[]) AS payload",
+                                   (self.channel, payloads))
+        except Exception:
+            # Sem retry: os outros workers recuperam pela reconciliação/TTL ou no próximo resync
+            self.failed_sends += 1
+            raise
+        self.sent += len(payloads)
+        return len(payloads)
+
+    def receive(self, payload: str):
+        """Aplica uma mensagem de outro worker"""
+        message = json.loads(payload)
+        if message.get("o") == self.origin:
+            return
+        self.received += 1
+        for change, *values in message["c"]:
+            self.apply(change, [decode_row(values)] if values else None)
+
+    async def resync(self):
+        self.resyncs += 1
+        for handler in self.handlers[RESYNC]:
+            result = handler()
+            if inspect.isawaitable(result):
+                await result
+
+    async def close(self):
+        """Envia o que estiver pendente (chamado no shutdown, antes de fechar o pool)"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._flush_task is not None:
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+        if self._pending:
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Erro ao propagar mudanças no shutdown: {e}")
+
+    def stats(self) -> dict:
+        return {"enabled": self.enabled, "worker": self.origin, "connected": self.connected,
+                "pending": len(self._pending), "sent": self.sent, "received": self.received,
+                "failed_sends": self.failed_sends, "resyncs": self.resyncs}
+
+
+change_bus = ChangeBus()
+
+async def listen_loop(bus: ChangeBus = change_bus):
+    """Tarefa de fundo: LISTEN numa conexão dedicada (fora do pool), com reconexão"""
+    while True:
+        try:
+            async with await psycopg.AsyncConnection.connect(get_conninfo(), autocommit=True) as conn:
+                await conn.execute(sql.SQL("LISTEN {}").format(sql.Identifier(bus.channel)))
+                bus.connected = True
+                await bus.resync()
+                async for notify in conn.notifies():
+                    try:
+                        bus.receive(notify.payload)
+                    except Exception as e:
+                        print(f"Mensagem inválida no canal {bus.channel}: {e}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Listener de mudanças desligado: {e}")
+        finally:
+            bus.connected = False
+        await asyncio.sleep(CHANGE_BUS_RECONNECT_SECONDS)
+
+
+# Estado de cada worker mantido pelas mudanças (as imagens QR registam-se no api_handler)
+def _admitted(row: dict):
+    admission_index.set_state(row["id"], True, row["admitted_at"])
+    occupancy.apply(row, admitted=1)
+    admission_stream.publish(row, True)
+
+def _reset(row: dict):
+    admission_index.set_state(row["id"], False)
+    occupancy.apply(row, admitted=-1)
+    admission_stream.publish(row, False)
+
+def _created(row: dict):
+    missing_tickets.discard(row["id"])
+    occupancy.apply(row, total=1, admitted=int(row["state"]))
+
+def _deleted(row: dict):
+    admission_index.discard(row["id"])
+    occupancy.apply(row, total=-1, admitted=-int(row["state"]))
+
+def _imported():
+    # Os ids novos podem ter sido pedidos antes e estar na cache negativa
+    missing_tickets.clear()
+    occupancy.invalidate()
+
+async def _resynced():
+    missing_tickets.clear()
+    occupancy.invalidate()
+    for event_id in list(admission_index.events):
+        await admission_index.load_event(event_id)
+
+change_bus.register(ADMIT, _admitted)
+change_bus.register(RESET, _reset)
+change_bus.register(CREATE, _created)
+change_bus.register(DELETE, _deleted)
+change_bus.register(IMPORT, _imported)
+change_bus.register(RESYNC, _resynced)
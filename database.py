@@ -0,0 +1,215 @@
+"""
+Camada de acesso à base de dados (psycopg 3, pool assíncrono)
+
+As escritas usam sempre o primário (DB_HOST). Com DB_REPLICA_HOSTS
+definido, as leituras que aceitam dados ligeiramente atrasados usam
+get_read_connection, distribuída em round-robin pelas réplicas. Uma réplica
+indisponível ou atrasada em relação a min_lsn (read-your-writes) faz a
+leitura cair no primário. Uma réplica que falha é saltada durante
+DB_REPLICA_RETRY_SECONDS, para que uma réplica em baixo não custe
+DB_REPLICA_TIMEOUT a cada leitura que lhe calha; passado esse tempo, um
+só pedido volta a experimentá-la.
+
+Cada worker (API_WORKERS, exportado pelo startup.sh) tem os seus pools. Por
+omissão DB_POOL_MAX_SIZE reparte DB_MAX_CONNECTIONS pelos workers (menos a
+conexão de LISTEN de cada um), para que o total fique abaixo do
+max_connections do Postgres seja qual for o número de workers.
+"""
+import itertools
+import os
+import re
+import time
+from contextlib import asynccontextmanager
+from psycopg import AsyncCursor, OperationalError
+from psycopg.conninfo import make_conninfo
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool, PoolTimeout
+from dotenv import load_dotenv
+from metrics import db_pool_acquire_duration, db_query_duration
+
+load_dotenv()
+
+# Processos uvicorn da instância: pools e limites de concorrência são por worker
+API_WORKERS = max(1, int(os.getenv("API_WORKERS", "1")))
+# Conexões que a instância pode abrir em cada servidor (abaixo do max_connections=100 do Postgres)
+DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", "80"))
+
+def per_worker(total: int) -> int:
+    """Parte de um limite da instância que cabe a cada worker (pelo menos 1)"""
+    return max(1, -(-total // API_WORKERS))
+
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+# Até 20 por worker, sem passar do orçamento (cada worker tem ainda a conexão de LISTEN)
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", str(min(20, max(2, DB_MAX_CONNECTIONS // API_WORKERS - 1)))))
+# Tempo máximo (segundos) à espera de uma conexão livre antes de PoolTimeout
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))
+# Pedidos à espera de conexão antes de o pool recusar logo (TooManyRequests)
+DB_POOL_MAX_WAITING = int(os.getenv("DB_POOL_MAX_WAITING", "200"))
+
+# Réplicas de leitura: "host[:porta],..." com a mesma base de dados e credenciais
+DB_REPLICA_HOSTS = [host.strip() for host in os.getenv("DB_REPLICA_HOSTS", "").split(",") if host.strip()]
+DB_REPLICA_POOL_MAX_SIZE = int(os.getenv("DB_REPLICA_POOL_MAX_SIZE", str(DB_POOL_MAX_SIZE)))
+# Espera máxima por uma conexão de réplica antes de ler do primário
+DB_REPLICA_TIMEOUT = float(os.getenv("DB_REPLICA_TIMEOUT", "0.5"))
+# Tempo durante o qual uma réplica que falhou deixa de receber leituras
+DB_REPLICA_RETRY_SECONDS = float(os.getenv("DB_REPLICA_RETRY_SECONDS", "5"))
+
+db_pool = None
+replica_pools: list[AsyncConnectionPool] = []
+_next_replica = itertools.count()
+# Réplicas em falha: índice em replica_pools -> instante (monotonic) da próxima tentativa
+_replica_retry_at: dict[int, float] = {}
+
+STATEMENT_KIND = re.compile(r"\s*(\w+)")
+
+
+class TimedCursor(AsyncCursor):
+    """Cursor que regista a duração de cada execute no histograma db_query_seconds,
+    por tipo de instrução (SELECT, UPDATE, WITH, ...)"""
+
+    async def execute(self, query, params=None, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await super().execute(query, params, **kwargs)
+        finally:
+            match = STATEMENT_KIND.match(query) if isinstance(query, str) else None
+            db_query_duration.observe(time.perf_counter() - start, match.group(1).upper() if match else "other")
+
+
+def get_conninfo(host: str = None, port: str = None) -> str:
+    """Constrói a connection string a partir das variáveis de ambiente"""
+    return make_conninfo(
+        host=host or os.getenv("DB_HOST"),
+        port=port or os.getenv("DB_PORT"),
+        dbname=os.getenv("DB_NAME"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD")
+    )
+
+def create_pool(conninfo: str, max_size: int) -> AsyncConnectionPool:
+    return AsyncConnectionPool(
+        conninfo,
+        min_size=min(DB_POOL_MIN_SIZE, max_size),
+        max_size=max_size,
+        timeout=DB_POOL_TIMEOUT,
+        max_waiting=DB_POOL_MAX_WAITING,
+        kwargs={"row_factory": dict_row, "cursor_factory": TimedCursor},
+        open=False
+    )
+
+async def get_db_pool() -> AsyncConnectionPool:
+    """Inicializa o pool assíncrono de forma lazy"""
+    global db_pool
+    if db_pool is None:
+        # Atribuir antes do await para que pedidos concorrentes partilhem o mesmo pool
+        db_pool = create_pool(get_conninfo(), DB_POOL_MAX_SIZE)
+        await db_pool.open()
+    return db_pool
+
+async def get_replica_pools() -> list[AsyncConnectionPool]:
+    """Pools das réplicas (lista vazia sem DB_REPLICA_HOSTS)"""
+    if DB_REPLICA_HOSTS and not replica_pools:
+        pools = []
+        for spec in DB_REPLICA_HOSTS:
+            host, _, port = spec.partition(":")
+            pools.append(create_pool(get_conninfo(host, port or None), DB_REPLICA_POOL_MAX_SIZE))
+        replica_pools.extend(pools)
+        for pool in pools:
+            # Sem wait: uma réplica em baixo não impede o arranque
+            await pool.open(wait=False)
+    return replica_pools
+
+def pool_saturated() -> bool:
+    """Há pedidos à espera de uma conexão do primário?"""
+    return db_pool is not None and db_pool.get_stats().get("requests_waiting", 0) > 0
+
+def pool_stats() -> dict:
+    """Tamanho, conexões livres, esperas e contadores dos pools (primário e réplicas)"""
+    return {
+        "primary": db_pool.get_stats() if db_pool is not None else None,
+        "replicas": [pool.get_stats() for pool in replica_pools],
+        "replicas_down": sorted(_replica_retry_at),
+    }
+
+async def close_db_pool():
+    """Fecha os pools (chamado no shutdown da aplicação)"""
+    global db_pool
+    if db_pool is not None:
+        await db_pool.close()
+        db_pool = None
+    pools = list(replica_pools)
+    replica_pools.clear()
+    _replica_retry_at.clear()
+    for pool in pools:
+        await pool.close()
+
+@asynccontextmanager
+async def get_db_connection(timeout: float | None = None):
+    """Obtém uma conexão do pool; faz commit à saída ou rollback em caso de erro.
+    timeout substitui DB_POOL_TIMEOUT para este pedido"""
+    pool = await get_db_pool()
+    start = time.perf_counter()
+    async with pool.connection(timeout=timeout) as conn:
+        db_pool_acquire_duration.observe(time.perf_counter() - start, "primary")
+        yield conn
+
+async def current_wal_lsn(conn) -> str | None:
+    """Faz commit da escrita em curso em conn e devolve a posição do WAL do primário
+    (None sem réplicas). Devolvida ao cliente para pedir leituras read-your-writes.
+    Lida depois do commit e não no RETURNING da escrita: a posição tem de incluir o
+    registo de commit, senão uma réplica podia tê-la aplicado sem ver a escrita"""
+    if not DB_REPLICA_HOSTS:
+        return None
+    await conn.commit()
+    cursor = await conn.execute("SELECT pg_current_wal_lsn()::text AS lsn")
+    return (await cursor.fetchone())["lsn"]
+
+async def replica_caught_up(conn, min_lsn: str) -> bool:
+    """A réplica já aplicou o WAL até min_lsn? (um servidor que não está em recovery conta como atualizado)"""
+    cursor = await conn.execute(
+        "SELECT COALESCE(pg_last_wal_replay_lsn() >= %s::pg_lsn, NOT pg_is_in_recovery()) AS caught_up",
+        (min_lsn,)
+    )
+    return (await cursor.fetchone())["caught_up"]
+
+def pick_replica(count: int) -> int | None:
+    """Próxima réplica em round-robin, saltando as que estão em falha (None se todas)"""
+    now = time.monotonic()
+    for _ in range(count):
+        index = next(_next_replica) % count
+        retry_at = _replica_retry_at.get(index)
+        if retry_at is None:
+            return index
+        if now >= retry_at:
+            # Só este pedido volta a experimentar a réplica; os outros continuam a saltá-la
+            _replica_retry_at[index] = now + DB_REPLICA_RETRY_SECONDS
+            return index
+    return None
+
+@asynccontextmanager
+async def get_read_connection(min_lsn: str | None = None, timeout: float | None = None):
+    """Conexão para leituras: uma réplica em round-robin, ou o primário se não houver
+    réplicas disponíveis, se a réplica não responder a tempo ou se ainda não tiver
+    aplicado min_lsn"""
+    pools = await get_replica_pools()
+    index = pick_replica(len(pools)) if pools else None
+    if index is not None:
+        served = False
+        start = time.perf_counter()
+        try:
+            async with pools[index].connection(timeout=DB_REPLICA_TIMEOUT) as conn:
+                db_pool_acquire_duration.observe(time.perf_counter() - start, "replica")
+                caught_up = min_lsn is None or await replica_caught_up(conn, min_lsn)
+                _replica_retry_at.pop(index, None)
+                if caught_up:
+                    served = True
+                    yield conn
+        except (PoolTimeout, OperationalError):
+            # Erros do próprio pedido não são repetidos no primário
+            if served:
+                raise
+            _replica_retry_at[index] = time.monotonic() + DB_REPLICA_RETRY_SECONDS
+        if served:
+            return
+    async with get_db_connection(timeout) as conn:
+        yield conn
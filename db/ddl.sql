@@ -22,6 +22,9 @@ create table tickets (
     ticket_type varchar(250) not null,
     state boolean not null,
 
+    -- Momento da primeira entrada (null enquanto state = false)
+    admitted_at timestamp,
+
     -- ID do lugar no Map-Service (ex: Seat-Norte-T0-R05-12)
     seat_node_id varchar(100),
 
@@ -0,0 +1,304 @@
+"""
+Bundle offline para validação de tokens v2 nas portas sem rede
+
+Snapshot (GET /events/{id}/gate-bundle) e delta (.../gate-bundle/changes)
+usam o mesmo formato binário, big-endian:
+
+    cabeçalho   magic "TKB1" (snapshot) ou "TKD1" (delta), formato (2),
+                event_id (uint16), since (uint64), cursor (uint64),
+                n bilhetes (uint32), n removidos (uint32), n chaves (uint8),
+                tamanho do gate_id (uint8)
+    chaves      índice de cada chave de QR_KEYS (uint8 cada)
+    gate_id     UTF-8 (vazio = evento inteiro)
+    ids         n x uint32, ordenados
+    estado      bitmap de n bits (bit i = byte i // 8, bit i % 8): admitido
+    digests     por chave, n x 8 bytes: SHA-256 truncado dos 15 bytes do
+                token v2 do bilhete assinado com essa chave
+    removidos   ids (uint32) a retirar (só no delta)
+    assinatura  HMAC-SHA256 de tudo o que vem antes, com GATE_BUNDLE_KEY
+
+O formato 1 levava, no lugar dos digests, os MACs dos tokens (n x 8 bytes
+por chave, comparados diretamente com o MAC do token). O cabeçalho e as
+restantes secções não mudaram; bundles com outro formato são recusados.
+
+As portas não recebem os segredos do QR nem os MACs dos tokens: o digest
+é de sentido único, e reconstruir um QR válido a partir do bundle exige
+encontrar 64 bits de MAC com esse digest (2^64 hashes por bilhete).
+Validar um token é uma pesquisa binária nos ids e um SHA-256.
+
+A assinatura do bundle é simétrica: quem tiver GATE_BUNDLE_KEY (qualquer
+porta) consegue forjar bundles com os tokens que quiser, e uma porta
+comprometida só deixa de ser um risco para as outras se cada uma tiver a
+sua chave. Uma assinatura Ed25519, com só a chave pública nas portas,
+eliminava este problema.
+
+O cursor é o xmin do snapshot da leitura (ver migração 0007): o delta
+since=cursor traz os bilhetes criados ou alterados depois, como linhas
+completas que substituem as anteriores, e os apagados ou mudados para
+outra porta na lista de removidos. O cursor do delta é o since do pedido
+seguinte. O estado do servidor prevalece: as admissões feitas offline
+devem ser enviadas (POST /tickets/admit) antes de aplicar o delta.
+
+Os deltas são lidos no primário: uma réplica atrasada em relação à origem
+do cursor podia devolver uma versão antiga de uma linha já alterada
+(por exemplo, um reset seguido de nova admissão) e reabrir a entrada
+offline. O snapshot pode vir de uma réplica, porque um cursor mais antigo
+só faz o delta seguinte trazer linhas a mais. Os cursores entregues ficam
+em gate_bundle_cursors (migração 0008) e prune_loop apaga os expirados e os
+tombstones que nenhum cursor em uso ainda precisa.
+"""
+import asyncio
+import hashlib
+import hmac
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from database import get_db_connection, get_read_connection
+from qr_tokens import QR_KEYS, QR_SECRET, InvalidQRToken, decode_token_v2, token_v2_mac, token_v2_payload
+
+# Chave de assinatura dos bundles (provisionada nas portas). Por omissão derivada de
+# QR_SECRET, sem que a derivada permita recuperar o segredo
+GATE_BUNDLE_KEY = os.getenv("GATE_BUNDLE_KEY", "").encode() or hmac.new(
+    QR_SECRET.encode(), b"gate-bundle", hashlib.sha256).digest()
+# Um cursor sem uso durante este tempo expira (o delta devolve 410 e a porta volta ao snapshot)
+GATE_BUNDLE_CURSOR_TTL_HOURS = float(os.getenv("GATE_BUNDLE_CURSOR_TTL_HOURS", "12"))
+# Intervalo da limpeza de cursores expirados e tombstones
+GATE_BUNDLE_PRUNE_SECONDS = float(os.getenv("GATE_BUNDLE_PRUNE_SECONDS", "300"))
+
+SNAPSHOT_MAGIC = b"TKB1"
+DELTA_MAGIC = b"TKD1"
+BUNDLE_FORMAT = 2
+HEADER = struct.Struct(">4sBHQQIIBB")
+SIGNATURE_LENGTH = 32
+DIGEST_LENGTH = 8
+# Os tokens v2 só levam event_id de 16 bits
+MAX_BUNDLE_EVENT_ID = 0xFFFF
+
+# Resultados da validação offline
+VALID = "valid"
+ALREADY_USED = "already_used"
+UNKNOWN_TICKET = "unknown_ticket"
+WRONG_EVENT = "wrong_event"
+BAD_SIGNATURE = "bad_signature"
+BAD_FORMAT = "bad_format"
+
+SNAPSHOT_SQL = "SELECT id, state FROM tickets WHERE event_id = %s{gate} ORDER BY id"
+CHANGES_SQL = "SELECT id, gate_id, state FROM tickets WHERE event_id = %s AND change_xid >= %s::text::xid8 ORDER BY id"
+TOMBSTONES_SQL = "SELECT ticket_id FROM ticket_tombstones WHERE event_id = %s AND change_xid >= %s::text::xid8"
+CURSOR_SQL = "SELECT pg_snapshot_xmin(pg_current_snapshot())::text AS cursor"
+REGISTER_CURSOR_SQL = """
+INSERT INTO gate_bundle_cursors (event_id, cursor) VALUES (%s, %s::text::xid8)
+ON CONFLICT (event_id, cursor) DO UPDATE SET last_used = localtimestamp
+"""
+TOUCH_CURSOR_SQL = """
+UPDATE gate_bundle_cursors SET last_used = localtimestamp
+WHERE event_id = %s AND cursor = %s::text::xid8 RETURNING event_id
+"""
+PRUNE_CURSORS_SQL = "DELETE FROM gate_bundle_cursors WHERE last_used < localtimestamp - %s * interval '1 hour'"
+# Um tombstone ainda é preciso se algum cursor em uso do evento lhe for anterior; o limite de
+# idade protege os snapshots em curso, cujo cursor ainda não foi registado
+PRUNE_TOMBSTONES_SQL = """
+DELETE FROM ticket_tombstones t
+WHERE deleted_at < localtimestamp - %s * interval '1 hour'
+  AND NOT EXISTS (SELECT 1 FROM gate_bundle_cursors c WHERE c.event_id = t.event_id AND c.cursor <= t.change_xid)
+"""
+
+
+class ExpiredCursor(Exception):
+    """Cursor desconhecido ou expirado: a porta tem de pedir um snapshot novo"""
+
+
+def _uint32_bytes(values) -> bytes:
+    ids = array("I", values)
+    if sys.byteorder == "little":
+        ids.byteswap()
+    return ids.tobytes()
+
+def _uint32_array(data: bytes) -> array:
+    ids = array("I", data)
+    if sys.byteorder == "little":
+        ids.byteswap()
+    return ids
+
+def token_digest(ticket_id: int, event_id: int, key_index: int, mac: bytes) -> bytes:
+    """Digest do token v2 guardado no bundle (não permite recuperar o MAC)"""
+    return hashlib.sha256(token_v2_payload(ticket_id, event_id, key_index) + mac).digest()[:DIGEST_LENGTH]
+
+def encode_bundle(magic: bytes, event_id: int, gate_id: str | None, since: int, cursor: int,
+                  tickets: list[tuple[int, bool]], removed: list[int] = (),
+                  key_indexes: tuple[int, ...] = tuple(sorted(QR_KEYS)), key: bytes = GATE_BUNDLE_KEY) -> bytes:
+    """Serializa e assina um snapshot ou delta; tickets = [(id, admitido)] ordenados por id"""
+    gate = (gate_id or "").encode()
+    bitmap = bytearray((len(tickets) + 7) // 8)
+    for pos, (_, admitted) in enumerate(tickets):
+        if admitted:
+            bitmap[pos >> 3] |= 1 << (pos & 7)
+    parts = [
+        HEADER.pack(magic, BUNDLE_FORMAT, event_id, since, cursor, len(tickets), len(removed),
+                    len(key_indexes), len(gate)),
+        bytes(key_indexes), gate,
+        _uint32_bytes(ticket_id for ticket_id, _ in tickets),
+        bytes(bitmap),
+    ]
+    for key_index in key_indexes:
+        parts.append(b"".join(token_digest(ticket_id, event_id, key_index, token_v2_mac(ticket_id, event_id, key_index))
+                              for ticket_id, _ in tickets))
+    parts.append(_uint32_bytes(removed))
+    body = b"".join(parts)
+    return body + hmac.new(key, body, hashlib.sha256).digest()
+
+
+class GateBundle:
+    """Leitura e validação de um bundle: implementação de referência do lado da porta"""
+
+    def __init__(self, data: bytes, key: bytes = GATE_BUNDLE_KEY):
+        body, signature = data[:-SIGNATURE_LENGTH], data[-SIGNATURE_LENGTH:]
+        if not hmac.compare_digest(signature, hmac.new(key, body, hashlib.sha256).digest()):
+            raise ValueError("Invalid bundle signature")
+        (magic, version, self.event_id, self.since, self.cursor, count, removed_count,
+         key_count, gate_length) = HEADER.unpack_from(body)
+        if magic not in (SNAPSHOT_MAGIC, DELTA_MAGIC) or version != BUNDLE_FORMAT:
+            raise ValueError("Unsupported bundle format")
+        self.is_delta = magic == DELTA_MAGIC
+        offset = HEADER.size
+        self.key_indexes = list(body[offset:offset + key_count])
+        offset += key_count
+        self.gate_id = body[offset:offset + gate_length].decode() or None
+        offset += gate_length
+        self.ids = _uint32_array(body[offset:offset + 4 * count])
+        offset += 4 * count
+        self.state = bytearray(body[offset:offset + (count + 7) // 8])
+        offset += (count + 7) // 8
+        self.digests = {}
+        for key_index in self.key_indexes:
+            self.digests[key_index] = body[offset:offset + DIGEST_LENGTH * count]
+            offset += DIGEST_LENGTH * count
+        self.removed = list(_uint32_array(body[offset:offset + 4 * removed_count]))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def position(self, ticket_id: int) -> int | None:
+        pos = bisect_left(self.ids, ticket_id)
+        return pos if pos < len(self.ids) and self.ids[pos] == ticket_id else None
+
+    def is_admitted(self, pos: int) -> bool:
+        return bool(self.state[pos >> 3] & (1 << (pos & 7)))
+
+    def mark_admitted(self, pos: int):
+        self.state[pos >> 3] |= 1 << (pos & 7)
+
+    def validate(self, token: str) -> str:
+        """Valida um token v2 e marca o bilhete como admitido na primeira entrada"""
+        try:
+            key_index, event_id, ticket_id, mac = decode_token_v2(token.strip())
+        except InvalidQRToken:
+            return BAD_FORMAT
+        if event_id != self.event_id:
+            return WRONG_EVENT
+        pos = self.position(ticket_id)
+        if pos is None:
+            return UNKNOWN_TICKET
+        digests = self.digests.get(key_index)
+        if digests is None or not hmac.compare_digest(
+                token_digest(ticket_id, event_id, key_index, mac),
+                digests[pos * DIGEST_LENGTH:(pos + 1) * DIGEST_LENGTH]):
+            return BAD_SIGNATURE
+        if self.is_admitted(pos):
+            return ALREADY_USED
+        self.mark_admitted(pos)
+        return VALID
+
+    def apply_delta(self, delta: "GateBundle"):
+        """Aplica um delta (cujo since é o cursor atual) reconstruindo os arrays ordenados"""
+        if (not delta.is_delta or delta.event_id != self.event_id or delta.gate_id != self.gate_id
+                or delta.since != self.cursor):
+            raise ValueError("Delta does not apply to this bundle")
+        if delta.key_indexes != self.key_indexes:
+            raise ValueError("Delta signed for a different key set")
+        tickets = {}
+        for pos, ticket_id in enumerate(self.ids):
+            tickets[ticket_id] = (self.is_admitted(pos), pos, self)
+        for ticket_id in delta.removed:
+            tickets.pop(ticket_id, None)
+        for pos, ticket_id in enumerate(delta.ids):
+            tickets[ticket_id] = (delta.is_admitted(pos), pos, delta)
+        ordered = sorted(tickets.items())
+        self.ids = array("I", (ticket_id for ticket_id, _ in ordered))
+        self.state = bytearray((len(ordered) + 7) // 8)
+        digests = {key_index: bytearray() for key_index in self.key_indexes}
+        for pos, (_, (admitted, source_pos, source)) in enumerate(ordered):
+            if admitted:
+                self.mark_admitted(pos)
+            for key_index in self.key_indexes:
+                start = source_pos * DIGEST_LENGTH
+                digests[key_index] += source.digests[key_index][start:start + DIGEST_LENGTH]
+        self.digests = {key_index: bytes(value) for key_index, value in digests.items()}
+        self.cursor = delta.cursor
+
+
+async def read_cursor(conn) -> int:
+    """Define o snapshot da transação (REPEATABLE READ) e devolve o seu cursor"""
+    await conn.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+    result = await conn.execute(CURSOR_SQL)
+    return int((await result.fetchone())["cursor"])
+
+async def build_snapshot(event_id: int, gate_id: str | None = None) -> tuple[int, list[tuple[int, bool]]]:
+    """Cursor e (id, admitido) dos bilhetes do evento/porta, lidos no mesmo snapshot"""
+    sql = SNAPSHOT_SQL.format(gate=" AND gate_id = %s" if gate_id else "")
+    async with get_read_connection() as conn:
+        cursor = await read_cursor(conn)
+        result = await conn.execute(sql, (event_id, gate_id) if gate_id else (event_id,))
+        rows = await result.fetchall()
+    if rows:
+        async with get_db_connection() as conn:
+            await conn.execute(REGISTER_CURSOR_SQL, (event_id, str(cursor)))
+    return cursor, [(row["id"], row["state"]) for row in rows]
+
+async def build_changes(event_id: int, since: int,
+                        gate_id: str | None = None) -> tuple[int, list[tuple[int, bool]], list[int]]:
+    """Cursor novo, bilhetes alterados desde since e ids a retirar (apagados ou de outra porta).
+    Lança ExpiredCursor se since não for um cursor em uso"""
+    async with get_db_connection() as conn:
+        # Escritas em gate_bundle_cursors em transações curtas READ COMMITTED, fora do snapshot:
+        # as portas do evento atualizam a mesma linha ao mesmo tempo, o que em REPEATABLE READ
+        # dava SerializationFailure a quase todas
+        result = await conn.execute(TOUCH_CURSOR_SQL, (event_id, str(since)))
+        if await result.fetchone() is None:
+            raise ExpiredCursor(since)
+        await conn.commit()
+        cursor = await read_cursor(conn)
+        result = await conn.execute(CHANGES_SQL, (event_id, str(since)))
+        rows = await result.fetchall()
+        result = await conn.execute(TOMBSTONES_SQL, (event_id, str(since)))
+        removed = {row["ticket_id"] for row in await result.fetchall()}
+        await conn.commit()
+        # Registado depois da leitura, como no snapshot: até lá since (>= anterior) protege os tombstones
+        await conn.execute(REGISTER_CURSOR_SQL, (event_id, str(cursor)))
+    tickets = []
+    for row in rows:
+        if gate_id and row["gate_id"] != gate_id:
+            removed.add(row["id"])
+        else:
+            tickets.append((row["id"], row["state"]))
+    return cursor, tickets, sorted(removed)
+
+
+async def prune(ttl_hours: float = GATE_BUNDLE_CURSOR_TTL_HOURS) -> tuple[int, int]:
+    """Apaga cursores expirados e os tombstones que já nenhum cursor em uso precisa"""
+    async with get_db_connection() as conn:
+        result = await conn.execute(PRUNE_CURSORS_SQL, (ttl_hours,))
+        cursors = result.rowcount
+        result = await conn.execute(PRUNE_TOMBSTONES_SQL, (ttl_hours,))
+        return cursors, result.rowcount
+
+async def prune_loop():
+    """Tarefa de fundo da retenção dos cursores e tombstones"""
+    while True:
+        await asyncio.sleep(GATE_BUNDLE_PRUNE_SECONDS)
+        try:
+            await prune()
+        except Exception as e:
+            print(f"Erro ao limpar cursores e tombstones dos bundles: {e}")
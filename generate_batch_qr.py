@@ -2,57 +2,207 @@
 """
 Gera QR codes em lote para todos os bilhetes
 Uso: python generate_batch_qr.py [ticket_id_inicial] [ticket_id_final]
+     python generate_batch_qr.py --db [--event EVENT_ID]
+
+Os PNG são desenhados em paralelo por um pool de processos. Um manifesto
+(manifest.json no diretório de output) guarda, por bilhete, o hash do token
+e o ficheiro gerado, pelo que execuções seguintes só desenham bilhetes novos
+ou cujo token mudou (por exemplo após trocar o QR_SECRET).
 """
-import sys
+import argparse
+import hashlib
+import json
 import os
-from generate_qr import generate_qr
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+from itertools import islice
+from typing import Iterable, Iterator
+from generate_qr import generate_secure_token, render_qr
+
+MANIFEST_FILE = "manifest.json"
+# Intervalo mínimo (segundos) entre linhas de progresso
+PROGRESS_INTERVAL = 1.0
+# Bilhetes enviados a cada processo de uma vez
+RENDER_CHUNK_SIZE = 64
+
+def token_hash(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()[:16]
+
+def load_manifest(output_dir: str) -> dict:
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def save_manifest(output_dir: str, manifest: dict):
+    """Escrita atómica (ficheiro temporário + rename)"""
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def iter_tickets_from_db(event_id: int = None, itersize: int = 2000) -> Iterator[tuple[int, int]]:
+    """Lê (id, event_id) dos bilhetes com um cursor do lado do servidor (memória constante)"""
+    import psycopg2
+
+    conn = psycopg2.connect(
+        host=os.getenv('DB_HOST', 'localhost'),
+        database=os.getenv('DB_NAME', 'test_db'),
+        user=os.getenv('DB_USER', 'test_user'),
+        password=os.getenv('DB_PASSWORD', 'test_password'),
+        port=os.getenv('DB_PORT', 5432)
+    )
+    try:
+        cursor = conn.cursor(name="qr_ticket_ids")
+        cursor.itersize = itersize
+        if event_id is None:
+            cursor.execute("SELECT id, event_id FROM tickets ORDER BY id")
+        else:
+            cursor.execute("SELECT id, event_id FROM tickets WHERE event_id = %s ORDER BY id", (event_id,))
+        yield from cursor
+        cursor.close()
+    finally:
+        conn.close()
+
+def _render_job(job: tuple[int, str, str]) -> tuple[int, str | None]:
+    """Executado nos processos do pool: desenha um QR e devolve (ticket_id, erro)"""
+    ticket_id, token, output_path = job
+    try:
+        render_qr(token, output_path)
+        return ticket_id, None
+    except Exception as e:
+        return ticket_id, str(e)
+
+def _render_chunk(jobs: list[tuple[int, str, str]]) -> list[tuple[int, str | None]]:
+    return [_render_job(job) for job in jobs]
+
+def _chunks(iterable: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+def generate_batch(start_id: int = 1, end_id: int = None, output_dir: str = "qr_codes",
+                   ticket_ids: Iterable[int | tuple[int, int]] = None, workers: int = None,
+                   force: bool = False) -> dict:
+    """Gera QR codes para múltiplos bilhetes (só os novos ou alterados, salvo force).
+    ticket_ids pode conter pares (ticket_id, event_id) para emitir tokens v2"""
 
-def generate_batch(start_id: int = 1, end_id: int = None, output_dir: str = "qr_codes"):
-    """Gera QR codes para múltiplos bilhetes"""
-    
     # Criar diretório de output
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
         print(f"📁 Diretório criado: {output_dir}/")
-    
-    # Se não especificar end_id, gerar apenas para start_id
-    if end_id is None:
-        end_id = start_id
-    
-    print(f"\n🎫 Gerando QR codes para bilhetes {start_id} a {end_id}...")
+
+    if ticket_ids is None:
+        # Se não especificar end_id, gerar apenas para start_id
+        if end_id is None:
+            end_id = start_id
+        ticket_ids = range(start_id, end_id + 1)
+        print(f"\n🎫 Gerando QR codes para bilhetes {start_id} a {end_id}...")
+    else:
+        print("\n🎫 Gerando QR codes para os bilhetes da base de dados...")
     print("=" * 60)
-    
-    success_count = 0
-    for ticket_id in range(start_id, end_id + 1):
-        try:
-            output_path = os.path.join(output_dir, f"ticket_{ticket_id}_qr.png")
-            generate_qr(ticket_id, output_path)
-            success_count += 1
-        except Exception as e:
-            print(f"❌ Erro ao gerar QR para ticket {ticket_id}: {e}")
-    
+
+    manifest = {} if force else load_manifest(output_dir)
+    stats = {"rendered": 0, "skipped": 0, "failed": 0}
+    pending = {}
+
+    def jobs() -> Iterator[tuple[int, str, str]]:
+        for item in ticket_ids:
+            ticket_id, event_id = item if isinstance(item, tuple) else (item, None)
+            token = generate_secure_token(ticket_id, event_id)
+            digest = token_hash(token)
+            filename = f"ticket_{ticket_id}_qr.png"
+            entry = manifest.get(str(ticket_id))
+            if entry and entry["token_hash"] == digest and os.path.exists(os.path.join(output_dir, entry["file"])):
+                stats["skipped"] += 1
+                continue
+            pending[ticket_id] = {"token_hash": digest, "file": filename}
+            yield ticket_id, token, os.path.join(output_dir, filename)
+
+    started = last_report = time.monotonic()
+
+    def record(ticket_id: int, error: str | None):
+        nonlocal last_report
+        entry = pending.pop(ticket_id)
+        if error is None:
+            manifest[str(ticket_id)] = entry
+            stats["rendered"] += 1
+        else:
+            stats["failed"] += 1
+            print(f"❌ Erro ao gerar QR para ticket {ticket_id}: {error}")
+        now = time.monotonic()
+        if now - last_report >= PROGRESS_INTERVAL:
+            last_report = now
+            rate = stats["rendered"] / (now - started)
+            print(f"   ... {stats['rendered']} gerados, {stats['skipped']} inalterados ({rate:.0f} QR/s)")
+
+    workers = workers or os.cpu_count() or 1
+    try:
+        if workers == 1:
+            for job in jobs():
+                record(*_render_job(job))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                # Número limitado de blocos em voo para não ler todos os ids para memória
+                in_flight = set()
+                for chunk in _chunks(jobs(), RENDER_CHUNK_SIZE):
+                    if len(in_flight) >= workers * 2:
+                        done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            for result in future.result():
+                                record(*result)
+                    in_flight.add(executor.submit(_render_chunk, chunk))
+                for future in as_completed(in_flight):
+                    for result in future.result():
+                        record(*result)
+    finally:
+        # Guardar o progresso mesmo se a execução for interrompida
+        save_manifest(output_dir, manifest)
+
+    elapsed = time.monotonic() - started
+    rate = stats["rendered"] / elapsed if elapsed > 0 else 0
     print("=" * 60)
-    print(f"✅ {success_count} QR codes gerados com sucesso em: {output_dir}/")
+    print(f"✅ {stats['rendered']} QR codes gerados com sucesso em: {output_dir}/ "
+          f"({rate:.0f} QR/s, {workers} processos)")
+    print(f"   {stats['skipped']} inalterados, {stats['failed']} com erro")
     print(f"\n💡 Estes QR codes podem ser impressos nos bilhetes.")
+    return stats
 
 def main():
-    if len(sys.argv) == 1:
-        print("Uso: python generate_batch_qr.py [start_id] [end_id]")
-        print("\nExemplos:")
-        print("  python generate_batch_qr.py 1        # Gera apenas ticket 1")
-        print("  python generate_batch_qr.py 1 10     # Gera tickets 1 a 10")
-        print("  python generate_batch_qr.py 1 100    # Gera tickets 1 a 100")
+    parser = argparse.ArgumentParser(
+        description="Gera QR codes em lote para os bilhetes",
+        epilog="Exemplos:\n"
+               "  python generate_batch_qr.py 1        # Gera apenas ticket 1\n"
+               "  python generate_batch_qr.py 1 10     # Gera tickets 1 a 10\n"
+               "  python generate_batch_qr.py --db     # Todos os bilhetes da base de dados",
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("start_id", nargs="?", help="ticket_id inicial")
+    parser.add_argument("end_id", nargs="?", help="ticket_id final")
+    parser.add_argument("--db", action="store_true", help="ler os ids da tabela tickets")
+    parser.add_argument("--event", type=int, help="com --db, limitar a um evento")
+    parser.add_argument("--output-dir", default="qr_codes", help="diretório de output (default: qr_codes)")
+    parser.add_argument("--workers", type=int, help="número de processos (default: nº de CPUs)")
+    parser.add_argument("--force", action="store_true", help="ignorar o manifesto e gerar tudo")
+    args = parser.parse_args()
+
+    if args.start_id is None and not args.db:
+        parser.print_help()
         sys.exit(1)
-    
+
     try:
-        start_id = int(sys.argv[1])
-        end_id = int(sys.argv[2]) if len(sys.argv) > 2 else None
-        
-        generate_batch(start_id, end_id)
-        
+        start_id = int(args.start_id) if args.start_id is not None else 1
+        end_id = int(args.end_id) if args.end_id is not None else None
     except ValueError:
         print("❌ Erro: IDs devem ser números inteiros")
         sys.exit(1)
 
+    ticket_ids = iter_tickets_from_db(args.event) if args.db else None
+    generate_batch(start_id, end_id, output_dir=args.output_dir, ticket_ids=ticket_ids,
+                   workers=args.workers, force=args.force)
+
 if __name__ == "__main__":
     main()
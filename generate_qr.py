@@ -1,47 +1,53 @@
 #!/usr/bin/env python3
 """Gera QR codes seguros com HMAC
-Uso: python generate_qr.py <ticket_id>
+Uso: python generate_qr.py <ticket_id> [output.png] [event_id]
 """
 import sys
+import io
 import qrcode
-import hmac
-import hashlib
-import os
-from dotenv import load_dotenv
+from qrcode.image.svg import SvgPathImage
+from qr_tokens import generate_qr_token
 
-load_dotenv()
+QR_IMAGE_FORMATS = ("png", "svg")
 
-QR_SECRET = os.getenv("QR_SECRET", "change-this-secret-key")
+def generate_secure_token(ticket_id: int, event_id: int = None) -> str:
+    """Gera token seguro (v2 com event_id, v1 = ticket_id + assinatura HMAC)"""
+    return generate_qr_token(ticket_id, event_id)
 
-def generate_secure_token(ticket_id: int) -> str:
-    """Gera token seguro (ticket_id + assinatura HMAC)"""
-    signature = hmac.new(
-        QR_SECRET.encode(),
-        str(ticket_id).encode(),
-        hashlib.sha256
-    ).hexdigest()[:16]
-    return f"{ticket_id}:{signature}"
-
-def generate_qr(ticket_id: int, output_path: str = None):
-    """Gera QR code com token seguro HMAC"""
-    if output_path is None:
-        output_path = f"ticket_{ticket_id}_qr.png"
-    
-    # Gerar token seguro
-    secure_token = generate_secure_token(ticket_id)
-    
-    # Criar QR com o token seguro
+def make_qr_image(token: str, image_format: str = "png"):
+    """Desenha o QR code de um token (PNG via PIL ou SVG vetorial)"""
     qr = qrcode.QRCode(
         version=1,
         error_correction=qrcode.constants.ERROR_CORRECT_L,
         box_size=10,
         border=4,
+        image_factory=SvgPathImage if image_format == "svg" else None,
     )
-    qr.add_data(secure_token)
+    qr.add_data(token)
     qr.make(fit=True)
     
-    img = qr.make_image(fill_color="black", back_color="white")
-    img.save(output_path)
+    if image_format == "svg":
+        return qr.make_image()
+    return qr.make_image(fill_color="black", back_color="white")
+
+def render_qr(token: str, output_path: str):
+    """Desenha o QR code de um token e grava-o em PNG"""
+    make_qr_image(token).save(output_path)
+
+def render_qr_bytes(token: str, image_format: str = "png") -> bytes:
+    """Desenha o QR code de um token e devolve o ficheiro em memória"""
+    buffer = io.BytesIO()
+    make_qr_image(token, image_format).save(buffer)
+    return buffer.getvalue()
+
+def generate_qr(ticket_id: int, output_path: str = None, event_id: int = None):
+    """Gera QR code com token seguro HMAC"""
+    if output_path is None:
+        output_path = f"ticket_{ticket_id}_qr.png"
+    
+    # Gerar token seguro
+    secure_token = generate_secure_token(ticket_id, event_id)
+    render_qr(secure_token, output_path)
     
     print(f"✅ QR code gerado: {output_path}")
     print(f"   Ticket ID: {ticket_id}")
@@ -50,18 +56,19 @@ def generate_qr(ticket_id: int, output_path: str = None):
 
 def main():
     if len(sys.argv) < 2:
-        print("Uso: python generate_qr.py <ticket_id> [output.png]")
+        print("Uso: python generate_qr.py <ticket_id> [output.png] [event_id]")
         print("Exemplo: python generate_qr.py 1")
         sys.exit(1)
     
     try:
         ticket_id = int(sys.argv[1])
+        event_id = int(sys.argv[3]) if len(sys.argv) > 3 else None
     except ValueError:
-        print("❌ Erro: ticket_id deve ser um número inteiro")
+        print("❌ Erro: ticket_id e event_id devem ser números inteiros")
         sys.exit(1)
     
     output_path = sys.argv[2] if len(sys.argv) > 2 else None
-    generate_qr(ticket_id, output_path)
+    generate_qr(ticket_id, output_path, event_id)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,54 @@
+"""
+Utilitários de cache HTTP: LRU limitado em memória e comparação de ETags
+"""
+import hashlib
+from collections import OrderedDict
+from typing import Any, Hashable
+
+
+class LRUCache:
+    """Cache LRU limitada ao número de entradas (sem locks: usada só no event loop)"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Any | None:
+        value = self._entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: Hashable, value: Any):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def discard(self, key: Hashable):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+
+def make_etag(content: bytes) -> str:
+    """ETag forte derivado do conteúdo"""
+    return f'"{hashlib.sha256(content).hexdigest()[:32]}"'
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Comparação fraca usada em If-None-Match (RFC 9110 13.1.2)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+    return etag.removeprefix("W/") in candidates
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Importação em massa de bilhetes (CSV ou NDJSON) via COPY
+Uso: python import_tickets.py <ficheiro.csv|ficheiro.ndjson> [csv|ndjson]
+
+O input é lido em streaming, validado linha a linha contra o modelo Ticket e
+copiado para a tabela tickets em blocos de IMPORT_CHUNK_SIZE linhas (um
+COPY e um commit por bloco), pelo que a memória usada não depende do
+tamanho do ficheiro. Usa-se um registo por linha (sem quebras de linha
+dentro de campos CSV).
+
+Os ids de cada bloco são reservados na sequência antes do COPY (que não
+tem RETURNING) e copiados com as restantes colunas; o relatório devolve-os
+pela ordem do input e, opcionalmente, o token do QR de cada bilhete.
+"""
+import asyncio
+import csv
+import json
+import os
+import sys
+from typing import AsyncIterator
+from pydantic import ValidationError
+from database import get_db_connection, close_db_pool
+from models import Ticket
+from qr_tokens import generate_qr_token
+
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "5000"))
+# Número máximo de erros devolvidos no relatório (os restantes só são contados)
+IMPORT_MAX_ERRORS = 100
+
+IMPORT_FORMATS = ("csv", "ndjson")
+
+COPY_COLUMNS = ("id", "event_id", "gates_open", "gate_id", "row_id", "seat_id",
+                "sector_id", "ticket_type", "state", "seat_node_id", "admitted_at")
+
+COPY_SQL = f"COPY tickets ({', '.join(COPY_COLUMNS)}) FROM STDIN"
+RESERVE_IDS_SQL = "SELECT nextval('tickets_id_seq') AS id FROM generate_series(1, %s)"
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Converte um stream de bytes em linhas de texto (sem carregar tudo em memória)"""
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8").rstrip("\r")
+    if buffer:
+        yield buffer.decode("utf-8").rstrip("\r")
+
+async def iter_records(lines: AsyncIterator[str], fmt: str) -> AsyncIterator[tuple[int, dict | None, str | None]]:
+    """Produz (número da linha, registo, erro) para cada linha não vazia"""
+    header = None
+    line_no = 0
+    async for line in lines:
+        line_no += 1
+        if not line.strip():
+            continue
+        if fmt == "csv":
+            values = next(csv.reader([line]))
+            if header is None:
+                header = [name.strip() for name in values]
+                continue
+            if len(values) != len(header):
+                yield line_no, None, f"expected {len(header)} columns, got {len(values)}"
+                continue
+            # Campos vazios em CSV equivalem a null
+            yield line_no, {k: (v if v != "" else None) for k, v in zip(header, values)}, None
+        else:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_no, None, f"invalid JSON: {e.msg}"
+                continue
+            if not isinstance(record, dict):
+                yield line_no, None, "expected a JSON object"
+                continue
+            yield line_no, record, None
+
+def validate_record(record: dict) -> Ticket:
+    """Valida um registo contra o modelo Ticket (o id é atribuído pela base de dados)"""
+    return Ticket.model_validate({**record, "id": 0})
+
+async def copy_chunk(chunk: list[Ticket]) -> list[int]:
+    """Copia um bloco com ids reservados na sequência; devolve-os pela ordem do bloco"""
+    async with get_db_connection() as conn:
+        cursor = await conn.execute(RESERVE_IDS_SQL, (len(chunk),))
+        ids = [row["id"] for row in await cursor.fetchall()]
+        async with conn.cursor() as cursor:
+            async with cursor.copy(COPY_SQL) as copy:
+                for ticket_id, ticket in zip(ids, chunk):
+                    ticket.id = ticket_id
+                    await copy.write_row(tuple(getattr(ticket, column) for column in COPY_COLUMNS))
+    return ids
+
+async def import_tickets(chunks: AsyncIterator[bytes], fmt: str, on_progress=None,
+                         with_qr_tokens: bool = False) -> dict:
+    """Importa bilhetes a partir de um stream de bytes; devolve o relatório da importação
+    (com os ids atribuídos e, se with_qr_tokens, os tokens dos QR pela mesma ordem)"""
+    if fmt not in IMPORT_FORMATS:
+        raise ValueError(f"Unsupported format: {fmt}")
+
+    # Validar a FK em memória evita que um único event_id inválido faça falhar um bloco inteiro
+    async with get_db_connection() as conn:
+        cursor = await conn.execute("SELECT id FROM events")
+        event_ids = {row["id"] for row in await cursor.fetchall()}
+
+    report = {"inserted": 0, "rejected": 0, "errors": [], "ids": []}
+    if with_qr_tokens:
+        report["qr_tokens"] = []
+
+    async def copy(chunk: list[Ticket]):
+        report["ids"] += await copy_chunk(chunk)
+        report["inserted"] += len(chunk)
+        if with_qr_tokens:
+            report["qr_tokens"] += [generate_qr_token(ticket.id, ticket.event_id) for ticket in chunk]
+        if on_progress:
+            on_progress(report)
+
+    def reject(line_no: int, error: str):
+        report["rejected"] += 1
+        if len(report["errors"]) < IMPORT_MAX_ERRORS:
+            report["errors"].append({"line": line_no, "error": error})
+
+    chunk = []
+    async for line_no, record, error in iter_records(iter_lines(chunks), fmt):
+        if error is None:
+            try:
+                ticket = validate_record(record)
+            except ValidationError as e:
+                first = e.errors()[0]
+                error = f"{'.'.join(map(str, first['loc']))}: {first['msg']}"
+            else:
+                if ticket.event_id not in event_ids:
+                    error = f"event_id {ticket.event_id} does not exist"
+        if error is not None:
+            reject(line_no, error)
+            continue
+
+        chunk.append(ticket)
+        if len(chunk) >= IMPORT_CHUNK_SIZE:
+            await copy(chunk)
+            chunk = []
+
+    if chunk:
+        await copy(chunk)
+
+    return report
+
+
+async def read_file(path: str, block_size: int = 1 << 16) -> AsyncIterator[bytes]:
+    with open(path, "rb") as f:
+        while block := f.read(block_size):
+            yield block
+
+async def run_import(path: str, fmt: str) -> dict:
+    try:
+        return await import_tickets(
+            read_file(path), fmt,
+            on_progress=lambda r: print(f"   ... {r['inserted']} bilhetes importados")
+        )
+    finally:
+        await close_db_pool()
+
+def main():
+    if len(sys.argv) < 2:
+        print("Uso: python import_tickets.py <ficheiro.csv|ficheiro.ndjson> [csv|ndjson]")
+        print("Exemplo: python import_tickets.py season_tickets.csv")
+        sys.exit(1)
+
+    path = sys.argv[1]
+    fmt = sys.argv[2] if len(sys.argv) > 2 else os.path.splitext(path)[1].lstrip(".").lower()
+    if fmt not in IMPORT_FORMATS:
+        print(f"❌ Erro: formato deve ser um de {', '.join(IMPORT_FORMATS)}")
+        sys.exit(1)
+
+    print(f"\n🎫 A importar bilhetes de {path} ({fmt})...")
+    report = asyncio.run(run_import(path, fmt))
+    print(f"✅ {report['inserted']} bilhetes importados, {report['rejected']} rejeitados")
+    if report["ids"]:
+        print(f"   ids atribuídos: {min(report['ids'])} a {max(report['ids'])}")
+    for error in report["errors"]:
+        print(f"   linha {error['line']}: {error['error']}")
+    if report["rejected"]:
+        sys.exit(2)
+
+if __name__ == "__main__":
+    main()
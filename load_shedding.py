@@ -0,0 +1,124 @@
+"""
+Controlo de concorrência por classe de endpoint e corte de carga
+
+Cada classe (scan, api, admin) tem um limite de pedidos em execução e uma
+fila de espera limitada. Com a fila cheia, ou passado o tempo máximo de
+espera, o pedido é recusado logo com 503 + Retry-After em vez de ficar
+pendurado à espera de uma conexão. Como os limites são separados, os
+pedidos administrativos (reset, importação, ...) nunca ocupam o pool
+inteiro e os scans das portas têm sempre capacidade; além disso a classe
+admin é cortada assim que houver pedidos à espera de conexão no pool.
+
+Os limites configurados são da instância: com API_WORKERS processos cada
+worker fica com a sua parte (per_worker), como acontece com o pool.
+
+Os contadores vivem no event loop (sem locks nem asyncio.Semaphore, que
+ficaria preso ao primeiro loop que o usasse).
+"""
+import asyncio
+import os
+from collections import deque
+from typing import Callable
+from database import pool_saturated, per_worker
+
+CONCURRENCY_WAIT_TIMEOUT = float(os.getenv("CONCURRENCY_WAIT_TIMEOUT", "2"))
+
+
+class Overloaded(Exception):
+    """Pedido recusado por excesso de carga"""
+
+    def __init__(self, limiter: str, retry_after: float = 1):
+        super().__init__(f"{limiter} capacity exhausted")
+        self.limiter = limiter
+        self.retry_after = retry_after
+
+
+class ConcurrencyLimiter:
+    """Limite de pedidos em execução com fila FIFO limitada e espera máxima"""
+
+    def __init__(self, name: str, limit: int, max_waiting: int, timeout: float = CONCURRENCY_WAIT_TIMEOUT,
+                 shed_when: Callable[[], bool] | None = None):
+        self.name = name
+        self.limit = limit
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        # Condição adicional de corte (ex: pool da base de dados saturado)
+        self.shed_when = shed_when
+        self.active = 0
+        self.shed = 0
+        self._waiters: deque = deque()
+
+    async def acquire(self):
+        if self.shed_when is not None and self.shed_when():
+            self.shed += 1
+            raise Overloaded(self.name)
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return
+        if len(self._waiters) >= self.max_waiting:
+            self.shed += 1
+            raise Overloaded(self.name)
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # O lugar chegou ao mesmo tempo que o timeout: devolvê-lo
+                self.release()
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self.shed += 1
+            raise Overloaded(self.name, self.timeout)
+        finally:
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                pass
+
+    def release(self):
+        # O lugar passa diretamente para o próximo da fila (active mantém-se)
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "waiting": len(self._waiters),
+            "max_waiting": self.max_waiting,
+            "shed": self.shed,
+        }
+
+
+# Scans e admissões nas portas
+SCAN_CONCURRENCY = per_worker(int(os.getenv("SCAN_CONCURRENCY", "64")))
+SCAN_QUEUE = per_worker(int(os.getenv("SCAN_QUEUE", "512")))
+# Restantes leituras e escritas unitárias
+API_CONCURRENCY = per_worker(int(os.getenv("API_CONCURRENCY", "32")))
+API_QUEUE = per_worker(int(os.getenv("API_QUEUE", "128")))
+# Operações em massa (reset, importação, exportação em streaming, bundles, índices)
+ADMIN_CONCURRENCY = per_worker(int(os.getenv("ADMIN_CONCURRENCY", "2")))
+ADMIN_QUEUE = per_worker(int(os.getenv("ADMIN_QUEUE", "4")))
+
+limiters = {
+    "scan": ConcurrencyLimiter("scan", SCAN_CONCURRENCY, SCAN_QUEUE),
+    "api": ConcurrencyLimiter("api", API_CONCURRENCY, API_QUEUE),
+    "admin": ConcurrencyLimiter("admin", ADMIN_CONCURRENCY, ADMIN_QUEUE, shed_when=pool_saturated),
+}
+
+def concurrency_limit(name: str):
+    """Dependência FastAPI que ocupa um lugar da classe durante o pedido"""
+    limiter = limiters[name]
+
+    async def dependency():
+        await limiter.acquire()
+        try:
+            yield
+        finally:
+            limiter.release()
+    return dependency
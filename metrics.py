@@ -0,0 +1,265 @@
+"""
+Métricas no formato de texto do Prometheus (GET /metrics)
+
+Implementação mínima sem dependências: contadores e histogramas com labels
+guardados em dicionários (só são tocados pelo event loop) e gauges
+calculados no momento do scrape. Cada histograma guarda apenas a contagem
+do bucket em que a observação cai; os buckets cumulativos são somados na
+renderização, pelo que observe() é um bisect e duas somas.
+
+As métricas são por processo. Com vários workers e METRICS_DIR definido
+(o startup.sh define-o), cada worker escreve as suas amostras nesse
+diretório a cada METRICS_SYNC_SECONDS e /metrics devolve a soma de todos,
+seja qual for o worker que responde. Os ficheiros de workers que deixaram
+de os atualizar são ignorados (os contadores desse worker recomeçam, como
+num restart).
+"""
+import asyncio
+import glob
+import os
+import time
+from bisect import bisect_left
+from typing import Callable
+import orjson
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+# Diretório partilhado pelos workers da instância (vazio = métricas só deste processo)
+METRICS_DIR = os.getenv("METRICS_DIR", "")
+METRICS_SYNC_SECONDS = float(os.getenv("METRICS_SYNC_SECONDS", "1"))
+# Ficheiros sem atualização há mais do que isto são de workers que já não existem
+METRICS_STALE_SECONDS = max(10.0, 5 * METRICS_SYNC_SECONDS)
+
+# Buckets (segundos) pensados para latências de 0.1 ms a 10 s
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+             for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, *label_values, amount: float = 1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def collect(self) -> dict:
+        return self.values
+
+    def render(self, values: dict | None = None) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for label_values, value in sorted((self.values if values is None else values).items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        # labels -> [contagem por bucket..., +Inf, soma]
+        self.values: dict[tuple, list] = {}
+
+    def observe(self, value: float, *label_values):
+        series = self.values.get(label_values)
+        if series is None:
+            series = self.values[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def time(self, *label_values) -> "Timer":
+        return Timer(self, label_values)
+
+    def collect(self) -> dict:
+        return self.values
+
+    def render(self, values: dict | None = None) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for label_values, series in sorted((self.values if values is None else values).items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), series):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, label_values, le)} {cumulative}")
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {series[-1]}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Timer:
+    """Context manager que observa a duração do bloco num histograma"""
+    __slots__ = ("histogram", "label_values", "start")
+
+    def __init__(self, histogram: Histogram, label_values: tuple):
+        self.histogram = histogram
+        self.label_values = label_values
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.label_values)
+
+
+class GaugeCallback:
+    """Gauge calculado no scrape: callback() devolve {valores_dos_labels: valor}"""
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...], callback: Callable[[], dict]):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.callback = callback
+
+    def collect(self) -> dict:
+        return self.callback()
+
+    def render(self, values: dict | None = None) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        for label_values, value in sorted((self.callback() if values is None else values).items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def collect(self) -> dict[str, dict]:
+        return {metric.name: metric.collect() for metric in self.metrics}
+
+    def render(self) -> str:
+        samples = self.collect()
+        if METRICS_DIR:
+            for other in read_worker_samples():
+                merge_samples(samples, other)
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render(samples[metric.name]))
+        return "\n".join(lines) + "\n"
+
+
+def merge_samples(samples: dict[str, dict], other: dict[str, dict]):
+    """Soma as amostras de outro worker (contadores e gauges somam, histogramas bucket a bucket)"""
+    for name, values in other.items():
+        target = samples.get(name)
+        if target is None:
+            continue
+        # Cópia: não alterar os valores vivos deste processo
+        target = samples[name] = dict(target)
+        for label_values, value in values.items():
+            current = target.get(label_values)
+            if current is None:
+                target[label_values] = value
+            elif isinstance(value, list):
+                target[label_values] = [a + b for a, b in zip(current, value)]
+            else:
+                target[label_values] = current + value
+
+def _worker_file(pid: int) -> str:
+    return os.path.join(METRICS_DIR, f"worker-{pid}.json")
+
+def write_worker_samples():
+    """Publica as amostras deste worker no METRICS_DIR (escrita atómica)"""
+    data = orjson.dumps({name: [[list(labels), value] for labels, value in values.items()]
+                         for name, values in registry.collect().items()})
+    path = _worker_file(os.getpid())
+    with open(f"{path}.tmp", "wb") as f:
+        f.write(data)
+    os.replace(f"{path}.tmp", path)
+
+def read_worker_samples() -> list[dict[str, dict]]:
+    """Amostras publicadas pelos outros workers ativos"""
+    own = _worker_file(os.getpid())
+    now = time.time()
+    workers = []
+    for path in glob.glob(os.path.join(METRICS_DIR, "worker-*.json")):
+        try:
+            if path == own or now - os.path.getmtime(path) > METRICS_STALE_SECONDS:
+                continue
+            with open(path, "rb") as f:
+                data = orjson.loads(f.read())
+        except (OSError, orjson.JSONDecodeError):
+            # Worker a terminar ou ficheiro a meio de ser substituído
+            continue
+        workers.append({name: {tuple(labels): value for labels, value in values} for name, values in data.items()})
+    return workers
+
+def remove_worker_samples():
+    try:
+        os.remove(_worker_file(os.getpid()))
+    except OSError:
+        pass
+
+async def sync_loop():
+    """Tarefa de fundo (só com METRICS_DIR): publica as amostras deste worker"""
+    try:
+        while True:
+            try:
+                write_worker_samples()
+            except OSError as e:
+                print(f"Erro ao publicar métricas em {METRICS_DIR}: {e}")
+            await asyncio.sleep(METRICS_SYNC_SECONDS)
+    finally:
+        remove_worker_samples()
+
+
+registry = Registry()
+
+http_request_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "Tempo até ao início da resposta por endpoint",
+    ("method", "route", "status")))
+db_pool_acquire_duration = registry.register(Histogram(
+    "db_pool_acquire_seconds", "Espera por uma conexão do pool", ("pool",)))
+db_query_duration = registry.register(Histogram(
+    "db_query_seconds", "Execução das queries (até ao fim do execute)", ("statement",)))
+qr_verify_duration = registry.register(Histogram(
+    "qr_token_verify_seconds", "Validação do token do QR (parse + HMAC)"))
+serialization_duration = registry.register(Histogram(
+    "response_serialize_seconds", "Serialização JSON das respostas do caminho rápido", ("route",)))
+scan_results = registry.register(Counter(
+    "scan_results_total", "Tentativas de scan e admissão por origem e resultado", ("source", "result")))
+scans_rate_limited = registry.register(Counter(
+    "scan_rate_limited_total", "Pedidos de scan recusados pelo limite por cliente"))
+
+
+class MetricsMiddleware:
+    """Middleware ASGI: latência por rota (template, não o path) e status"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                route = scope.get("route")
+                http_request_duration.observe(
+                    time.perf_counter() - start,
+                    scope["method"], route.path if route is not None else "unmatched", message["status"]
+                )
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
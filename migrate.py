@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Migrações versionadas do schema
+Uso: python migrate.py [status|up|detach-event <event_id>]
+
+As migrações são ficheiros migrations/NNNN_descricao.sql aplicados por
+ordem, cada um na sua transação, e registados em schema_migrations. Um
+advisory lock garante que dois processos a migrar em simultâneo não
+aplicam a mesma migração duas vezes.
+
+As migrações são um passo de deploy (python migrate.py, serviço migrate no
+docker-compose) antes de arrancar a API: migrar dentro do arranque bloqueia
+cada worker enquanto a base de dados não responde. MIGRATE_ON_STARTUP=true
+volta a aplicá-las no arranque (desenvolvimento com um só processo).
+"""
+import asyncio
+import os
+import re
+import sys
+from database import get_db_connection, close_db_pool
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+MIGRATE_ON_STARTUP = os.getenv("MIGRATE_ON_STARTUP", "false").lower() == "true"
+# Chave arbitrária do advisory lock das migrações
+MIGRATION_LOCK_ID = 74_220_011
+
+MIGRATION_FILE = re.compile(r"^(\d{4})_(\w+)\.sql$")
+
+
+def discover_migrations() -> list[tuple[int, str, str]]:
+    """Lista (versão, nome, caminho) das migrações ordenadas por versão"""
+    migrations = []
+    for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+        match = MIGRATION_FILE.match(filename)
+        if match:
+            migrations.append((int(match.group(1)), match.group(2), os.path.join(MIGRATIONS_DIR, filename)))
+    return migrations
+
+async def ensure_migrations_table(conn):
+    await conn.execute(
+        """CREATE TABLE IF NOT EXISTS schema_migrations (
+               version integer primary key,
+               name varchar(100) not null,
+               applied_at timestamp not null default localtimestamp
+           )"""
+    )
+
+async def applied_versions() -> set[int]:
+    async with get_db_connection() as conn:
+        await ensure_migrations_table(conn)
+        cursor = await conn.execute("SELECT version FROM schema_migrations")
+        return {row["version"] for row in await cursor.fetchall()}
+
+async def apply_migrations() -> list[str]:
+    """Aplica as migrações pendentes; devolve os nomes das que foram aplicadas"""
+    applied = []
+    for version, name, path in discover_migrations():
+        with open(path, encoding="utf-8") as f:
+            sql = f.read()
+        async with get_db_connection() as conn:
+            # Lock por transação: quem esperar volta a verificar depois do commit de quem aplicou
+            await conn.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_ID,))
+            await ensure_migrations_table(conn)
+            cursor = await conn.execute("SELECT 1 FROM schema_migrations WHERE version = %s", (version,))
+            if await cursor.fetchone():
+                continue
+            await conn.execute(sql)
+            await conn.execute(
+                "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name)
+            )
+        applied.append(f"{version:04d}_{name}")
+    return applied
+
+async def detach_event(event_id: int) -> str:
+    """Retira a partição de um evento da tabela tickets (os dados ficam na tabela separada)"""
+    partition = f"tickets_event_{event_id}"
+    async with get_db_connection() as conn:
+        cursor = await conn.execute(
+            """SELECT 1 FROM pg_inherits
+               JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+               WHERE pg_inherits.inhparent = 'tickets'::regclass AND child.relname = %s""",
+            (partition,)
+        )
+        if await cursor.fetchone() is None:
+            raise ValueError(f"Partition {partition} is not attached")
+        await conn.execute(f'ALTER TABLE tickets DETACH PARTITION "{partition}"')
+    return partition
+
+
+async def run(command: str, args: list[str]):
+    try:
+        if command == "status":
+            done = await applied_versions()
+            for version, name, _ in discover_migrations():
+                mark = "✅" if version in done else "⏳"
+                print(f"{mark} {version:04d}_{name}")
+        elif command == "up":
+            applied = await apply_migrations()
+            for name in applied:
+                print(f"✅ Aplicada: {name}")
+            if not applied:
+                print("✅ Schema atualizado, nada a aplicar")
+        elif command == "detach-event":
+            partition = await detach_event(int(args[0]))
+            print(f"✅ Partição {partition} retirada de tickets")
+    finally:
+        await close_db_pool()
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else "up"
+    if command not in ("status", "up", "detach-event") or (command == "detach-event" and len(sys.argv) < 3):
+        print("Uso: python migrate.py [status|up|detach-event <event_id>]")
+        sys.exit(1)
+    try:
+        asyncio.run(run(command, sys.argv[2:]))
+    except ValueError as e:
+        print(f"❌ Erro: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,2 @@
+-- Bases de dados criadas antes de admitted_at existir em ddl.sql
+alter table tickets add column if not exists admitted_at timestamp;
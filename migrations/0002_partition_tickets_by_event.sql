@@ -0,0 +1,43 @@
+-- Particionar tickets por evento (LIST em event_id)
+--
+-- Queries por evento passam a tocar numa só partição e um evento antigo pode
+-- ser retirado com DETACH PARTITION (python migrate.py detach-event <id>)
+-- sem UPDATE/DELETE sobre a tabela inteira. A chave primária passa a incluir
+-- event_id (exigência do particionamento); o id continua único pela sequência.
+
+alter table tickets rename to tickets_legacy;
+alter sequence tickets_id_seq owned by none;
+
+create table tickets (like tickets_legacy including defaults) partition by list (event_id);
+
+-- Partição por omissão para bilhetes de eventos sem partição própria
+create table tickets_default partition of tickets default;
+
+create function create_ticket_partition(p_event_id integer) returns void as $$
+begin
+    execute format(
+        'create table if not exists %I partition of tickets for values in (%s)',
+        'tickets_event_' || p_event_id, p_event_id
+    );
+end
+$$ language plpgsql;
+
+create function events_create_ticket_partition() returns trigger as $$
+begin
+    perform create_ticket_partition(new.id);
+    return new;
+end
+$$ language plpgsql;
+
+create trigger events_create_ticket_partition
+    after insert on events
+    for each row execute function events_create_ticket_partition();
+
+select create_ticket_partition(id) from events;
+
+insert into tickets select * from tickets_legacy;
+drop table tickets_legacy;
+
+alter sequence tickets_id_seq owned by tickets.id;
+alter table tickets add primary key (id, event_id);
+alter table tickets add foreign key (event_id) references events(id);
@@ -0,0 +1,7 @@
+-- Índices secundários (criados no pai, propagam-se a todas as partições)
+--
+-- event_id não precisa de índice: o particionamento por evento já faz o
+-- pruning. Lookups por id usam a chave primária (id, event_id) de cada partição.
+create index tickets_seat_node_id_idx on tickets (seat_node_id);
+create index tickets_sector_id_idx on tickets (sector_id);
+create index tickets_gate_id_idx on tickets (gate_id);
@@ -0,0 +1,6 @@
+-- Lookup de lugares por prefixo do seat_node_id (ex: todos os lugares de
+-- "Seat-Norte-T0-"). Com text_pattern_ops o índice serve tanto igualdades
+-- como LIKE 'prefixo%', independentemente da collation da base de dados,
+-- pelo que substitui o índice simples de 0003.
+drop index tickets_seat_node_id_idx;
+create index tickets_seat_node_id_pattern_idx on tickets (event_id, seat_node_id text_pattern_ops);
@@ -0,0 +1,22 @@
+-- Versão da linha para ETags e pedidos condicionais (If-None-Match)
+--
+-- O trigger incrementa version e atualiza updated_at em qualquer UPDATE
+-- que altere a linha, venha da API, de scripts ou de SQL manual. UPDATEs
+-- que não mudam nada (ex: reservar um lugar já ocupado) não criam versão.
+alter table tickets add column if not exists version bigint not null default 1;
+alter table tickets add column if not exists updated_at timestamp not null default localtimestamp;
+
+create or replace function bump_ticket_version() returns trigger
+language plpgsql as $$
+begin
+    new.version := old.version + 1;
+    new.updated_at := localtimestamp;
+    return new;
+end;
+$$;
+
+create trigger tickets_bump_version
+    before update on tickets
+    for each row
+    when (old.* is distinct from new.*)
+    execute function bump_ticket_version();
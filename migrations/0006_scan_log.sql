@@ -0,0 +1,18 @@
+-- Auditoria de scans e admissões (só inserções, escrita em lote via COPY)
+--
+-- Sem chave primária nem foreign keys para manter o COPY barato; o índice
+-- BRIN em scanned_at é minúsculo numa tabela append-only e serve as
+-- análises por intervalo de tempo (ex: entradas por porta e por minuto).
+create table scan_log (
+    scanned_at timestamp not null,
+    source varchar(20) not null,
+    token varchar(64),
+    ticket_id integer,
+    event_id integer,
+    gate_id varchar(50),
+    client varchar(64),
+    result varchar(20) not null
+);
+
+create index scan_log_scanned_at_brin on scan_log using brin (scanned_at);
+create index scan_log_ticket_id_idx on scan_log (ticket_id);
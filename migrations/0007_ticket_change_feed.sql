@@ -0,0 +1,48 @@
+-- Feed de alterações para os bundles offline das portas
+--
+-- change_xid guarda o id da transação que criou ou alterou a linha pela
+-- última vez. Um snapshot lido com cursor C = pg_snapshot_xmin(snapshot)
+-- já inclui todas as transações com id < C, pelo que o que mudou depois
+-- são exatamente as linhas com change_xid >= C (algumas podem vir
+-- repetidas, o que é inofensivo). As linhas existentes ficam com '1',
+-- anterior a qualquer cursor; o default volátil só se aplica a linhas novas
+-- e não obriga a reescrever a tabela.
+alter table tickets add column if not exists change_xid xid8 not null default '1';
+alter table tickets alter column change_xid set default pg_current_xact_id();
+
+create index if not exists tickets_event_change_xid_idx on tickets (event_id, change_xid);
+
+create or replace function bump_ticket_version() returns trigger
+language plpgsql as $$
+begin
+    new.version := old.version + 1;
+    new.updated_at := localtimestamp;
+    new.change_xid := pg_current_xact_id();
+    return new;
+end;
+$$;
+
+-- Bilhetes apagados: as portas têm de os retirar do bundle
+create table if not exists ticket_tombstones (
+    ticket_id integer not null,
+    event_id integer not null,
+    change_xid xid8 not null default pg_current_xact_id(),
+    deleted_at timestamp not null default localtimestamp
+);
+
+create index if not exists ticket_tombstones_event_change_xid_idx on ticket_tombstones (event_id, change_xid);
+
+-- Trigger por instrução: um DELETE de muitos bilhetes é um só INSERT
+create or replace function record_ticket_tombstones() returns trigger
+language plpgsql as $$
+begin
+    insert into ticket_tombstones (ticket_id, event_id) select id, event_id from deleted_tickets;
+    return null;
+end;
+$$;
+
+create trigger tickets_record_tombstones
+    after delete on tickets
+    referencing old table as deleted_tickets
+    for each statement
+    execute function record_ticket_tombstones();
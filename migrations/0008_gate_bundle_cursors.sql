@@ -0,0 +1,16 @@
+-- Cursores dos bundles offline em uso, para limitar a retenção dos tombstones
+--
+-- Cada cursor devolvido por um snapshot ou delta fica registado, e cada
+-- delta pedido com since=cursor atualiza last_used. Um tombstone só é
+-- necessário enquanto houver um cursor em uso do seu evento que lhe seja
+-- anterior; os cursores sem uso há mais de GATE_BUNDLE_CURSOR_TTL_HOURS
+-- expiram e um delta pedido com eles recebe 410 (a porta volta ao snapshot).
+create table if not exists gate_bundle_cursors (
+    event_id integer not null,
+    cursor xid8 not null,
+    last_used timestamp not null default localtimestamp,
+    primary key (event_id, cursor)
+);
+
+create index if not exists gate_bundle_cursors_last_used_idx on gate_bundle_cursors (last_used);
+create index if not exists ticket_tombstones_deleted_at_idx on ticket_tombstones (deleted_at);
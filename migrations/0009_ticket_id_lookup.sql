@@ -0,0 +1,63 @@
+-- Índice global id -> event_id dos bilhetes
+--
+-- Com a chave primária (id, event_id) da migração 0002 o Postgres deixou de
+-- garantir que o id é único, e uma query só por id percorre todas as
+-- partições (o custo cresce com o número de eventos). ticket_ids repõe a
+-- unicidade e permite às queries por id obter primeiro o event_id e ler só
+-- a partição do evento (pruning em execução):
+--
+--     WHERE (id, event_id) = (SELECT id, event_id FROM ticket_ids WHERE id = %s)
+--
+-- É mantida por triggers por instrução (um COPY é um só INSERT em
+-- ticket_ids). Um UPDATE que muda o event_id move a linha de partição sem
+-- disparar os triggers de INSERT/DELETE por instrução, pelo que é tratado à
+-- parte, por linha.
+create table if not exists ticket_ids (
+    id integer primary key,
+    event_id integer not null
+);
+
+insert into ticket_ids (id, event_id) select id, event_id from tickets on conflict do nothing;
+
+create or replace function record_ticket_ids() returns trigger
+language plpgsql as $$
+begin
+    insert into ticket_ids (id, event_id) select id, event_id from new_tickets;
+    return null;
+end;
+$$;
+
+create or replace function forget_ticket_ids() returns trigger
+language plpgsql as $$
+begin
+    delete from ticket_ids using old_tickets where ticket_ids.id = old_tickets.id;
+    return null;
+end;
+$$;
+
+create or replace function move_ticket_id() returns trigger
+language plpgsql as $$
+begin
+    update ticket_ids set event_id = new.event_id where id = old.id;
+    return new;
+end;
+$$;
+
+create trigger tickets_record_ids
+    after insert on tickets
+    referencing new table as new_tickets
+    for each statement
+    execute function record_ticket_ids();
+
+create trigger tickets_forget_ids
+    after delete on tickets
+    referencing old table as old_tickets
+    for each statement
+    execute function forget_ticket_ids();
+
+-- Só para UPDATEs que referem event_id: as admissões não pagam nada
+create trigger tickets_move_id
+    before update of event_id on tickets
+    for each row
+    when (old.event_id is distinct from new.event_id)
+    execute function move_ticket_id();
@@ -0,0 +1,20 @@
+-- Jobs de reset em segundo plano, partilhados por todos os workers
+--
+-- O worker que corre o job atualiza reset/chunks na mesma transação de cada
+-- bloco, pelo que o progresso consultado em qualquer worker é exato. O
+-- cancelamento pedido noutro worker marca cancel_requested, que o worker
+-- do job lê depois de cada bloco.
+create table if not exists reset_jobs (
+    id varchar(32) primary key,
+    filters jsonb not null,
+    chunk_size integer not null,
+    status varchar(16) not null default 'running',
+    reset integer not null default 0,
+    chunks integer not null default 0,
+    error text,
+    cancel_requested boolean not null default false,
+    started_at timestamp not null default localtimestamp,
+    finished_at timestamp
+);
+
+create index if not exists reset_jobs_finished_at_idx on reset_jobs (finished_at);
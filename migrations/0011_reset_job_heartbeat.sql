@@ -0,0 +1,8 @@
+-- Dono e heartbeat dos jobs de reset
+--
+-- O worker que corre o job atualiza heartbeat_at periodicamente. Um job
+-- "running" sem heartbeat recente é de um worker que morreu ou reiniciou a
+-- meio: ao ser consultado passa a "failed", em vez de ficar a correr para
+-- sempre.
+alter table reset_jobs add column if not exists owner varchar(100);
+alter table reset_jobs add column if not exists heartbeat_at timestamp not null default localtimestamp;
@@ -0,0 +1,49 @@
+"""
+Modelos Pydantic partilhados pela API e pelos scripts
+"""
+from dataclasses import dataclass
+from datetime import datetime
+from psycopg.rows import args_row
+from pydantic import BaseModel
+
+class Ticket(BaseModel):
+    id: int
+    event_id: int
+    gates_open: datetime
+    gate_id: str
+    row_id: str
+    seat_id: str
+    sector_id: str
+    ticket_type: str
+    state: bool
+    seat_node_id: str | None = None  # ID do seat no Map-Service (ex: Seat-Norte-T0-R05-12)
+    admitted_at: datetime | None = None  # Momento da primeira entrada
+    version: int | None = None  # Incrementada a cada alteração da linha (ETag)
+    updated_at: datetime | None = None
+
+
+# Caminho rápido de leitura: colunas explícitas, linhas lidas como tuplas e
+# convertidas num registo com slots, serializado diretamente pelo orjson
+# (sem dict intermédio nem validação do response_model).
+TICKET_COLUMNS = tuple(Ticket.model_fields)
+TICKET_SELECT = f"SELECT {', '.join(TICKET_COLUMNS)} FROM tickets"
+
+@dataclass(slots=True)
+class TicketRecord:
+    """Linha de tickets pela ordem de TICKET_COLUMNS"""
+    id: int
+    event_id: int
+    gates_open: datetime
+    gate_id: str
+    row_id: str
+    seat_id: str
+    sector_id: str
+    ticket_type: str
+    state: bool
+    seat_node_id: str | None
+    admitted_at: datetime | None
+    version: int
+    updated_at: datetime
+
+# row_factory do psycopg: constrói o registo a partir dos valores posicionais
+ticket_record = args_row(TicketRecord)
@@ -0,0 +1,112 @@
+"""
+Contadores de ocupação (admitidos vs total) por evento, setor e porta
+
+Cada evento é carregado com uma agregação única na primeira consulta e a
+partir daí os contadores são atualizados incrementalmente pelas escritas da
+API (criação, reserva, admissão, remoção e reset de bilhetes), depois do
+commit. Ler a ocupação não toca na base de dados.
+
+Os contadores são por processo: as escritas dos outros workers chegam pelo
+change_bus, e as feitas diretamente na base de dados só aparecem depois da
+reconciliação periódica, que volta a agregar os eventos carregados e
+substitui os valores em memória.
+"""
+import asyncio
+import os
+from datetime import datetime
+from database import get_db_connection
+
+# Intervalo (segundos) entre reconciliações com a tabela tickets
+OCCUPANCY_RECONCILE_SECONDS = float(os.getenv("OCCUPANCY_RECONCILE_SECONDS", "30"))
+
+OCCUPANCY_SQL = """
+SELECT sector_id, gate_id, count(*) AS total, count(*) FILTER (WHERE state) AS admitted
+FROM tickets WHERE event_id = %s
+GROUP BY sector_id, gate_id
+"""
+
+
+class EventOccupancy:
+    """Contadores de um evento por célula (setor, porta)"""
+    __slots__ = ("event_id", "cells", "reconciled_at")
+
+    def __init__(self, event_id: int, rows: list[dict]):
+        self.event_id = event_id
+        # (sector_id, gate_id) -> [total, admitidos]
+        self.cells = {(row["sector_id"], row["gate_id"]): [row["total"], row["admitted"]] for row in rows}
+        self.reconciled_at = datetime.now()
+
+    def add(self, sector_id: str, gate_id: str, total: int, admitted: int):
+        cell = self.cells.setdefault((sector_id, gate_id), [0, 0])
+        cell[0] += total
+        cell[1] += admitted
+
+    def summary(self) -> dict:
+        sectors = {}
+        gates = {}
+        total = admitted = 0
+        for (sector_id, gate_id), (cell_total, cell_admitted) in self.cells.items():
+            for group, key in ((sectors, sector_id), (gates, gate_id)):
+                counts = group.setdefault(key, {"total": 0, "admitted": 0})
+                counts["total"] += cell_total
+                counts["admitted"] += cell_admitted
+            total += cell_total
+            admitted += cell_admitted
+        return {
+            "event_id": self.event_id,
+            "total": total,
+            "admitted": admitted,
+            "sectors": sectors,
+            "gates": gates,
+            "reconciled_at": self.reconciled_at,
+        }
+
+
+class OccupancyCounters:
+    """Contadores dos eventos já consultados; eventos não carregados são ignorados nas escritas"""
+
+    def __init__(self):
+        self.events: dict[int, EventOccupancy] = {}
+
+    async def load_event(self, event_id: int) -> EventOccupancy:
+        async with get_db_connection() as conn:
+            cursor = await conn.execute(OCCUPANCY_SQL, (event_id,))
+            rows = await cursor.fetchall()
+        occupancy = EventOccupancy(event_id, rows)
+        self.events[event_id] = occupancy
+        return occupancy
+
+    async def get(self, event_id: int) -> EventOccupancy:
+        occupancy = self.events.get(event_id)
+        if occupancy is None:
+            occupancy = await self.load_event(event_id)
+        return occupancy
+
+    def apply(self, ticket: dict, total: int = 0, admitted: int = 0):
+        """Aplica a variação de um bilhete (precisa de event_id, sector_id e gate_id)"""
+        occupancy = self.events.get(ticket["event_id"])
+        if occupancy is not None:
+            occupancy.add(ticket["sector_id"], ticket["gate_id"], total, admitted)
+
+    def invalidate(self, event_id: int = None):
+        """Esquece um evento (ou todos); é recarregado na próxima consulta"""
+        if event_id is None:
+            self.events.clear()
+        else:
+            self.events.pop(event_id, None)
+
+    async def reconcile(self):
+        for event_id in list(self.events):
+            await self.load_event(event_id)
+
+
+occupancy = OccupancyCounters()
+
+async def reconcile_loop():
+    """Tarefa de fundo que corrige desvios dos contadores em memória"""
+    while True:
+        await asyncio.sleep(OCCUPANCY_RECONCILE_SECONDS)
+        try:
+            await occupancy.reconcile()
+        except Exception as e:
+            print(f"Erro ao reconciliar contadores de ocupação: {e}")
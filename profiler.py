@@ -0,0 +1,98 @@
+"""
+Profiler de amostragem ligado e desligado em runtime (POST/DELETE /debug/profiler)
+
+Uma thread em segundo plano lê a stack da thread do event loop
+(sys._current_frames) a cada intervalo e conta as stacks distintas. Não
+instrumenta chamadas, pelo que o custo é fixo por amostra e não depende do
+tráfego; desligado não custa nada. O resultado sai no formato "collapsed"
+(frame;frame;frame contagem), aceite por flamegraph.pl e speedscope.
+
+Só disponível com PROFILER_ENABLED=true e com um só worker (API_WORKERS=1):
+o profiler amostra o processo que responde, e com vários workers o start e
+o stop podiam calhar a processos diferentes. Cada sessão para sozinha ao
+fim de PROFILER_MAX_SECONDS.
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "false").lower() == "true"
+PROFILER_INTERVAL_MS = float(os.getenv("PROFILER_INTERVAL_MS", "5"))
+PROFILER_MAX_SECONDS = float(os.getenv("PROFILER_MAX_SECONDS", "60"))
+# Profundidade máxima de cada stack amostrada
+PROFILER_MAX_DEPTH = 64
+
+
+def _collapse(frame, max_depth: int = PROFILER_MAX_DEPTH) -> str:
+    names = []
+    while frame is not None and len(names) < max_depth:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class SamplingProfiler:
+    """Amostra periodicamente a stack de uma thread (por omissão a que chama start)"""
+
+    def __init__(self):
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.started_at: float | None = None
+        self.interval = PROFILER_INTERVAL_MS / 1000
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval_ms: float = PROFILER_INTERVAL_MS, max_seconds: float = PROFILER_MAX_SECONDS,
+              thread_id: int | None = None):
+        """Começa uma sessão nova (descarta as amostras anteriores)"""
+        if self.running:
+            raise RuntimeError("Profiler already running")
+        self.stacks = Counter()
+        self.samples = 0
+        self.interval = interval_ms / 1000
+        self.started_at = time.monotonic()
+        self._stop.clear()
+        target = thread_id if thread_id is not None else threading.get_ident()
+        self._thread = threading.Thread(target=self._run, args=(target, max_seconds),
+                                        name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def _run(self, target: int, max_seconds: float):
+        deadline = time.monotonic() + max_seconds
+        while not self._stop.wait(self.interval) and time.monotonic() < deadline:
+            frame = sys._current_frames().get(target)
+            if frame is None:
+                break
+            self.stacks[_collapse(frame)] += 1
+            self.samples += 1
+            del frame
+
+    def stop(self) -> str:
+        """Para a sessão (se ainda estiver a correr) e devolve as stacks no formato collapsed"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        return self.collapsed()
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def stats(self) -> dict:
+        return {
+            "enabled": PROFILER_ENABLED,
+            "running": self.running,
+            "interval_ms": self.interval * 1000,
+            "samples": self.samples,
+            "stacks": len(self.stacks),
+        }
+
+
+profiler = SamplingProfiler()
@@ -0,0 +1,150 @@
+"""
+Tokens seguros dos QR codes (assinatura HMAC-SHA256)
+
+v1 (legado): "{ticket_id}:{hmac_hex[:16]}" assinado com QR_SECRET.
+
+v2: 15 bytes em base32 (24 caracteres A-Z2-7, sem padding), todos no modo
+alfanumérico do QR, o que cabe num QR versão 1-L (até 25 caracteres) e
+acelera a leitura na catraca:
+
+    byte 0      versão (4 bits altos) | índice da chave (4 bits baixos)
+    bytes 1-2   event_id  (uint16)
+    bytes 3-6   ticket_id (uint32)
+    bytes 7-14  HMAC-SHA256 dos bytes 0-6, truncado a 64 bits
+
+Rotação de chaves: QR_KEYS="1:segredo-a,2:segredo-b" define as chaves
+aceites na validação e QR_ACTIVE_KEY a usada para assinar. Sem QR_KEYS é
+usada a chave 0 = QR_SECRET. O estado HMAC de cada chave é pré-calculado
+e copiado a cada assinatura/verificação.
+"""
+import base64
+import hashlib
+import hmac
+import os
+import struct
+from dotenv import load_dotenv
+
+load_dotenv()
+
+QR_SECRET = os.getenv("QR_SECRET", "change-this-secret-key")
+# Versão dos tokens emitidos quando o event_id é conhecido
+QR_TOKEN_VERSION = int(os.getenv("QR_TOKEN_VERSION", "2"))
+
+# Tokens maiores são rejeitados sem qualquer processamento
+MAX_TOKEN_LENGTH = 64
+V1_SIGNATURE_LENGTH = 16
+V2_VERSION = 2
+V2_PAYLOAD = struct.Struct(">BHI")
+V2_MAC_LENGTH = 8
+V2_TOKEN_LENGTH = 24
+# Alcance dos campos do payload v2 (uint16 / uint32)
+V2_MAX_EVENT_ID = 0xFFFF
+V2_MAX_TICKET_ID = 0xFFFFFFFF
+
+
+class InvalidQRToken(ValueError):
+    """Token mal formado"""
+
+class InvalidQRSignature(InvalidQRToken):
+    """Token bem formado mas com assinatura inválida"""
+
+
+def parse_keys(spec: str) -> dict[int, bytes]:
+    """Interpreta QR_KEYS ("indice:segredo,...") com índices entre 0 e 15"""
+    keys = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        index, _, secret = item.partition(":")
+        if not secret or not index.isdigit() or int(index) > 15:
+            raise ValueError(f"Invalid QR_KEYS entry: {item!r}")
+        keys[int(index)] = secret.encode()
+    return keys
+
+QR_KEYS = parse_keys(os.getenv("QR_KEYS", "")) or {0: QR_SECRET.encode()}
+QR_ACTIVE_KEY = int(os.getenv("QR_ACTIVE_KEY", str(max(QR_KEYS))))
+if QR_ACTIVE_KEY not in QR_KEYS:
+    raise ValueError(f"QR_ACTIVE_KEY {QR_ACTIVE_KEY} is not defined in QR_KEYS")
+
+# Estado HMAC pré-calculado (a chave já passou pelo ipad/opad)
+_V1_STATE = hmac.new(QR_SECRET.encode(), digestmod=hashlib.sha256)
+_KEY_STATES = {index: hmac.new(secret, digestmod=hashlib.sha256) for index, secret in QR_KEYS.items()}
+
+
+def _mac(state, message: bytes):
+    mac = state.copy()
+    mac.update(message)
+    return mac
+
+def qr_signature(ticket_id: int) -> str:
+    """Assinatura v1: HMAC hexadecimal truncado a 16 caracteres"""
+    return _mac(_V1_STATE, str(ticket_id).encode()).hexdigest()[:V1_SIGNATURE_LENGTH]
+
+def generate_token_v1(ticket_id: int) -> str:
+    return f"{ticket_id}:{qr_signature(ticket_id)}"
+
+def v2_in_range(ticket_id: int, event_id: int) -> bool:
+    return 0 <= event_id <= V2_MAX_EVENT_ID and 0 <= ticket_id <= V2_MAX_TICKET_ID
+
+def generate_token_v2(ticket_id: int, event_id: int, key_index: int = None) -> str:
+    if key_index is None:
+        key_index = QR_ACTIVE_KEY
+    if not v2_in_range(ticket_id, event_id):
+        raise ValueError("event_id/ticket_id out of range for a v2 token")
+    payload = token_v2_payload(ticket_id, event_id, key_index)
+    return base64.b32encode(payload + token_v2_mac(ticket_id, event_id, key_index)).decode()
+
+def token_v2_payload(ticket_id: int, event_id: int, key_index: int) -> bytes:
+    """Bytes 0-6 do token v2 (a parte assinada)"""
+    return V2_PAYLOAD.pack(V2_VERSION << 4 | key_index, event_id, ticket_id)
+
+def token_v2_mac(ticket_id: int, event_id: int, key_index: int) -> bytes:
+    """MAC (64 bits) que o token v2 do bilhete tem quando assinado com a chave key_index"""
+    payload = token_v2_payload(ticket_id, event_id, key_index)
+    return _mac(_KEY_STATES[key_index], payload).digest()[:V2_MAC_LENGTH]
+
+def decode_token_v2(qr_data: str) -> tuple[int, int, int, bytes]:
+    """Separa um token v2 em (key_index, event_id, ticket_id, mac) sem verificar a assinatura"""
+    if len(qr_data) != V2_TOKEN_LENGTH:
+        raise InvalidQRToken("Invalid QR format")
+    try:
+        raw = base64.b32decode(qr_data.upper())
+    except ValueError:
+        raise InvalidQRToken("Invalid QR format")
+    header, event_id, ticket_id = V2_PAYLOAD.unpack(raw[:V2_PAYLOAD.size])
+    if header >> 4 != V2_VERSION:
+        raise InvalidQRToken("Unsupported QR token version")
+    return header & 0x0F, event_id, ticket_id, raw[V2_PAYLOAD.size:]
+
+def generate_qr_token(ticket_id: int, event_id: int = None) -> str:
+    """Gera o token do QR: v2 quando o evento é conhecido (e QR_TOKEN_VERSION=2), senão v1.
+    Ids fora do alcance do payload v2 ficam em v1"""
+    if event_id is not None and QR_TOKEN_VERSION == 2 and v2_in_range(ticket_id, event_id):
+        return generate_token_v2(ticket_id, event_id)
+    return generate_token_v1(ticket_id)
+
+def parse_qr_token(qr_data: str) -> tuple[int, int | None]:
+    """Valida um token v1 ou v2 e devolve (ticket_id, event_id); event_id é None em v1.
+    Lança InvalidQRToken / InvalidQRSignature"""
+    qr_data = qr_data.strip()
+    if len(qr_data) > MAX_TOKEN_LENGTH:
+        raise InvalidQRToken("Invalid QR format")
+    if ":" in qr_data:
+        parts = qr_data.split(":")
+        if len(parts) != 2:
+            raise InvalidQRToken("Invalid QR format")
+        ticket_id_str, provided_sig = parts
+        try:
+            ticket_id = int(ticket_id_str)
+        except ValueError:
+            raise InvalidQRToken("Invalid ticket ID format")
+        # Comparação segura contra timing attacks
+        if not hmac.compare_digest(provided_sig, qr_signature(ticket_id)):
+            raise InvalidQRSignature("Invalid QR signature")
+        return ticket_id, None
+
+    key_index, event_id, ticket_id, provided_mac = decode_token_v2(qr_data)
+    if key_index not in _KEY_STATES:
+        # Chave desconhecida ou retirada
+        raise InvalidQRSignature("Invalid QR signature")
+    if not hmac.compare_digest(provided_mac, token_v2_mac(ticket_id, event_id, key_index)):
+        raise InvalidQRSignature("Invalid QR signature")
+    return ticket_id, event_id
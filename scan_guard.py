@@ -0,0 +1,112 @@
+"""
+Proteção do caminho de scan contra tráfego inválido
+
+- TTLCache: cache negativa limitada (tokens rejeitados e ids inexistentes),
+  exata para nunca rejeitar por engano o bilhete de um adepto.
+- RateLimiter: token bucket por cliente à frente de validate_qr_token. O
+  cliente é o IP mais o identificador do leitor (X-Device-Id ou X-Gate-Id),
+  para que vários torniquetes atrás do mesmo NAT não partilhem o bucket;
+  com o IP na chave, quem forje o identificador de outra porta não lhe gasta
+  os tokens. Os scans em lote têm um bucket próprio, cobrado por pedido: um
+  lote completo não esgota o limite dos scans unitários.
+
+Ambas vivem apenas no event loop, pelo que não precisam de locks.
+
+O limite por cliente é por worker e não é dividido por API_WORKERS: um
+leitor mantém a conexão keep-alive num só worker, pelo que fica com
+SCAN_RATE_LIMIT; só um cliente que abra uma conexão por pedido pode chegar
+a API_WORKERS x SCAN_RATE_LIMIT. Partilhá-lo entre workers obrigaria a ir
+à base de dados em cada scan, antes mesmo de validar o token.
+"""
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+
+NEGATIVE_CACHE_SIZE = int(os.getenv("NEGATIVE_CACHE_SIZE", "100000"))
+NEGATIVE_CACHE_TTL = float(os.getenv("NEGATIVE_CACHE_TTL", "60"))
+# Scans por segundo e rajada máxima por cliente (0 desativa o limite)
+SCAN_RATE_LIMIT = float(os.getenv("SCAN_RATE_LIMIT", "100"))
+SCAN_RATE_BURST = float(os.getenv("SCAN_RATE_BURST", "200"))
+# Pedidos de scan em lote por segundo e rajada por cliente (cada pedido até MAX_BATCH_SCAN tokens)
+SCAN_BATCH_RATE_LIMIT = float(os.getenv("SCAN_BATCH_RATE_LIMIT", "5"))
+SCAN_BATCH_RATE_BURST = float(os.getenv("SCAN_BATCH_RATE_BURST", "10"))
+SCAN_RATE_MAX_CLIENTS = 10000
+
+
+class TTLCache:
+    """Cache com expiração e número máximo de entradas (remove as mais antigas)"""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable):
+        return self.get(key) is not None
+
+    def get(self, key: Hashable) -> Any | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires < time.monotonic():
+            del self._entries[key]
+            return None
+        return value
+
+    def put(self, key: Hashable, value: Any = True):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def discard(self, key: Hashable):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+
+class RateLimiter:
+    """Token bucket por cliente; os clientes inativos há mais tempo são esquecidos"""
+
+    def __init__(self, rate: float, burst: float, max_clients: int = SCAN_RATE_MAX_CLIENTS):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets: OrderedDict = OrderedDict()
+
+    def acquire(self, client: str, cost: float = 1) -> float:
+        """Consome cost tokens; devolve 0 se permitido, senão os segundos até haver tokens.
+        Pedidos em lote maiores que a rajada passam com o bucket cheio e deixam-no em dívida"""
+        if self.rate <= 0:
+            return 0
+        now = time.monotonic()
+        tokens, last = self._buckets.pop(client, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - last) * self.rate)
+        needed = min(cost, self.burst)
+        wait = 0.0
+        if tokens >= needed:
+            tokens -= cost
+        else:
+            wait = (needed - tokens) / self.rate
+        self._buckets[client] = (tokens, now)
+        while len(self._buckets) > self.max_clients:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+# Tokens rejeitados -> (status_code, detail)
+rejected_tokens = TTLCache(NEGATIVE_CACHE_SIZE, NEGATIVE_CACHE_TTL)
+# ticket_ids com assinatura válida mas inexistentes na base de dados
+missing_tickets = TTLCache(NEGATIVE_CACHE_SIZE, NEGATIVE_CACHE_TTL)
+scan_rate_limiter = RateLimiter(SCAN_RATE_LIMIT, SCAN_RATE_BURST)
+batch_scan_rate_limiter = RateLimiter(SCAN_BATCH_RATE_LIMIT, SCAN_BATCH_RATE_BURST)
+
+def retry_after(wait: float) -> str:
+    return str(max(1, math.ceil(wait)))
@@ -0,0 +1,114 @@
+"""
+Registo de auditoria dos scans e admissões (write-behind)
+
+Cada tentativa é acrescentada a um buffer circular em memória, sem I/O no
+caminho do scan, e escrita na tabela scan_log em lotes via COPY: quando o
+buffer atinge SCAN_LOG_BATCH_SIZE entradas ou a cada
+SCAN_LOG_FLUSH_SECONDS, e uma última vez no shutdown. O buffer é limitado
+a SCAN_LOG_BUFFER_SIZE entradas; se a base de dados não acompanhar, as
+entradas mais antigas são descartadas (e contadas) em vez de a memória
+crescer.
+"""
+import asyncio
+import os
+from collections import deque
+from datetime import datetime
+from database import get_db_connection
+
+SCAN_LOG_ENABLED = os.getenv("SCAN_LOG_ENABLED", "true").lower() == "true"
+SCAN_LOG_BUFFER_SIZE = int(os.getenv("SCAN_LOG_BUFFER_SIZE", "100000"))
+SCAN_LOG_BATCH_SIZE = int(os.getenv("SCAN_LOG_BATCH_SIZE", "1000"))
+SCAN_LOG_FLUSH_SECONDS = float(os.getenv("SCAN_LOG_FLUSH_SECONDS", "1"))
+
+# Tamanho das colunas de texto (valores vindos do cliente são truncados)
+SCAN_LOG_TEXT_LENGTH = {"token": 64, "gate_id": 50, "client": 64}
+
+SCAN_LOG_COLUMNS = ("scanned_at", "source", "token", "ticket_id", "event_id", "gate_id", "client", "result")
+COPY_SQL = f"COPY scan_log ({', '.join(SCAN_LOG_COLUMNS)}) FROM STDIN"
+
+
+class ScanLog:
+    """Buffer circular de entradas de auditoria com flush em lote"""
+
+    def __init__(self, buffer_size: int = SCAN_LOG_BUFFER_SIZE, batch_size: int = SCAN_LOG_BATCH_SIZE,
+                 enabled: bool = SCAN_LOG_ENABLED):
+        self.enabled = enabled
+        self.batch_size = batch_size
+        self.entries: deque = deque(maxlen=buffer_size)
+        self.written = 0
+        self.dropped = 0
+        self.failed_flushes = 0
+        self._flush_task: asyncio.Task | None = None
+
+    def record(self, source: str, result: str, token: str = None, ticket_id: int = None,
+               event_id: int = None, gate_id: str = None, client: str = None):
+        """Acrescenta uma tentativa (O(1), sem await)"""
+        if not self.enabled:
+            return
+        if len(self.entries) == self.entries.maxlen:
+            self.dropped += 1
+        self.entries.append((
+            datetime.now(), source, token and token[:SCAN_LOG_TEXT_LENGTH["token"]], ticket_id, event_id,
+            gate_id and gate_id[:SCAN_LOG_TEXT_LENGTH["gate_id"]], client and client[:SCAN_LOG_TEXT_LENGTH["client"]],
+            result
+        ))
+        if len(self.entries) >= self.batch_size and self._flush_task is None:
+            # Gatilho por tamanho: flush em segundo plano, o pedido não espera
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_in_background())
+
+    async def _flush_in_background(self):
+        try:
+            await self.flush()
+        except Exception as e:
+            print(f"Erro ao escrever scan_log: {e}")
+        finally:
+            self._flush_task = None
+
+    async def flush(self) -> int:
+        """Escreve o buffer em lotes de batch_size; devolve o número de linhas escritas"""
+        total = 0
+        while self.entries:
+            batch = [self.entries.popleft() for _ in range(min(self.batch_size, len(self.entries)))]
+            try:
+                async with get_db_connection() as conn:
+                    async with conn.cursor() as cursor:
+                        async with cursor.copy(COPY_SQL) as copy:
+                            for entry in batch:
+                                await copy.write_row(entry)
+            except BaseException as e:
+                # Também no cancelamento (shutdown): o lote já saiu do buffer e perdia-se
+                if isinstance(e, Exception):
+                    self.failed_flushes += 1
+                # Devolver o lote à frente do buffer (o que não couber é descartado)
+                space = self.entries.maxlen - len(self.entries)
+                self.dropped += max(0, len(batch) - space)
+                self.entries.extendleft(reversed(batch[:space]))
+                raise
+            total += len(batch)
+            self.written += len(batch)
+        return total
+
+    async def close(self):
+        """Flush final no shutdown (antes de fechar o pool)"""
+        if self._flush_task is not None:
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+        try:
+            await self.flush()
+        except Exception as e:
+            print(f"Erro ao escrever scan_log no shutdown: {e}")
+
+    def stats(self) -> dict:
+        return {"buffered": len(self.entries), "written": self.written,
+                "dropped": self.dropped, "failed_flushes": self.failed_flushes}
+
+
+scan_log = ScanLog()
+
+async def flush_loop():
+    """Gatilho por tempo do flush"""
+    while True:
+        await asyncio.sleep(SCAN_LOG_FLUSH_SECONDS)
+        try:
+            await scan_log.flush()
+        except Exception as e:
+            print(f"Erro ao escrever scan_log: {e}")
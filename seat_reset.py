@@ -0,0 +1,206 @@
+"""
+Reset de lugares por evento, setor ou porta, executado em blocos
+
+Cada bloco é uma transação curta (UPDATE ... LIMIT via CTE) que só toca em
+bilhetes ainda ocupados, pelo que nunca há um lock sobre a tabela inteira
+e o scan de outros eventos continua enquanto o reset decorre. Os resets
+longos podem correr como job em segundo plano, com progresso consultável
+e cancelamento entre blocos. O job corre no worker que o criou, mas o seu
+estado vive na tabela reset_jobs: o progresso é atualizado na transação de
+cada bloco e qualquer worker o consulta ou pede o cancelamento (visto pelo
+worker do job no fim do bloco em curso; no próprio worker o bloco em curso
+é revertido). O worker do job fica registado (owner) e renova heartbeat_at;
+um job a correr sem heartbeat há RESET_JOB_STALE_SECONDS é de um worker que
+morreu ou reiniciou e passa a "failed" quando é consultado.
+"""
+import asyncio
+import os
+import uuid
+from datetime import datetime
+from psycopg.types.json import Jsonb
+from change_bus import change_bus, RESET, WORKER_ID
+from database import get_db_connection
+
+RESET_CHUNK_SIZE = int(os.getenv("RESET_CHUNK_SIZE", "5000"))
+# Jobs terminados mantidos para consulta
+MAX_FINISHED_RESET_JOBS = 100
+# Intervalo do heartbeat dos jobs e idade a partir da qual o worker do job é dado como morto
+RESET_JOB_HEARTBEAT_SECONDS = float(os.getenv("RESET_JOB_HEARTBEAT_SECONDS", "5"))
+RESET_JOB_STALE_SECONDS = float(os.getenv("RESET_JOB_STALE_SECONDS", "60"))
+
+RESET_FILTERS = ("event_id", "sector_id", "gate_id")
+
+
+def build_reset_sql(filters: dict) -> tuple[str, list]:
+    """UPDATE de um bloco de bilhetes ocupados que respeitam os filtros"""
+    conditions = ["state"]
+    params = []
+    for column in RESET_FILTERS:
+        if filters.get(column) is not None:
+            conditions.append(f"{column} = %s")
+            params.append(filters[column])
+    sql = f"""
+        WITH chunk AS (
+            SELECT id, event_id FROM tickets
+            WHERE {' AND '.join(conditions)}
+            LIMIT %s
+            FOR UPDATE
+        )
+        UPDATE tickets SET state = false, admitted_at = NULL
+        FROM chunk
+        WHERE tickets.id = chunk.id AND tickets.event_id = chunk.event_id
+        RETURNING tickets.id, tickets.event_id, tickets.sector_id, tickets.gate_id, tickets.seat_node_id
+    """
+    return sql, params
+
+
+INSERT_JOB_SQL = "INSERT INTO reset_jobs (id, filters, chunk_size, started_at, owner) VALUES (%s, %s, %s, %s, %s)"
+# Na transação do bloco: o progresso guardado corresponde sempre ao que foi confirmado
+PROGRESS_SQL = """
+UPDATE reset_jobs SET reset = reset + %s, chunks = chunks + 1, heartbeat_at = localtimestamp
+WHERE id = %s RETURNING cancel_requested
+"""
+HEARTBEAT_SQL = "UPDATE reset_jobs SET heartbeat_at = localtimestamp WHERE id = %s AND status = 'running'"
+# Antes de consultar ou cancelar: um job sem heartbeat recente já não está a correr
+RECLAIM_JOB_SQL = """
+UPDATE reset_jobs SET status = 'failed', finished_at = localtimestamp,
+    error = 'worker ' || coalesce(owner, '?') || ' stopped before finishing the reset'
+WHERE id = %s AND status = 'running' AND heartbeat_at < localtimestamp - %s * interval '1 second'
+"""
+FINISH_JOB_SQL = "UPDATE reset_jobs SET status = %s, error = %s, finished_at = localtimestamp WHERE id = %s"
+PRUNE_JOBS_SQL = """
+DELETE FROM reset_jobs WHERE finished_at IS NOT NULL AND id NOT IN (
+    SELECT id FROM reset_jobs WHERE finished_at IS NOT NULL ORDER BY finished_at DESC LIMIT %s
+)
+"""
+GET_JOB_SQL = """
+SELECT id AS job_id, filters, status, reset, chunks, error, owner, started_at, heartbeat_at, finished_at
+FROM reset_jobs WHERE id = %s
+"""
+# Devolve o estado anterior ao pedido (só os jobs a correr ficam marcados)
+CANCEL_JOB_SQL = """
+WITH job AS (SELECT id, status FROM reset_jobs WHERE id = %s FOR UPDATE),
+cancel AS (
+    UPDATE reset_jobs SET cancel_requested = true FROM job
+    WHERE reset_jobs.id = job.id AND job.status = 'running'
+)
+SELECT status FROM job
+"""
+
+
+class ResetCancelled(Exception):
+    """Cancelamento pedido (possivelmente por outro worker) visto entre blocos"""
+
+
+class ResetJob:
+    """Estado de um reset (também usado no modo síncrono para contar o progresso)"""
+
+    def __init__(self, filters: dict, chunk_size: int, stored: bool = False):
+        self.id = uuid.uuid4().hex
+        # Job em segundo plano: progresso e cancelamento na tabela reset_jobs
+        self.stored = stored
+        self.filters = filters
+        self.chunk_size = chunk_size
+        self.status = "running"
+        self.reset = 0
+        self.chunks = 0
+        self.error = None
+        self.started_at = datetime.now()
+        self.finished_at = None
+
+    def as_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "filters": self.filters,
+            "status": self.status,
+            "reset": self.reset,
+            "chunks": self.chunks,
+            "error": self.error,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+async def reset_seats(job: ResetJob) -> int:
+    """Liberta os lugares bloco a bloco até não restarem bilhetes ocupados"""
+    sql, params = build_reset_sql(job.filters)
+    while True:
+        cancel_requested = False
+        async with get_db_connection() as conn:
+            cursor = await conn.execute(sql, (*params, job.chunk_size))
+            rows = await cursor.fetchall()
+            if job.stored:
+                cursor = await conn.execute(PROGRESS_SQL, (len(rows), job.id))
+                cancel_requested = (await cursor.fetchone())["cancel_requested"]
+        # Depois do commit: índice de admissão, ocupação e stream coerentes neste e nos outros workers
+        change_bus.publish(RESET, rows)
+        job.reset += len(rows)
+        job.chunks += 1
+        if len(rows) < job.chunk_size:
+            return job.reset
+        if cancel_requested:
+            raise ResetCancelled()
+        # Ceder o event loop entre blocos (e ponto de cancelamento)
+        await asyncio.sleep(0)
+
+
+# Tarefas dos jobs que correm neste worker (cancelamento imediato)
+_job_tasks: dict[str, asyncio.Task] = {}
+
+async def _heartbeat(job: ResetJob):
+    """Renova heartbeat_at enquanto o job corre (também durante um bloco demorado)"""
+    while True:
+        await asyncio.sleep(RESET_JOB_HEARTBEAT_SECONDS)
+        try:
+            async with get_db_connection() as conn:
+                await conn.execute(HEARTBEAT_SQL, (job.id,))
+        except Exception as e:
+            print(f"Erro ao renovar o heartbeat do reset {job.id}: {e}")
+
+async def _run_job(job: ResetJob):
+    heartbeat = asyncio.create_task(_heartbeat(job))
+    try:
+        await reset_seats(job)
+        job.status = "done"
+    except (asyncio.CancelledError, ResetCancelled):
+        job.status = "cancelled"
+    except Exception as e:
+        job.status = "failed"
+        job.error = str(e)
+    finally:
+        heartbeat.cancel()
+        _job_tasks.pop(job.id, None)
+        job.finished_at = datetime.now()
+        try:
+            async with get_db_connection() as conn:
+                await conn.execute(FINISH_JOB_SQL, (job.status, job.error, job.id))
+                await conn.execute(PRUNE_JOBS_SQL, (MAX_FINISHED_RESET_JOBS,))
+        except Exception as e:
+            print(f"Erro ao registar o fim do reset {job.id}: {e}")
+
+async def start_reset_job(filters: dict, chunk_size: int) -> ResetJob:
+    job = ResetJob(filters, chunk_size, stored=True)
+    async with get_db_connection() as conn:
+        await conn.execute(INSERT_JOB_SQL, (job.id, Jsonb(filters), chunk_size, job.started_at, WORKER_ID))
+    _job_tasks[job.id] = asyncio.create_task(_run_job(job))
+    return job
+
+async def get_reset_job(job_id: str) -> dict | None:
+    async with get_db_connection() as conn:
+        await conn.execute(RECLAIM_JOB_SQL, (job_id, RESET_JOB_STALE_SECONDS))
+        cursor = await conn.execute(GET_JOB_SQL, (job_id,))
+        return await cursor.fetchone()
+
+async def cancel_reset_job(job_id: str) -> str | None:
+    """Pede o cancelamento; devolve o estado anterior (None se o job não existir)"""
+    async with get_db_connection() as conn:
+        await conn.execute(RECLAIM_JOB_SQL, (job_id, RESET_JOB_STALE_SECONDS))
+        cursor = await conn.execute(CANCEL_JOB_SQL, (job_id,))
+        row = await cursor.fetchone()
+    if row is None:
+        return None
+    task = _job_tasks.get(job_id)
+    if row["status"] == "running" and task is not None:
+        # Job deste worker: não esperar pelo fim do bloco em curso
+        task.cancel()
+    return row["status"]
@@ -1,49 +1,35 @@
 #!/bin/bash
 set -e
 
-# Wait for PostgreSQL
-until PGPASSWORD=$DB_PASSWORD psql -h "$DB_HOST" -U "$DB_USER" -d "$DB_NAME" -c "SELECT 1" > /dev/null 2>&1; do
-  sleep 2
-done
+# Gerar QR codes em segundo plano: a API fica disponível de imediato e a
+# prontidão da base de dados é exposta em /health/ready. O gerador é
+# incremental (manifesto), pelo que um restart só desenha bilhetes novos,
+# e usa o mesmo QR_SECRET que a API. Repete até a base de dados responder.
+# Corre com prioridade baixa (nice) e um só processo (QR_GENERATE_WORKERS):
+# arranca ao mesmo tempo que os workers da API e não lhes deve tirar CPU
+# durante a abertura das portas.
+(
+  until nice -n 10 python3 generate_batch_qr.py --db --workers ${QR_GENERATE_WORKERS:-1} \
+      --output-dir /app/qr_codes > /app/qr_codes/generate.log 2>&1; do
+    sleep 5
+  done
+) &
 
-# Wait for tables
-until PGPASSWORD=$DB_PASSWORD psql -h "$DB_HOST" -U "$DB_USER" -d "$DB_NAME" -c "SELECT 1 FROM tickets LIMIT 1;" > /dev/null 2>&1; do
-  sleep 2
-done
-
-# Generate QR codes
-python3 << 'EOF'
-import os
-import psycopg2
-import qrcode
-import hmac
-import hashlib
-
-def generate_secure_token(ticket_id: int) -> str:
-    secret = os.getenv('QR_SECRET', 'default-secret-key')
-    message = f"{ticket_id}".encode()
-    signature = hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()[:16]
-    return f"{ticket_id}:{signature}"
-
-conn = psycopg2.connect(
-    host=os.getenv('DB_HOST'),
-    database=os.getenv('DB_NAME'),
-    user=os.getenv('DB_USER'),
-    password=os.getenv('DB_PASSWORD'),
-    port=os.getenv('DB_PORT')
-)
-cur = conn.cursor()
-cur.execute("SELECT id FROM tickets")
-ticket_ids = [row[0] for row in cur.fetchall()]
-cur.close()
-conn.close()
-
-os.makedirs('/app/qr_codes', exist_ok=True)
-for ticket_id in ticket_ids:
-    token = generate_secure_token(ticket_id)
-    qr = qrcode.make(token)
-    qr.save(f'/app/qr_codes/ticket_{ticket_id}_qr.png')
-EOF
-
-# Start FastAPI
-exec uvicorn api_handler:app --host 0.0.0.0 --port ${API_PORT:-8000} --reload
+# Start FastAPI: API_RELOAD=true para desenvolvimento (um processo com --reload),
+# senão API_WORKERS processos (por omissão 2, não um por CPU: cada worker
+# abre conexões à base de dados). API_WORKERS é exportado para a aplicação
+# repartir por worker o pool (DB_MAX_CONNECTIONS) e os limites de
+# concorrência. O estado em memória é mantido coerente entre workers pelo
+# change_bus (LISTEN/NOTIFY).
+if [ "${API_RELOAD:-false}" = "true" ]; then
+  export API_WORKERS=1
+  exec uvicorn api_handler:app --host 0.0.0.0 --port ${API_PORT:-8000} --reload
+fi
+export API_WORKERS=${API_WORKERS:-2}
+# Diretório onde cada worker publica as suas métricas: /metrics devolve a soma
+# de todos. Os ficheiros de um arranque anterior são apagados.
+export METRICS_DIR=${METRICS_DIR:-/tmp/ticket-service-metrics}
+mkdir -p "$METRICS_DIR"
+rm -f "$METRICS_DIR"/worker-*.json
+exec uvicorn api_handler:app --host 0.0.0.0 --port ${API_PORT:-8000} \
+  --workers ${API_WORKERS}
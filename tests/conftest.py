@@ -1,4 +1,5 @@
 import pytest
+import asyncio
 import os
 import sys
 import psycopg2
@@ -54,5 +55,51 @@ def setup_database():
     cursor.close()
     conn.close()
     
+    # A API não migra no arranque (MIGRATE_ON_STARTUP=false): aplicar aqui, como no deploy
+    from database import close_db_pool
+    from migrate import apply_migrations
+    
+    async def migrate():
+        try:
+            for name in await apply_migrations():
+                print(f"Migração aplicada: {name}")
+        finally:
+            await close_db_pool()
+    asyncio.run(migrate())
+    
     print("Banco de dados configurado para testes\n")
-    yield
\ No newline at end of file
+    yield
+
+
+@pytest.fixture
+def client():
+    """Cliente da API; o context manager corre o lifespan (abre/fecha o pool assíncrono no mesmo event loop)"""
+    from fastapi.testclient import TestClient
+    from api_handler import app
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+def connect(autocommit: bool = True):
+    """Conexão psycopg2 à base de dados de teste (fora do pool da API)"""
+    conn = psycopg2.connect(
+        host=os.getenv('DB_HOST', 'localhost'),
+        database=os.getenv('DB_NAME', 'test_db'),
+        user=os.getenv('DB_USER', 'test_user'),
+        password=os.getenv('DB_PASSWORD', 'test_password'),
+        port=os.getenv('DB_PORT', 5432)
+    )
+    conn.autocommit = autocommit
+    return conn
+
+
+def run_async(coro):
+    """Executa uma coroutine com um pool próprio (fechado no fim)"""
+    from database import close_db_pool
+
+    async def runner():
+        try:
+            return await coro
+        finally:
+            await close_db_pool()
+    return asyncio.run(runner())
\ No newline at end of file
@@ -0,0 +1,84 @@
+import pytest
+from datetime import datetime
+from api_handler import generate_qr_token
+from admission_index import AdmissionIndex, EventIndex, admission_index
+
+def make_row(ticket_id: int, state: bool = False) -> dict:
+    return {
+        "id": ticket_id,
+        "event_id": 7,
+        "gates_open": datetime(2024, 9, 15, 19, 0),
+        "gate_id": "Gate A" if ticket_id % 2 else "Gate B",
+        "row_id": f"Row {ticket_id}",
+        "seat_id": f"Seat {ticket_id}",
+        "sector_id": "Norte",
+        "ticket_type": "Standard",
+        "state": state,
+        "seat_node_id": f"Seat-Norte-T0-R{ticket_id:02d}-{ticket_id:02d}",
+        "admitted_at": None,
+    }
+
+@pytest.fixture
+def client(client):
+    yield client
+    admission_index.events.clear()
+
+def test_event_index_lookup():
+    """Testa pesquisa binária e reconstrução da linha a partir do índice compacto"""
+    rows = [make_row(i, state=(i == 5)) for i in (9, 3, 5, 11)]
+    event_index = EventIndex(7, rows)
+    assert len(event_index) == 4
+    assert event_index.position(4) is None
+    pos = event_index.position(5)
+    assert event_index.ticket(pos) == make_row(5, state=True)
+    assert event_index.ticket(event_index.position(11))["gate_id"] == "Gate A"
+
+def test_event_index_state_bits():
+    """Testa alteração de estado, remoção e reset dos bits"""
+    event_index = EventIndex(7, [make_row(i) for i in range(1, 20)])
+    pos = event_index.position(10)
+    event_index.set_state(pos, True)
+    assert event_index.is_admitted(pos)
+    assert not event_index.is_admitted(event_index.position(9))
+    event_index.set_state(pos, False)
+    assert not event_index.is_admitted(pos)
+    event_index.set_state(pos, True)
+    event_index.reset()
+    assert not event_index.is_admitted(pos)
+    event_index.discard(pos)
+    assert event_index.position(10) is None
+
+def test_claim_detects_double_entry():
+    """Testa que a reserva em memória só é concedida uma vez"""
+    index = AdmissionIndex()
+    index.events[7] = EventIndex(7, [make_row(i) for i in range(1, 5)])
+    assert index.claim(99) is None
+    assert index.claim(2) == (False, None)
+    index.set_state(2, True, datetime(2024, 9, 15, 19, 5))
+    assert index.claim(2) == (True, datetime(2024, 9, 15, 19, 5))
+
+def test_scan_served_from_index(client):
+    """Testa scan servido em memória com write-through no reserve"""
+    response = client.post("/events/1/admission-index")
+    assert response.status_code == 200
+    assert response.json()["tickets"] > 0
+    
+    client.patch("/tickets/reset")
+    assert client.put("/ticket/2").status_code == 200
+    assert admission_index.get(2)["state"] is True
+    
+    response = client.get(f"/ticket/scan/{generate_qr_token(2)}")
+    assert response.status_code == 200
+    assert response.json()["state"] is True
+    
+    assert client.delete("/events/1/admission-index").status_code == 200
+    assert client.delete("/events/1/admission-index").status_code == 404
+
+def test_admit_from_index(client):
+    """Testa admissão com o evento em memória: a repetição não chega à base de dados"""
+    client.patch("/tickets/reset")
+    client.post("/events/1/admission-index")
+    first = client.post("/ticket/6/admit").json()
+    assert first["status"] == "admitted"
+    second = client.post("/ticket/6/admit").json()
+    assert second == {**first, "status": "already_used"}
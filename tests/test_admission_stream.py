@@ -0,0 +1,65 @@
+import asyncio
+import json
+from admission_stream import AdmissionBroadcaster, sse_events, RESYNC
+
+def seat(ticket_id: int, event_id: int = 1) -> dict:
+    return {"id": ticket_id, "event_id": event_id, "seat_node_id": f"Seat-Sul-T0-R01-{ticket_id:02d}",
+            "sector_id": "Sul", "gate_id": "Gate A"}
+
+def test_changes_coalesced_in_window():
+    """Testa que as mudanças de uma janela chegam num só lote, com o último estado de cada bilhete"""
+    async def scenario():
+        broadcaster = AdmissionBroadcaster(window_ms=10)
+        everything = broadcaster.subscribe()
+        other_event = broadcaster.subscribe(event_id=2)
+        broadcaster.publish(seat(1), True)
+        broadcaster.publish(seat(2), True)
+        broadcaster.publish(seat(1), False)
+        batch = await asyncio.wait_for(everything.queue.get(), 1)
+        return batch, other_event.queue.qsize()
+    
+    batch, other_pending = asyncio.run(scenario())
+    assert batch["type"] == "admissions"
+    assert [(c["ticket_id"], c["state"]) for c in batch["changes"]] == [(1, False), (2, True)]
+    assert batch["changes"][1]["seat_node_id"] == "Seat-Sul-T0-R01-02"
+    assert other_pending == 0
+
+def test_slow_subscriber_gets_resync():
+    """Testa que um subscritor lento não acumula lotes e recebe um pedido de resync"""
+    async def scenario():
+        broadcaster = AdmissionBroadcaster(window_ms=1, queue_size=2)
+        slow = broadcaster.subscribe()
+        for ticket_id in range(5):
+            broadcaster.publish(seat(ticket_id), True)
+            broadcaster.flush()
+        return [slow.queue.get_nowait() for _ in range(slow.queue.qsize())], slow.dropped
+    
+    messages, dropped = asyncio.run(scenario())
+    assert RESYNC in messages
+    assert len(messages) <= 2
+    assert dropped >= 2
+
+def test_sse_format_and_unsubscribe():
+    """Testa o formato SSE, o keepalive e a remoção do subscritor no fim"""
+    async def scenario():
+        broadcaster = AdmissionBroadcaster(window_ms=1)
+        subscriber = broadcaster.subscribe()
+        stream = sse_events(subscriber, broadcaster, keepalive=0.01)
+        keepalive = await stream.__anext__()
+        broadcaster.publish(seat(7), True)
+        event = await stream.__anext__()
+        await stream.aclose()
+        return keepalive, event, len(broadcaster.subscribers)
+    
+    keepalive, event, remaining = asyncio.run(scenario())
+    assert keepalive == ": keepalive\n\n"
+    name, data = event.strip().split("\n")
+    assert name == "event: admissions"
+    assert json.loads(data[len("data: "):])["changes"][0]["ticket_id"] == 7
+    assert remaining == 0
+
+def test_publish_without_subscribers_is_noop():
+    """Testa que sem subscritores nada fica pendente"""
+    broadcaster = AdmissionBroadcaster()
+    broadcaster.publish(seat(1), True)
+    assert broadcaster._pending == {}
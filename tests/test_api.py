@@ -3,14 +3,8 @@ import json
 import hmac
 import hashlib
 import os
-from fastapi.testclient import TestClient
-from api_handler import app
 
 # Fixture para o cliente de teste
-@pytest.fixture
-def client():
-    return TestClient(app)
-
 # Fixture para secret do QR (deve ser igual ao do ambiente)
 @pytest.fixture
 def qr_secret():
@@ -74,4 +68,302 @@ def test_reset_seats(client):
 def test_ticket_not_found(client):
     """Testa erro quando ticket não existe"""
     response = client.get("/ticket/99999")
-    assert response.status_code == 404
\ No newline at end of file
+    assert response.status_code == 404
+
+def test_pool_timeout_returns_503(client, monkeypatch):
+    """Testa que um pool esgotado devolve 503 com Retry-After"""
+    from contextlib import asynccontextmanager
+    from psycopg_pool import PoolTimeout
+    import api_handler
+
+    @asynccontextmanager
+    async def exhausted_pool(*args, **kwargs):
+        raise PoolTimeout("couldn't get a connection")
+        yield
+
+    monkeypatch.setattr(api_handler, "get_db_connection", exhausted_pool)
+    monkeypatch.setattr(api_handler, "get_read_connection", exhausted_pool)
+    response = client.get("/ticket/1")
+    assert response.status_code == 503
+    assert "Retry-After" in response.headers
+
+def test_batch_scan(client, qr_secret):
+    """Testa scan em lote com tokens válidos, forjados, mal formados e inexistentes"""
+    tokens = [
+        generate_qr_token(1, qr_secret),
+        "1:0000000000000000",
+        "lixo",
+        generate_qr_token(99999, qr_secret),
+        generate_qr_token(1, qr_secret),
+    ]
+    response = client.post("/tickets/scan", json={"tokens": tokens})
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [r["status"] for r in results] == ["ok", "bad_signature", "bad_format", "not_found", "ok"]
+    assert results[0]["ticket"]["id"] == 1
+    assert results[1]["ticket"] is None
+
+def test_batch_scan_empty(client):
+    """Testa que um lote vazio é rejeitado"""
+    response = client.post("/tickets/scan", json={"tokens": []})
+    assert response.status_code == 422
+
+def test_admit_ticket_double_entry(client):
+    """Testa que a segunda entrada é detetada e devolve a hora da primeira"""
+    client.patch("/tickets/reset")
+    first = client.post("/ticket/3/admit")
+    assert first.status_code == 200
+    assert first.json()["status"] == "admitted"
+    
+    second = client.post("/ticket/3/admit")
+    assert second.json()["status"] == "already_used"
+    assert second.json()["admitted_at"] == first.json()["admitted_at"]
+    
+    assert client.post("/ticket/99999/admit").status_code == 404
+
+def test_batch_admit(client):
+    """Testa admissão em lote com repetidos e inexistentes"""
+    client.patch("/tickets/reset")
+    response = client.post("/tickets/admit", json={"ticket_ids": [4, 5, 4, 99999]})
+    assert response.status_code == 200
+    statuses = [r["status"] for r in response.json()["results"]]
+    assert statuses == ["admitted", "admitted", "already_used", "not_found"]
+
+def test_health_endpoints(client):
+    """Testa liveness e readiness com a base de dados disponível"""
+    assert client.get("/health/live").json() == {"status": "alive"}
+    response = client.get("/health/ready")
+    assert response.status_code == 200
+    assert response.json()["status"] == "ready"
+
+def test_ticket_qr_png_and_etag(client):
+    """Testa QR em PNG, cache com ETag e resposta 304"""
+    response = client.get("/ticket/1/qr")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/png"
+    assert response.content.startswith(b"\x89PNG")
+    etag = response.headers["etag"]
+    
+    cached = client.get("/ticket/1/qr", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.content == b""
+
+def test_ticket_qr_svg(client):
+    """Testa QR em SVG e formatos inválidos"""
+    response = client.get("/ticket/1/qr?format=svg")
+    assert response.status_code == 200
+    assert b"<svg" in response.content
+    assert client.get("/ticket/1/qr?format=gif").status_code == 400
+    assert client.get("/ticket/99999/qr").status_code == 404
+
+def test_scan_qr_code_v2(client):
+    """Testa leitura de QR code com token compacto v2"""
+    from qr_tokens import generate_token_v2
+    
+    response = client.get(f"/ticket/scan/{generate_token_v2(1, 1)}")
+    assert response.status_code == 200
+    assert response.json()["id"] == 1
+
+def test_reset_seats_scoped_in_chunks(client):
+    """Testa reset por evento em blocos, sem tocar em bilhetes já livres"""
+    client.patch("/tickets/reset")
+    client.post("/tickets/admit", json={"ticket_ids": [1, 2, 3]})
+    
+    response = client.patch("/tickets/reset?event_id=1&chunk_size=2")
+    assert response.status_code == 200
+    assert response.json()["message"] == "Reset 3 tickets to unoccupied"
+    assert response.json()["chunks"] == 2
+    assert client.get("/ticket/1").json()["state"] is False
+    
+    # Já não há lugares ocupados: nada a fazer
+    assert client.patch("/tickets/reset?event_id=1").json()["message"] == "Reset 0 tickets to unoccupied"
+    client.post("/tickets/admit", json={"ticket_ids": [1, 2]})
+    assert client.patch("/tickets/reset?sector_id=Sul&gate_id=Gate A").json()["message"] == "Reset 1 tickets to unoccupied"
+    assert client.patch("/tickets/reset?chunk_size=0").status_code == 400
+
+def test_reset_job_progress(client):
+    """Testa reset em segundo plano com consulta de progresso"""
+    import time
+    client.post("/tickets/admit", json={"ticket_ids": [1, 2]})
+    response = client.post("/tickets/reset-jobs?event_id=1&chunk_size=1")
+    assert response.status_code == 202
+    job_id = response.json()["job_id"]
+    
+    for _ in range(50):
+        job = client.get(f"/tickets/reset-jobs/{job_id}").json()
+        if job["status"] != "running":
+            break
+        time.sleep(0.05)
+    assert job["status"] == "done"
+    assert job["reset"] == 2
+    assert client.delete(f"/tickets/reset-jobs/{job_id}").status_code == 409
+    assert client.get("/tickets/reset-jobs/unknown").status_code == 404
+
+def test_list_tickets_keyset_pagination(client):
+    """Testa listagem paginada por id com filtros e projeção de colunas"""
+    first = client.get("/tickets?event_id=1&limit=2&fields=seat_node_id,state")
+    assert first.status_code == 200
+    page = first.json()
+    assert len(page["items"]) == 2
+    assert set(page["items"][0]) == {"id", "seat_node_id", "state"}
+    
+    second = client.get(f"/tickets?event_id=1&limit=2&after={page['next_after']}").json()
+    assert second["items"][0]["id"] > page["items"][-1]["id"]
+    
+    assert client.get("/tickets?fields=password").status_code == 400
+    assert client.get("/tickets?limit=0").status_code == 400
+    assert client.get("/tickets?event_id=99999").json() == {"items": [], "next_after": None}
+
+def test_export_tickets_streaming(client):
+    """Testa exportação NDJSON e CSV"""
+    response = client.get("/tickets?event_id=1&format=ndjson&fields=id,sector_id")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert rows == sorted(rows, key=lambda row: row["id"])
+    paged, after = [], 0
+    while after is not None:
+        page = client.get(f"/tickets?event_id=1&fields=id,sector_id&limit=1000&after={after}").json()
+        paged += page["items"]
+        after = page["next_after"]
+    assert rows == paged
+    
+    csv_lines = client.get("/tickets?event_id=1&format=csv&fields=id,gates_open").text.splitlines()
+    assert csv_lines[0] == "id,gates_open"
+    assert len(csv_lines) == len(rows) + 1
+
+def test_event_occupancy_counters(client):
+    """Testa contadores de ocupação atualizados por admissão, criação, remoção e reset"""
+    client.patch("/tickets/reset?event_id=1")
+    before = client.get("/events/1/occupancy")
+    assert before.status_code == 200
+    before = before.json()
+    assert before["admitted"] == 0
+    assert before["total"] == sum(s["total"] for s in before["sectors"].values())
+    
+    client.post("/tickets/admit", json={"ticket_ids": [1, 1]})
+    client.put("/ticket/1")
+    after = client.get("/events/1/occupancy").json()
+    assert after["admitted"] == 1
+    assert after["sectors"]["Sul"]["admitted"] == before["sectors"]["Sul"]["admitted"] + 1
+    
+    created = client.post("/ticket/", json={
+        "id": 0, "event_id": 1, "gates_open": "2024-09-15T19:00:00", "gate_id": "Gate Z",
+        "row_id": "Row 1", "seat_id": "Seat 1", "sector_id": "Norte", "ticket_type": "Standard", "state": True
+    }).json()
+    assert client.get("/events/1/occupancy").json()["gates"]["Gate Z"] == {"total": 1, "admitted": 1}
+    
+    client.delete(f"/ticket/{created['id']}")
+    client.patch("/tickets/reset?event_id=1")
+    final = client.get("/events/1/occupancy").json()
+    assert final["gates"]["Gate Z"] == {"total": 0, "admitted": 0}
+    assert final["total"] == before["total"]
+    assert final["admitted"] == 0
+    
+    assert client.get("/events/99999/occupancy").status_code == 404
+
+def test_admission_published_to_stream(client):
+    """Testa que uma admissão chega aos subscritores do stream com o seat_node_id"""
+    import time
+    from admission_stream import admission_stream
+    
+    client.patch("/tickets/reset?event_id=1")
+    subscriber = admission_stream.subscribe(event_id=1)
+    try:
+        client.post("/ticket/2/admit")
+        time.sleep(admission_stream.window + 0.2)
+        batch = subscriber.queue.get_nowait()
+    finally:
+        admission_stream.unsubscribe(subscriber)
+    assert batch["changes"][0]["ticket_id"] == 2
+    assert batch["changes"][0]["seat_node_id"] == client.get("/ticket/2").json()["seat_node_id"]
+    assert batch["changes"][0]["state"] is True
+
+def test_lookup_seats_by_node_id_and_prefix(client):
+    """Testa lookup de lugares por lista de seat_node_ids e por prefixo"""
+    seat = client.get("/ticket/1").json()["seat_node_id"]
+    response = client.post("/events/1/seats/lookup", json={"seat_node_ids": [seat, "Seat-Inexistente"]})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["fields"] == ["seat_node_id", "ticket_id", "state"]
+    assert [seat, 1] in [row[:2] for row in data["rows"]]
+    assert data["missing"] == ["Seat-Inexistente"]
+    
+    prefix = seat.rsplit("-", 2)[0] + "-"
+    rows = client.post("/events/1/seats/lookup", json={"prefix": prefix}).json()["rows"]
+    assert rows and all(row[0].startswith(prefix) for row in rows)
+    # Os caracteres especiais do LIKE são tratados literalmente
+    assert client.post("/events/1/seats/lookup", json={"prefix": "%"}).json()["rows"] == []
+    
+    assert client.post("/events/1/seats/lookup", json={}).status_code == 422
+    assert client.post("/events/1/seats/lookup", json={"prefix": "Seat", "seat_node_ids": [seat]}).status_code == 422
+
+def test_get_ticket_conditional(client):
+    """Testa ETag da versão da linha, 304 com If-None-Match e nova versão após alteração"""
+    client.patch("/tickets/reset?event_id=1")
+    response = client.get("/ticket/6")
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+    assert response.headers["cache-control"] == "private, no-cache"
+    version = response.json()["version"]
+    
+    cached = client.get("/ticket/6", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.headers["etag"] == etag
+    
+    client.put("/ticket/6")
+    changed = client.get("/ticket/6", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.json()["version"] == version + 1
+    assert changed.headers["etag"] != etag
+    
+    # Reservar um lugar já ocupado não cria nova versão
+    client.put("/ticket/6")
+    assert client.get("/ticket/6", headers={"If-None-Match": changed.headers["etag"]}).status_code == 304
+
+def test_scan_conditional(client, qr_secret):
+    """Testa 304 no scan quando o bilhete não mudou"""
+    token = generate_qr_token(1, qr_secret)
+    etag = client.get(f"/ticket/scan/{token}").headers["etag"]
+    assert client.get(f"/ticket/scan/{token}", headers={"If-None-Match": etag}).status_code == 304
+
+def test_reset_job_cancelled_from_another_worker():
+    """Testa o cancelamento pedido noutro worker (cancel_requested), visto no fim do bloco"""
+    import asyncio
+    from psycopg.types.json import Jsonb
+    from database import get_db_connection, close_db_pool
+    from seat_reset import ResetJob, INSERT_JOB_SQL, _run_job, get_reset_job, reset_seats
+    job = ResetJob({"event_id": 1, "sector_id": None, "gate_id": None}, 1, stored=True)
+    
+    async def scenario():
+        try:
+            async with get_db_connection() as conn:
+                await conn.execute("UPDATE tickets SET state = true WHERE event_id = 1 AND id IN (1, 2)")
+                await conn.execute(INSERT_JOB_SQL, (job.id, Jsonb(job.filters), job.chunk_size, job.started_at, "test"))
+                await conn.execute("UPDATE reset_jobs SET cancel_requested = true WHERE id = %s", (job.id,))
+            await _run_job(job)
+            stored = await get_reset_job(job.id)
+            await reset_seats(ResetJob({"event_id": 1}, 100))
+            return stored
+        finally:
+            await close_db_pool()
+    
+    stored = asyncio.run(scenario())
+    assert (stored["status"], stored["reset"], stored["chunks"]) == ("cancelled", 1, 1)
+
+def test_reset_job_of_dead_worker_marked_failed(client):
+    """Testa que um job a correr sem heartbeat recente (worker morto) passa a failed ao ser consultado"""
+    import uuid
+    from tests.conftest import connect
+    job_id = uuid.uuid4().hex
+    conn = connect()
+    try:
+        conn.cursor().execute(
+            """INSERT INTO reset_jobs (id, filters, chunk_size, owner, heartbeat_at)
+               VALUES (%s, '{}', 1, 'host:1', localtimestamp - interval '1 hour')""", (job_id,))
+    finally:
+        conn.close()
+    job = client.get(f"/tickets/reset-jobs/{job_id}").json()
+    assert job["status"] == "failed"
+    assert "host:1" in job["error"]
+    assert client.delete(f"/tickets/reset-jobs/{job_id}").status_code == 409
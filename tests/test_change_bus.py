@@ -0,0 +1,75 @@
+import json
+import select
+import time
+from datetime import datetime
+from change_bus import ChangeBus, build_payloads, decode_row, encode_row, CHANGE_BUS_CHANNEL, MAX_PAYLOAD_BYTES
+from scan_guard import missing_tickets
+from tests.conftest import connect
+
+def wait_for(condition, timeout: float = 5) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+def test_payloads_split_under_notify_limit():
+    """Testa a divisão em mensagens abaixo do limite do NOTIFY sem perder nem reordenar mudanças"""
+    row = {"id": 1, "event_id": 2, "sector_id": "Norte", "gate_id": "Gate A",
+           "seat_node_id": "Seat-Norte-T0-R01-01", "state": True, "admitted_at": datetime(2024, 9, 15, 19, 30)}
+    changes = [["admit", *encode_row({**row, "id": ticket_id})] for ticket_id in range(1000)]
+    payloads = build_payloads("worker-a", changes)
+    assert len(payloads) > 1
+    assert all(len(payload.encode()) <= MAX_PAYLOAD_BYTES for payload in payloads)
+    received = [change for payload in payloads for change in json.loads(payload)["c"]]
+    assert received == json.loads(json.dumps(changes))
+    assert decode_row(received[0][1:]) == {**row, "id": 0}
+
+def test_receive_skips_own_messages():
+    """Testa que cada worker só aplica as mudanças dos outros"""
+    applied = []
+    bus = ChangeBus(origin="worker-a", enabled=False)
+    bus.register("delete", lambda row: applied.append(row["id"]))
+    bus.register("import", lambda: applied.append("import"))
+    own, = build_payloads("worker-a", [["delete", 1, 1, "Norte", "Gate A", "x", False, None]])
+    other, = build_payloads("worker-b", [["delete", 2, 1, "Norte", "Gate A", "x", False, None], ["import"]])
+    bus.receive(own)
+    bus.receive(other)
+    assert applied == [2, "import"]
+    assert bus.received == 1
+
+def test_listener_applies_remote_changes(client):
+    """Testa que uma mudança notificada por outro worker atualiza o estado deste"""
+    assert wait_for(lambda: client.get("/health/pool").json()["change_bus"]["connected"])
+    missing_tickets.put(987654321)
+    payload, = build_payloads("outro-worker", [["create", 987654321, 999, "Norte", "Gate A", "x", False, None]])
+    conn = connect()
+    try:
+        conn.cursor().execute("SELECT pg_notify(%s, %s)", (CHANGE_BUS_CHANNEL, payload))
+    finally:
+        conn.close()
+    assert wait_for(lambda: 987654321 not in missing_tickets)
+
+def test_writes_are_published(client):
+    """Testa que uma escrita é propagada no canal com a origem do worker"""
+    conn = connect()
+    try:
+        conn.cursor().execute(f"LISTEN {CHANGE_BUS_CHANNEL}")
+        response = client.post("/ticket/", json={
+            "id": 0, "event_id": 1, "gates_open": "2024-09-15T19:00:00", "gate_id": "Gate A",
+            "row_id": "Row 9", "seat_id": "Seat 9", "sector_id": "Norte", "ticket_type": "Standard",
+            "state": False, "seat_node_id": "Seat-Norte-T0-R09-09"
+        })
+        assert response.status_code == 200
+        ticket_id = response.json()["id"]
+
+        def received():
+            if select.select([conn], [], [], 0.1)[0]:
+                conn.poll()
+            return any(change[:2] == ["create", ticket_id]
+                       for notify in conn.notifies for change in json.loads(notify.payload)["c"])
+        assert wait_for(received)
+        client.delete(f"/ticket/{ticket_id}")
+    finally:
+        conn.close()
@@ -62,4 +62,55 @@ def test_tables_exist():
         print("Tabelas existem no banco de dados")
     except Exception as e:
         print(f"Erro ao verificar tabelas: {e}")
-        raise
\ No newline at end of file
+        raise
+
+def test_reads_routed_to_replica_with_read_your_writes(monkeypatch):
+    """Testa leituras na réplica, LSN devolvido pela reserva e fallback para o primário.
+    A própria base de dados de teste faz de réplica (não está em recovery, logo está sempre atualizada)"""
+    import database
+    from fastapi.testclient import TestClient
+    from api_handler import app
+    
+    replica = f"{os.getenv('DB_HOST', 'localhost')}:{os.getenv('DB_PORT', 5432)}"
+    monkeypatch.setattr(database, "DB_REPLICA_HOSTS", [replica])
+    with TestClient(app) as client:
+        reserved = client.put("/ticket/7")
+        assert reserved.status_code == 200
+        lsn = reserved.headers["X-Read-After-LSN"]
+        
+        response = client.get("/ticket/7", headers={"X-Read-After-LSN": lsn})
+        assert response.status_code == 200
+        assert response.json()["state"] is True
+        assert database.replica_pools[0].get_stats()["requests_num"] >= 1
+        assert client.get("/ticket/7", headers={"X-Read-After-LSN": "not-an-lsn"}).status_code == 400
+    assert database.replica_pools == []
+
+def test_read_falls_back_to_primary_when_replica_down(monkeypatch):
+    """Testa que uma réplica inacessível não impede as leituras"""
+    import database
+    from fastapi.testclient import TestClient
+    from api_handler import app
+    
+    monkeypatch.setattr(database, "DB_REPLICA_HOSTS", ["127.0.0.1:1"])
+    monkeypatch.setattr(database, "DB_REPLICA_TIMEOUT", 0.2)
+    with TestClient(app) as client:
+        response = client.get("/ticket/1")
+        assert response.status_code == 200
+        assert response.json()["id"] == 1
+
+def test_failed_replica_skipped_until_retry(monkeypatch):
+    """Testa que uma réplica que falhou é saltada (sem esperar o timeout) até DB_REPLICA_RETRY_SECONDS"""
+    import time
+    import database
+    from fastapi.testclient import TestClient
+    from api_handler import app
+    
+    monkeypatch.setattr(database, "DB_REPLICA_HOSTS", ["127.0.0.1:1"])
+    monkeypatch.setattr(database, "DB_REPLICA_TIMEOUT", 1.0)
+    monkeypatch.setattr(database, "DB_REPLICA_RETRY_SECONDS", 60)
+    with TestClient(app) as client:
+        assert client.get("/ticket/1").status_code == 200
+        assert database.pool_stats()["replicas_down"] == [0]
+        start = time.perf_counter()
+        assert client.get("/ticket/2").status_code == 200
+        assert time.perf_counter() - start < 0.5
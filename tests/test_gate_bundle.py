@@ -0,0 +1,144 @@
+import pytest
+from gate_bundle import (GateBundle, encode_bundle, build_snapshot, build_changes, prune, ExpiredCursor,
+                         SNAPSHOT_MAGIC, DELTA_MAGIC, VALID, ALREADY_USED, UNKNOWN_TICKET, WRONG_EVENT,
+                         BAD_SIGNATURE, BAD_FORMAT)
+from qr_tokens import generate_token_v2, token_v2_mac, QR_ACTIVE_KEY
+from tests.conftest import connect, run_async
+
+def test_offline_validation():
+    """Testa a validação local: assinatura, estado, evento e bilhetes desconhecidos"""
+    bundle = GateBundle(encode_bundle(SNAPSHOT_MAGIC, 7, "Gate A", 0, 100, [(10, False), (20, True), (30, False)]))
+    assert (len(bundle), bundle.event_id, bundle.gate_id, bundle.cursor) == (3, 7, "Gate A", 100)
+    assert bundle.validate(generate_token_v2(10, 7)) == VALID
+    assert bundle.validate(generate_token_v2(10, 7)) == ALREADY_USED
+    assert bundle.validate(generate_token_v2(20, 7)) == ALREADY_USED
+    assert bundle.validate(generate_token_v2(15, 7)) == UNKNOWN_TICKET
+    assert bundle.validate(generate_token_v2(30, 8)) == WRONG_EVENT
+    assert bundle.validate("10:abcdef0123456789") == BAD_FORMAT
+    token = generate_token_v2(30, 7)
+    forged = token[:-1] + ("A" if token[-1] != "A" else "B")
+    assert bundle.validate(forged) == BAD_SIGNATURE
+    assert bundle.validate(token) == VALID
+
+def test_bundle_does_not_carry_token_macs():
+    """Testa que o bundle não leva os MACs dos tokens (não permite reconstruir QR válidos)"""
+    data = encode_bundle(SNAPSHOT_MAGIC, 7, None, 0, 100, [(10, False), (20, False)])
+    for ticket_id in (10, 20):
+        assert token_v2_mac(ticket_id, 7, QR_ACTIVE_KEY) not in data
+
+def test_bundle_signature_checked():
+    """Testa que um bundle alterado ou assinado com outra chave é rejeitado"""
+    data = bytearray(encode_bundle(SNAPSHOT_MAGIC, 7, None, 0, 100, [(10, False)]))
+    with pytest.raises(ValueError):
+        GateBundle(bytes(data), key=b"outra-chave")
+    data[30] ^= 1
+    with pytest.raises(ValueError):
+        GateBundle(bytes(data))
+
+def test_apply_delta():
+    """Testa que o delta substitui linhas alteradas, acrescenta novas e retira as removidas"""
+    bundle = GateBundle(encode_bundle(SNAPSHOT_MAGIC, 7, None, 0, 100, [(10, False), (20, False), (30, True)]))
+    delta = GateBundle(encode_bundle(DELTA_MAGIC, 7, None, 100, 150, [(5, False), (20, True), (30, False)], [10]))
+    bundle.apply_delta(delta)
+    assert list(bundle.ids) == [5, 20, 30]
+    assert bundle.cursor == 150
+    assert bundle.validate(generate_token_v2(10, 7)) == UNKNOWN_TICKET
+    assert bundle.validate(generate_token_v2(5, 7)) == VALID
+    assert bundle.validate(generate_token_v2(20, 7)) == ALREADY_USED
+    assert bundle.validate(generate_token_v2(30, 7)) == VALID
+    with pytest.raises(ValueError):
+        # O mesmo delta não se aplica duas vezes (since já não é o cursor)
+        bundle.apply_delta(delta)
+
+def test_gate_bundle_snapshot_and_changes(client):
+    """Testa snapshot por porta e delta com reserva, criação e remoção de bilhetes"""
+    new_ticket = {
+        "id": 0, "event_id": 1, "gates_open": "2024-09-15T19:00:00", "gate_id": "Gate Offline",
+        "row_id": "Row 1", "seat_id": "Seat 1", "sector_id": "Norte", "ticket_type": "Standard",
+        "state": False, "seat_node_id": "Seat-Norte-T0-R01-01"
+    }
+    first = client.post("/ticket/", json=new_ticket).json()["id"]
+    removed = client.post("/ticket/", json=new_ticket).json()["id"]
+
+    response = client.get("/events/1/gate-bundle?gate_id=Gate%20Offline")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/octet-stream"
+    bundle = GateBundle(response.content)
+    assert bundle.cursor == int(response.headers["X-Bundle-Cursor"])
+    assert bundle.gate_id == "Gate Offline"
+    assert {first, removed} <= set(bundle.ids)
+    assert bundle.key_indexes and QR_ACTIVE_KEY in bundle.key_indexes
+
+    # Mudanças depois do snapshot
+    assert client.put(f"/ticket/{first}").status_code == 200
+    added = client.post("/ticket/", json=new_ticket).json()["id"]
+    assert client.delete(f"/ticket/{removed}").status_code == 200
+
+    response = client.get(f"/events/1/gate-bundle/changes?since={bundle.cursor}&gate_id=Gate%20Offline")
+    assert response.status_code == 200
+    delta = GateBundle(response.content)
+    assert removed in delta.removed
+    bundle.apply_delta(delta)
+    assert bundle.validate(generate_token_v2(first, 1)) == ALREADY_USED
+    assert bundle.validate(generate_token_v2(removed, 1)) == UNKNOWN_TICKET
+    assert bundle.validate(generate_token_v2(added, 1)) == VALID
+
+    # Sem mudanças: delta vazio
+    response = client.get(f"/events/1/gate-bundle/changes?since={bundle.cursor}&gate_id=Gate%20Offline")
+    assert len(GateBundle(response.content)) == 0
+    for ticket_id in (first, added):
+        client.delete(f"/ticket/{ticket_id}")
+
+def test_gate_bundle_errors(client):
+    """Testa evento sem bilhetes e evento fora do alcance dos tokens v2"""
+    assert client.get("/events/65000/gate-bundle").status_code == 404
+    assert client.get("/events/70000/gate-bundle").status_code == 400
+    assert client.get("/events/1/gate-bundle/changes?since=-1").status_code == 400
+
+def test_expired_cursor(client):
+    """Testa que um cursor que nunca foi entregue é recusado com 410"""
+    response = client.get("/events/1/gate-bundle/changes?since=1")
+    assert response.status_code == 410
+
+def test_prune_keeps_tombstones_of_live_cursors():
+    """Testa que os tombstones só são apagados quando nenhum cursor em uso precisa deles"""
+    conn = connect()
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            """INSERT INTO tickets (event_id, gates_open, gate_id, row_id, seat_id, sector_id, ticket_type, state)
+               VALUES (1, '2024-09-15 19:00', 'Gate Prune', 'Row 1', 'Seat 1', 'Norte', 'Standard', false)
+               RETURNING id"""
+        )
+        ticket_id, = cur.fetchone()
+        cursor, _ = run_async(build_snapshot(1, "Gate Prune"))
+        cur.execute("DELETE FROM tickets WHERE id = %s", (ticket_id,))
+        cur.execute("UPDATE ticket_tombstones SET deleted_at = deleted_at - interval '1 day' WHERE ticket_id = %s",
+                    (ticket_id,))
+
+        run_async(prune())
+        cur.execute("SELECT count(*) FROM ticket_tombstones WHERE ticket_id = %s", (ticket_id,))
+        assert cur.fetchone()[0] == 1
+
+        # Sem cursores em uso do evento o tombstone deixa de ser preciso
+        cur.execute("UPDATE gate_bundle_cursors SET last_used = last_used - interval '1 day' WHERE event_id = 1")
+        run_async(prune())
+        cur.execute("SELECT count(*) FROM ticket_tombstones WHERE ticket_id = %s", (ticket_id,))
+        assert cur.fetchone()[0] == 0
+        with pytest.raises(ExpiredCursor):
+            run_async(build_changes(1, cursor, "Gate Prune"))
+    finally:
+        conn.close()
+
+def test_concurrent_changes_with_same_cursor(client):
+    """Testa muitas portas a pedir o delta com o mesmo cursor em simultâneo (todas recebem 200)"""
+    from concurrent.futures import ThreadPoolExecutor
+    cursor = client.get("/events/1/gate-bundle").headers["X-Bundle-Cursor"]
+    # Uma escrita depois do snapshot: os deltas registam um cursor novo
+    assert client.put("/ticket/3").status_code == 200
+    
+    def fetch(_):
+        return client.get(f"/events/1/gate-bundle/changes?since={cursor}").status_code
+    with ThreadPoolExecutor(max_workers=20) as pool:
+        statuses = list(pool.map(fetch, range(20)))
+    assert statuses == [200] * 20
@@ -0,0 +1,23 @@
+from http_cache import LRUCache, make_etag, etag_matches
+
+def test_lru_cache_eviction():
+    """Testa que a entrada menos usada é removida primeiro"""
+    cache = LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert (cache.hits, cache.misses) == (3, 1)
+
+def test_etag_matches():
+    """Testa comparação de If-None-Match com listas, wildcard e ETags fracos"""
+    etag = make_etag(b"conteudo")
+    assert etag.startswith('"') and etag.endswith('"')
+    assert etag_matches(etag, etag)
+    assert etag_matches(f'"outro", W/{etag}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches('"outro"', etag)
+    assert not etag_matches(None, etag)
@@ -0,0 +1,67 @@
+import json
+import pytest
+from import_tickets import validate_record
+from pydantic import ValidationError
+from qr_tokens import parse_qr_token
+
+CSV_HEADER = "event_id,gates_open,gate_id,row_id,seat_id,sector_id,ticket_type,state,seat_node_id"
+
+def make_record(seat: int) -> dict:
+    return {
+        "event_id": 1,
+        "gates_open": "2024-09-15T19:00:00",
+        "gate_id": "Gate B",
+        "row_id": "Row 40",
+        "seat_id": f"Seat {seat}",
+        "sector_id": "Este",
+        "ticket_type": "Season",
+        "state": False,
+        "seat_node_id": f"Seat-Este-T0-R40-{seat:02d}",
+    }
+
+def test_validate_record():
+    """Testa validação de um registo sem id contra o modelo Ticket"""
+    ticket = validate_record(make_record(1))
+    assert ticket.seat_id == "Seat 1"
+    with pytest.raises(ValidationError):
+        validate_record({"event_id": "abc"})
+
+def test_bulk_import_ndjson(client):
+    """Testa importação NDJSON com linhas inválidas reportadas e ignoradas"""
+    lines = [json.dumps(make_record(i)) for i in range(1, 4)]
+    lines.insert(1, "{not json")
+    lines.append(json.dumps({**make_record(9), "event_id": 424242}))
+    response = client.post("/tickets/bulk", content="\n".join(lines))
+    assert response.status_code == 200
+    report = response.json()
+    assert report["inserted"] == 3
+    assert report["rejected"] == 2
+    assert [e["line"] for e in report["errors"]] == [2, 5]
+    assert len(report["ids"]) == 3 and report["ids"] == sorted(report["ids"])
+    for ticket_id, seat in zip(report["ids"], range(1, 4)):
+        assert client.get(f"/ticket/{ticket_id}").json()["seat_id"] == f"Seat {seat}"
+    assert "qr_tokens" not in report
+
+def test_bulk_import_with_qr_tokens(client):
+    """Testa que a importação devolve o token do QR de cada bilhete criado"""
+    lines = [json.dumps(make_record(i)) for i in range(10, 12)]
+    report = client.post("/tickets/bulk?qr_tokens=true", content="\n".join(lines)).json()
+    assert [parse_qr_token(token) for token in report["qr_tokens"]] == [(ticket_id, 1) for ticket_id in report["ids"]]
+
+def test_bulk_import_csv(client):
+    """Testa importação CSV com cabeçalho"""
+    body = "\n".join([
+        CSV_HEADER,
+        "1,2024-09-15 19:00:00,Gate B,Row 41,Seat 1,Este,Season,false,Seat-Este-T0-R41-01",
+        "1,2024-09-15 19:00:00,Gate B,Row 41,Seat 2,Este,Season,false,",
+        "1,not-a-date,Gate B,Row 41,Seat 3,Este,Season,false,",
+    ])
+    response = client.post("/tickets/bulk?format=csv", content=body)
+    report = response.json()
+    assert report["inserted"] == 2
+    assert report["errors"][0]["line"] == 4
+
+def test_bulk_import_invalid_format(client):
+    """Testa formato não suportado"""
+    response = client.post("/tickets/bulk?format=xml", content="<ticket/>")
+    assert response.status_code == 400
@@ -0,0 +1,69 @@
+import asyncio
+import pytest
+from load_shedding import ConcurrencyLimiter, Overloaded, limiters
+
+def test_limiter_queue_and_handover():
+    """Testa limite de execução, fila FIFO e passagem direta do lugar ao próximo"""
+    async def scenario():
+        limiter = ConcurrencyLimiter("test", limit=1, max_waiting=1, timeout=1)
+        await limiter.acquire()
+        waiting = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded):
+            # Fila cheia: recusado sem esperar
+            await limiter.acquire()
+        limiter.release()
+        await waiting
+        stats = limiter.stats()
+        limiter.release()
+        return stats, limiter.stats()
+    
+    during, after = asyncio.run(scenario())
+    assert (during["active"], during["waiting"], during["shed"]) == (1, 0, 1)
+    assert after["active"] == 0
+
+def test_limiter_wait_timeout():
+    """Testa que a espera máxima termina em Overloaded e não deixa lugares presos"""
+    async def scenario():
+        limiter = ConcurrencyLimiter("test", limit=1, max_waiting=5, timeout=0.01)
+        await limiter.acquire()
+        with pytest.raises(Overloaded) as exc:
+            await limiter.acquire()
+        limiter.release()
+        return exc.value, limiter.stats()
+    
+    error, stats = asyncio.run(scenario())
+    assert error.retry_after == 0.01
+    assert stats == {"limit": 1, "active": 0, "waiting": 0, "max_waiting": 5, "shed": 1}
+
+def test_admin_shed_while_scans_served(client, monkeypatch):
+    """Testa que com o pool saturado as operações admin são cortadas e os scans continuam"""
+    monkeypatch.setattr(limiters["admin"], "shed_when", lambda: True)
+    response = client.patch("/tickets/reset?event_id=99999")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    assert client.post("/ticket/1/admit").status_code == 200
+
+def test_health_pool_stats(client):
+    """Testa as estatísticas dos pools e dos limites"""
+    client.get("/ticket/1")
+    data = client.get("/health/pool").json()
+    assert data["primary"]["pool_max"] > 0
+    assert data["replicas"] == []
+    assert set(data["limits"]) == {"scan", "api", "admin"}
+    assert data["limits"]["api"]["active"] == 0
+
+def test_export_counts_as_admin(client, monkeypatch):
+    """Testa que a exportação em streaming usa a classe admin e a paginação a classe api"""
+    monkeypatch.setattr(limiters["admin"], "shed_when", lambda: True)
+    assert client.get("/tickets?event_id=1&format=csv").status_code == 503
+    assert client.get("/tickets?event_id=1&limit=1").status_code == 200
+
+def test_limits_split_across_workers(monkeypatch):
+    """Testa a repartição dos limites da instância pelos workers"""
+    import database
+    monkeypatch.setattr(database, "API_WORKERS", 3)
+    assert database.per_worker(64) == 22
+    assert database.per_worker(2) == 1
+    monkeypatch.setattr(database, "API_WORKERS", 1)
+    assert database.per_worker(64) == 64
@@ -0,0 +1,136 @@
+import hashlib
+import hmac
+import os
+import threading
+import time
+import pytest
+from metrics import Counter, Histogram
+from profiler import SamplingProfiler
+
+def metric_value(text: str, sample: str) -> float:
+    for line in text.splitlines():
+        if line.startswith(sample + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+def test_histogram_cumulative_buckets():
+    """Testa que os buckets são cumulativos e que _count e _sum batem com as observações"""
+    histogram = Histogram("test_seconds", "teste", ("route",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5):
+        histogram.observe(value, "/x")
+    lines = histogram.render()
+    assert 'test_seconds_bucket{route="/x",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{route="/x",le="1.0"} 3' in lines
+    assert 'test_seconds_bucket{route="/x",le="+Inf"} 4' in lines
+    assert 'test_seconds_count{route="/x"} 4' in lines
+    assert 'test_seconds_sum{route="/x"} 6.05' in lines
+
+def test_counter_escapes_labels():
+    """Testa o escape de aspas e barras nos valores dos labels"""
+    counter = Counter("test_total", "teste", ("source",))
+    counter.inc('a"b\\c')
+    counter.inc('a"b\\c', amount=2)
+    assert 'test_total{source="a\\"b\\\\c"} 3' in counter.render()
+
+def test_metrics_endpoint(client):
+    """Testa latência por rota (template), contadores de scan e gauges do pool"""
+    secret = os.getenv("QR_SECRET", "test-secret-key-for-testing-only")
+    signature = hmac.new(secret.encode(), b"1", hashlib.sha256).hexdigest()[:16]
+    before = client.get("/metrics").text
+    assert client.get(f"/ticket/scan/1:{signature}").status_code == 200
+    assert client.get("/ticket/scan/1:0000000000000000").status_code == 401
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = response.text
+    for result in ("ok", "bad_signature"):
+        sample = f'scan_results_total{{source="scan",result="{result}"}}'
+        assert metric_value(text, sample) == metric_value(before, sample) + 1
+    # O label é o template da rota, não o token
+    assert 'route="/ticket/scan/{qr_data}"' in text
+    assert "1:0000000000000000" not in text
+    assert 'qr_token_verify_seconds_count' in text
+    assert 'db_pool_connections_in_use{pool="primary"}' in text
+    assert 'concurrency_active{class="scan"}' in text
+
+def test_profiler_disabled_by_default(client):
+    """Testa que os endpoints do profiler não existem sem PROFILER_ENABLED"""
+    assert client.post("/debug/profiler").status_code == 404
+
+def test_sampling_profiler_collects_stacks():
+    """Testa a amostragem da stack de outra thread e a saída no formato collapsed"""
+    stop = threading.Event()
+
+    def busy_worker():
+        while not stop.is_set():
+            sum(range(1000))
+
+    worker = threading.Thread(target=busy_worker)
+    worker.start()
+    profiler = SamplingProfiler()
+    try:
+        profiler.start(interval_ms=1, max_seconds=5, thread_id=worker.ident)
+        time.sleep(0.1)
+        assert profiler.running
+        with pytest.raises(RuntimeError):
+            profiler.start(thread_id=worker.ident)
+        output = profiler.stop()
+    finally:
+        stop.set()
+        worker.join()
+    assert not profiler.running
+    assert profiler.samples > 0
+    assert "busy_worker (test_metrics.py:" in output
+    stack, count = output.splitlines()[0].rsplit(" ", 1)
+    assert int(count) > 0
+
+def test_profiler_endpoints(client, monkeypatch):
+    """Testa ligar e desligar o profiler em runtime"""
+    monkeypatch.setattr("api_handler.PROFILER_ENABLED", True)
+    monkeypatch.setattr("api_handler.profiler", SamplingProfiler())
+    assert client.post("/debug/profiler?interval_ms=0").status_code == 400
+    response = client.post("/debug/profiler?interval_ms=1&seconds=5")
+    assert response.status_code == 202
+    assert response.json()["running"] is True
+    assert client.post("/debug/profiler").status_code == 409
+    client.get("/health/live")
+    response = client.delete("/debug/profiler")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert client.get("/debug/profiler").json()["running"] is False
+
+def test_metrics_summed_across_workers(tmp_path, monkeypatch):
+    """Testa que /metrics soma as amostras publicadas pelos outros workers e ignora as antigas"""
+    import orjson
+    import metrics
+    monkeypatch.setattr(metrics, "METRICS_DIR", str(tmp_path))
+    metrics.scans_rate_limited.inc(amount=2)
+    metrics.qr_verify_duration.observe(0.0002)
+    own = metrics.registry.collect()
+    rate_limited = own["scan_rate_limited_total"][()]
+    verified = sum(own["qr_token_verify_seconds"][()][:-1])
+    
+    other = {"scan_rate_limited_total": [[[], 5]],
+             "qr_token_verify_seconds": [[[], [1] + [0] * len(metrics.LATENCY_BUCKETS) + [0.5]]]}
+    (tmp_path / "worker-1.json").write_bytes(orjson.dumps(other))
+    stale = tmp_path / "worker-2.json"
+    stale.write_bytes(orjson.dumps(other))
+    os.utime(stale, (0, 0))
+    
+    text = metrics.registry.render()
+    assert metric_value(text, "scan_rate_limited_total") == rate_limited + 5
+    assert metric_value(text, "qr_token_verify_seconds_count") == verified + 1
+    # Os valores vivos deste worker não são alterados pela soma
+    assert metrics.registry.collect()["scan_rate_limited_total"][()] == rate_limited
+    
+    metrics.write_worker_samples()
+    assert (tmp_path / f"worker-{os.getpid()}.json").exists()
+    metrics.remove_worker_samples()
+    assert not (tmp_path / f"worker-{os.getpid()}.json").exists()
+
+def test_profiler_requires_single_worker(client, monkeypatch):
+    """Testa que o profiler é recusado com vários workers"""
+    monkeypatch.setattr("api_handler.PROFILER_ENABLED", True)
+    monkeypatch.setattr("api_handler.API_WORKERS", 2)
+    assert client.post("/debug/profiler").status_code == 409
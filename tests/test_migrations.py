@@ -0,0 +1,79 @@
+"""
+Testes do sistema de migrações e do particionamento por evento
+"""
+import psycopg2
+import pytest
+from migrate import discover_migrations, apply_migrations, applied_versions, detach_event
+from tests.conftest import connect, run_async
+
+def test_discover_migrations_ordered():
+    """Testa que as migrações são descobertas por ordem de versão sem duplicados"""
+    versions = [version for version, _, _ in discover_migrations()]
+    assert versions == sorted(set(versions))
+    assert versions[0] == 1
+
+def test_apply_migrations_idempotent():
+    """Testa que aplicar duas vezes não volta a executar nada"""
+    run_async(apply_migrations())
+    assert run_async(apply_migrations()) == []
+    assert run_async(applied_versions()) >= {v for v, _, _ in discover_migrations()}
+
+def test_new_event_gets_partition_and_can_be_detached():
+    """Testa criação automática da partição de um evento e o detach"""
+    run_async(apply_migrations())
+    conn = connect(autocommit=False)
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO events (event_name, event_date) VALUES ('Jogo Arquivo', '2023-05-01 20:00') RETURNING id")
+    event_id = cursor.fetchone()[0]
+    cursor.execute(
+        "INSERT INTO tickets (event_id, gates_open, gate_id, row_id, seat_id, sector_id, ticket_type, state) "
+        "VALUES (%s, '2023-05-01 19:00', 'Gate A', 'Row 1', 'Seat 1', 'Sul', 'Standard', false) RETURNING id",
+        (event_id,)
+    )
+    ticket_id = cursor.fetchone()[0]
+    conn.commit()
+    
+    cursor.execute("SELECT tableoid::regclass::text FROM tickets WHERE id = %s", (ticket_id,))
+    assert cursor.fetchone()[0] == f"tickets_event_{event_id}"
+    conn.commit()
+    
+    assert run_async(detach_event(event_id)) == f"tickets_event_{event_id}"
+    cursor.execute("SELECT count(*) FROM tickets WHERE id = %s", (ticket_id,))
+    assert cursor.fetchone()[0] == 0
+    cursor.execute(f"SELECT count(*) FROM tickets_event_{event_id}")
+    assert cursor.fetchone()[0] == 1
+    cursor.close()
+    conn.close()
+
+def test_ticket_ids_unique_and_maintained():
+    """Testa que ticket_ids acompanha inserções, mudanças de evento e remoções e mantém o id único"""
+    run_async(apply_migrations())
+    conn = connect(autocommit=False)
+    cursor = conn.cursor()
+    cursor.execute(
+        "INSERT INTO tickets (event_id, gates_open, gate_id, row_id, seat_id, sector_id, ticket_type, state) "
+        "VALUES (1, '2024-09-15 19:00', 'Gate A', 'Row 1', 'Seat 1', 'Sul', 'Standard', false) RETURNING id"
+    )
+    ticket_id = cursor.fetchone()[0]
+    cursor.execute("SELECT event_id FROM ticket_ids WHERE id = %s", (ticket_id,))
+    assert cursor.fetchone()[0] == 1
+    conn.commit()
+    
+    # O mesmo id noutro evento já não é aceite (a chave primária de tickets é (id, event_id))
+    with pytest.raises(psycopg2.errors.UniqueViolation):
+        cursor.execute(
+            "INSERT INTO tickets (id, event_id, gates_open, gate_id, row_id, seat_id, sector_id, ticket_type, state) "
+            "VALUES (%s, 2, '2024-09-15 19:00', 'Gate A', 'Row 1', 'Seat 1', 'Sul', 'Standard', false)",
+            (ticket_id,)
+        )
+    conn.rollback()
+    
+    cursor.execute("UPDATE tickets SET event_id = 2 WHERE id = %s", (ticket_id,))
+    cursor.execute("SELECT event_id FROM ticket_ids WHERE id = %s", (ticket_id,))
+    assert cursor.fetchone()[0] == 2
+    cursor.execute("DELETE FROM tickets WHERE id = %s", (ticket_id,))
+    cursor.execute("SELECT count(*) FROM ticket_ids WHERE id = %s", (ticket_id,))
+    assert cursor.fetchone()[0] == 0
+    conn.commit()
+    cursor.close()
+    conn.close()
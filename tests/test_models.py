@@ -0,0 +1,19 @@
+import json
+from dataclasses import fields
+from datetime import datetime
+from fastapi.responses import ORJSONResponse
+from models import Ticket, TicketRecord, TICKET_COLUMNS
+
+ROW = (1, 1, datetime(2024, 9, 15, 19, 0), "Gate A", "Row 2", "Seat 2", "Sul", "Standard",
+       True, "Seat-Sul-T0-R02-02", datetime(2024, 9, 15, 19, 5, 1, 250000), 2, datetime(2024, 9, 15, 19, 5, 1))
+
+def test_ticket_record_matches_model_columns():
+    """Testa que o registo rápido tem as colunas do modelo pela mesma ordem"""
+    assert tuple(field.name for field in fields(TicketRecord)) == TICKET_COLUMNS
+
+def test_fast_path_json_matches_pydantic():
+    """Testa que orjson sobre TicketRecord produz o mesmo JSON que o modelo Ticket"""
+    fast = json.loads(ORJSONResponse(TicketRecord(*ROW)).body)
+    model = json.loads(Ticket(**dict(zip(TICKET_COLUMNS, ROW))).model_dump_json())
+    assert fast == model
+    assert fast["admitted_at"] == "2024-09-15T19:05:01.250000"
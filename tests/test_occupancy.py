@@ -0,0 +1,33 @@
+from occupancy import EventOccupancy, OccupancyCounters
+from tests.conftest import run_async
+
+def test_event_occupancy_summary():
+    """Testa agregação das células (setor, porta) por setor e por porta"""
+    occupancy = EventOccupancy(1, [
+        {"sector_id": "Norte", "gate_id": "Gate A", "total": 10, "admitted": 4},
+        {"sector_id": "Norte", "gate_id": "Gate B", "total": 5, "admitted": 1},
+        {"sector_id": "Sul", "gate_id": "Gate A", "total": 3, "admitted": 0},
+    ])
+    occupancy.add("Sul", "Gate C", 1, 1)
+    summary = occupancy.summary()
+    assert (summary["total"], summary["admitted"]) == (19, 6)
+    assert summary["sectors"]["Norte"] == {"total": 15, "admitted": 5}
+    assert summary["gates"]["Gate A"] == {"total": 13, "admitted": 4}
+    assert summary["gates"]["Gate C"] == {"total": 1, "admitted": 1}
+
+def test_reconcile_replaces_drifted_counters():
+    """Testa que a reconciliação corrige contadores desviados da tabela"""
+    counters = OccupancyCounters()
+    
+    async def scenario():
+        expected = (await counters.get(1)).summary()
+        counters.apply({"event_id": 1, "sector_id": "Sul", "gate_id": "Gate A"}, total=5, admitted=5)
+        counters.apply({"event_id": 2, "sector_id": "Sul", "gate_id": "Gate A"}, total=1)
+        assert counters.events[1].summary()["total"] == expected["total"] + 5
+        assert 2 not in counters.events
+        await counters.reconcile()
+        return expected, counters.events[1].summary()
+    
+    expected, reconciled = run_async(scenario())
+    assert reconciled["total"] == expected["total"]
+    assert reconciled["admitted"] == expected["admitted"]
@@ -93,4 +93,27 @@ def test_generate_qr_return_value():
         result = qr_module.generate_qr(777, output_file)
         
         assert result == output_file
-        assert os.path.exists(output_file)
\ No newline at end of file
+        assert os.path.exists(output_file)
+
+def test_generate_batch_incremental(tmp_path):
+    """Testa que uma segunda execução só desenha bilhetes novos"""
+    from generate_batch_qr import generate_batch, load_manifest
+    
+    stats = generate_batch(1, 5, output_dir=str(tmp_path), workers=1)
+    assert stats == {"rendered": 5, "skipped": 0, "failed": 0}
+    assert set(load_manifest(str(tmp_path))) == {"1", "2", "3", "4", "5"}
+    
+    stats = generate_batch(1, 7, output_dir=str(tmp_path), workers=1)
+    assert stats == {"rendered": 2, "skipped": 5, "failed": 0}
+    
+    os.remove(tmp_path / "ticket_3_qr.png")
+    stats = generate_batch(1, 7, output_dir=str(tmp_path), workers=1)
+    assert stats["rendered"] == 1
+
+def test_generate_batch_process_pool(tmp_path):
+    """Testa geração paralela com vários processos e ids explícitos"""
+    from generate_batch_qr import generate_batch
+    
+    stats = generate_batch(output_dir=str(tmp_path), ticket_ids=range(10, 150), workers=2)
+    assert stats["rendered"] == 140
+    assert (tmp_path / "ticket_149_qr.png").exists()
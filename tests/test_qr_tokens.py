@@ -0,0 +1,63 @@
+import hashlib
+import hmac
+import pytest
+import qr_tokens
+from qr_tokens import (generate_token_v1, generate_token_v2, generate_qr_token, parse_qr_token,
+                       InvalidQRToken, InvalidQRSignature, parse_keys)
+
+def test_v2_roundtrip():
+    """Testa que um token v2 é compacto, alfanumérico e devolve o bilhete e o evento"""
+    token = generate_token_v2(4242, 7)
+    assert len(token) == 24
+    assert token.isalnum() and token.isupper()
+    assert parse_qr_token(token) == (4242, 7)
+    assert generate_qr_token(4242, 7) == token
+
+def test_v1_backward_compatible():
+    """Testa que tokens v1 continuam a ser aceites"""
+    token = generate_token_v1(15)
+    assert token.startswith("15:")
+    assert parse_qr_token(token) == (15, None)
+    assert generate_qr_token(15) == token
+
+def test_out_of_range_falls_back_to_v1():
+    """Testa que ids fora do alcance do payload v2 geram um token v1 válido"""
+    assert generate_qr_token(15, 70000) == generate_token_v1(15)
+    assert parse_qr_token(generate_qr_token(2**32, 1)) == (2**32, None)
+    with pytest.raises(ValueError):
+        generate_token_v2(15, 70000)
+
+def test_v2_tampered_signature():
+    """Testa que alterar o ticket_id invalida a assinatura"""
+    token = generate_token_v2(1, 1)
+    forged = generate_token_v2(2, 1)[:14] + token[14:]
+    with pytest.raises(InvalidQRSignature):
+        parse_qr_token(forged)
+
+def test_invalid_formats():
+    """Testa tokens mal formados"""
+    for bad in ("lixo", "1:2:3", "abc:0123456789abcdef", "0" * 24):
+        with pytest.raises(InvalidQRToken):
+            parse_qr_token(bad)
+
+def test_key_rotation(monkeypatch):
+    """Testa que tokens assinados com uma chave retirada deixam de ser aceites"""
+    states = {
+        1: hmac.new(b"old-key", digestmod=hashlib.sha256),
+        2: hmac.new(b"new-key", digestmod=hashlib.sha256),
+    }
+    monkeypatch.setattr(qr_tokens, "_KEY_STATES", states)
+    old_token = generate_token_v2(10, 3, key_index=1)
+    new_token = generate_token_v2(10, 3, key_index=2)
+    assert old_token != new_token
+    assert parse_qr_token(old_token) == parse_qr_token(new_token) == (10, 3)
+    
+    del states[1]
+    with pytest.raises(InvalidQRSignature):
+        parse_qr_token(old_token)
+
+def test_parse_keys():
+    """Testa a configuração QR_KEYS"""
+    assert parse_keys("1:a, 2:b") == {1: b"a", 2: b"b"}
+    with pytest.raises(ValueError):
+        parse_keys("16:a")
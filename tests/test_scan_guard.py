@@ -0,0 +1,64 @@
+import pytest
+import api_handler
+import scan_guard
+from scan_guard import TTLCache, RateLimiter
+
+def test_ttl_cache_expiry_and_bound(monkeypatch):
+    """Testa expiração e limite de entradas da cache negativa"""
+    now = [1000.0]
+    monkeypatch.setattr(scan_guard.time, "monotonic", lambda: now[0])
+    cache = TTLCache(max_entries=2, ttl=10)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.put("c", 3)
+    assert "a" not in cache
+    assert cache.get("b") == 2
+    now[0] += 11
+    assert cache.get("c") is None
+    assert len(cache) == 1
+
+def test_rate_limiter(monkeypatch):
+    """Testa o token bucket: rajada, recusa e reposição"""
+    now = [0.0]
+    monkeypatch.setattr(scan_guard.time, "monotonic", lambda: now[0])
+    limiter = RateLimiter(rate=10, burst=3)
+    assert [limiter.acquire("gate-1") for _ in range(3)] == [0, 0, 0]
+    assert limiter.acquire("gate-1") == pytest.approx(0.1)
+    assert limiter.acquire("gate-2") == 0
+    now[0] += 0.1
+    assert limiter.acquire("gate-1") == 0
+    assert RateLimiter(rate=0, burst=0).acquire("x") == 0
+
+def test_rejected_token_is_cached(client, monkeypatch):
+    """Testa que um token forjado repetido não volta a ser verificado"""
+    calls = []
+    original = api_handler.parse_qr_token
+    monkeypatch.setattr(api_handler, "parse_qr_token", lambda token: calls.append(token) or original(token))
+    for _ in range(3):
+        assert client.get("/ticket/scan/7:ffffffffffffffff").status_code == 401
+    assert len(calls) == 1
+
+def test_scan_rate_limited(client, monkeypatch):
+    """Testa resposta 429 com Retry-After quando o cliente excede o limite"""
+    monkeypatch.setattr(api_handler, "scan_rate_limiter", RateLimiter(rate=1, burst=1))
+    assert client.get("/ticket/scan/lixo").status_code == 400
+    response = client.get("/ticket/scan/lixo")
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "1"
+
+def test_full_batch_not_rate_limited(client, monkeypatch):
+    """Testa que lotes completos do mesmo cliente passam e não gastam o limite dos scans unitários"""
+    monkeypatch.setattr(api_handler, "scan_rate_limiter", RateLimiter(rate=100, burst=200))
+    monkeypatch.setattr(api_handler, "batch_scan_rate_limiter", RateLimiter(rate=5, burst=10))
+    tokens = [f"{ticket_id}:ffffffffffffffff" for ticket_id in range(1, api_handler.MAX_BATCH_SCAN + 1)]
+    for _ in range(2):
+        assert client.post("/tickets/scan", json={"tokens": tokens}).status_code == 200
+    assert client.get("/ticket/scan/lixo").status_code == 400
+
+def test_rate_limit_per_reader(client, monkeypatch):
+    """Testa que leitores atrás do mesmo IP (X-Device-Id / X-Gate-Id) têm buckets separados"""
+    monkeypatch.setattr(api_handler, "scan_rate_limiter", RateLimiter(rate=1, burst=1))
+    assert client.get("/ticket/scan/lixo", headers={"X-Device-Id": "T1"}).status_code == 400
+    assert client.get("/ticket/scan/lixo", headers={"X-Device-Id": "T1"}).status_code == 429
+    assert client.get("/ticket/scan/lixo", headers={"X-Device-Id": "T2"}).status_code == 400
+    assert client.get("/ticket/scan/lixo", headers={"X-Gate-Id": "Gate A"}).status_code == 400
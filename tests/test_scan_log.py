@@ -0,0 +1,77 @@
+import asyncio
+import uuid
+from fastapi.testclient import TestClient
+from api_handler import app
+from migrate import apply_migrations
+from scan_log import ScanLog
+from tests.conftest import connect, run_async
+
+def fetch_log(gate_id: str) -> list[tuple]:
+    conn = connect()
+    cursor = conn.cursor()
+    cursor.execute("SELECT source, ticket_id, result FROM scan_log WHERE gate_id = %s ORDER BY scanned_at", (gate_id,))
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
+
+def test_buffer_is_bounded():
+    """Testa que o buffer descarta as entradas mais antigas quando está cheio"""
+    log = ScanLog(buffer_size=3, batch_size=100, enabled=True)
+    for ticket_id in range(5):
+        log.record("scan", "ok", ticket_id=ticket_id)
+    assert [entry[3] for entry in log.entries] == [2, 3, 4]
+    assert log.stats()["dropped"] == 2
+
+def test_flush_writes_batches_with_copy():
+    """Testa a escrita em lotes e a truncagem de valores vindos do cliente"""
+    gate = f"Gate {uuid.uuid4().hex[:8]}"
+    log = ScanLog(buffer_size=100, batch_size=2, enabled=True)
+    
+    async def scenario():
+        await apply_migrations()
+        log.record("scan", "ok", token="T" * 100, ticket_id=1, event_id=1, gate_id=gate, client="127.0.0.1")
+        log.record("scan", "bad_signature", token="1:bad", gate_id=gate)
+        log.record("admit", "admitted", ticket_id=1, gate_id=gate)
+        # O gatilho por tamanho já lançou um flush em segundo plano
+        await log.close()
+    
+    run_async(scenario())
+    assert log.stats() == {"buffered": 0, "written": 3, "dropped": 0, "failed_flushes": 0}
+    assert fetch_log(gate) == [("scan", 1, "ok"), ("scan", None, "bad_signature"), ("admit", 1, "admitted")]
+
+def test_cancelled_flush_keeps_batch(monkeypatch):
+    """Testa que um flush cancelado a meio (shutdown) devolve o lote ao buffer"""
+    import scan_log
+    from contextlib import asynccontextmanager
+    log = ScanLog(buffer_size=100, batch_size=100, enabled=True)
+    started = asyncio.Event()
+    
+    @asynccontextmanager
+    async def stalled_connection():
+        started.set()
+        await asyncio.sleep(60)
+        yield
+    
+    async def scenario():
+        monkeypatch.setattr(scan_log, "get_db_connection", stalled_connection)
+        for ticket_id in range(3):
+            log.record("scan", "ok", ticket_id=ticket_id)
+        task = asyncio.create_task(log.flush())
+        await started.wait()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+    
+    asyncio.run(scenario())
+    assert [entry[3] for entry in log.entries] == [0, 1, 2]
+    assert log.stats() == {"buffered": 3, "written": 0, "dropped": 0, "failed_flushes": 0}
+
+def test_scans_logged_and_flushed_on_shutdown():
+    """Testa que scans e admissões ficam no scan_log com a porta do leitor após o shutdown"""
+    from qr_tokens import generate_token_v2
+    gate = f"Gate {uuid.uuid4().hex[:8]}"
+    headers = {"X-Gate-Id": gate}
+    with TestClient(app) as client:
+        client.get(f"/ticket/scan/{generate_token_v2(1, 1)}", headers=headers)
+        client.get("/ticket/scan/1:0000000000000000", headers=headers)
+        client.post("/tickets/admit", json={"ticket_ids": [99999]}, headers=headers)
+    assert fetch_log(gate) == [("scan", 1, "ok"), ("scan", None, "bad_signature"), ("batch_admit", 99999, "not_found")]
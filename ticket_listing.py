@@ -0,0 +1,98 @@
+"""
+Listagem e exportação de bilhetes
+
+- Paginação keyset em id (WHERE id > after ORDER BY id LIMIT n): o custo de
+  cada página é o mesmo seja qual for a posição, ao contrário de OFFSET.
+- Projeção de colunas (fields=id,state,...) validada contra o modelo Ticket.
+- Exportação NDJSON/CSV em streaming a partir de um cursor do lado do
+  servidor, com memória constante independentemente do número de bilhetes.
+"""
+import csv
+import io
+import json
+from datetime import datetime
+from typing import AsyncIterator
+from database import get_read_connection
+from models import TICKET_COLUMNS
+
+LIST_FILTERS = ("event_id", "sector_id", "gate_id", "state")
+EXPORT_FORMATS = ("ndjson", "csv")
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+# Linhas pedidas ao cursor do servidor de cada vez
+EXPORT_FETCH_SIZE = 2000
+
+
+def parse_fields(spec: str | None) -> tuple[str, ...]:
+    """Interpreta fields=a,b,c; id é sempre incluído (é a chave da paginação)"""
+    if not spec:
+        return TICKET_COLUMNS
+    fields = [name.strip() for name in spec.split(",") if name.strip()]
+    unknown = [name for name in fields if name not in TICKET_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    if "id" not in fields:
+        fields.insert(0, "id")
+    return tuple(dict.fromkeys(fields))
+
+def build_list_query(filters: dict, columns: tuple[str, ...], after: int,
+                     limit: int | None = None) -> tuple[str, list]:
+    conditions = ["id > %s"]
+    params = [after]
+    for column in LIST_FILTERS:
+        if filters.get(column) is not None:
+            conditions.append(f"{column} = %s")
+            params.append(filters[column])
+    sql = f"SELECT {', '.join(columns)} FROM tickets WHERE {' AND '.join(conditions)} ORDER BY id"
+    if limit is not None:
+        sql += " LIMIT %s"
+        params.append(limit)
+    return sql, params
+
+
+async def fetch_page(filters: dict, columns: tuple[str, ...], after: int, limit: int,
+                     min_lsn: str | None = None) -> dict:
+    """Uma página de bilhetes; next_after é o cursor da página seguinte (None no fim)"""
+    sql, params = build_list_query(filters, columns, after, limit)
+    async with get_read_connection(min_lsn) as conn:
+        cursor = await conn.execute(sql, params)
+        items = await cursor.fetchall()
+    next_after = items[-1]["id"] if len(items) == limit else None
+    return {"items": items, "next_after": next_after}
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def _csv_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return "" if value is None else value
+
+async def export_tickets(filters: dict, columns: tuple[str, ...], fmt: str,
+                         after: int = 0, min_lsn: str | None = None) -> AsyncIterator[bytes]:
+    """Produz o export em blocos de bytes, lendo de um cursor do lado do servidor"""
+    sql, params = build_list_query(filters, columns, after)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == "csv" else None
+    if writer is not None:
+        writer.writerow(columns)
+    async with get_read_connection(min_lsn) as conn:
+        async with conn.cursor(name="ticket_export") as cursor:
+            cursor.itersize = EXPORT_FETCH_SIZE
+            await cursor.execute(sql, params)
+            while rows := await cursor.fetchmany(EXPORT_FETCH_SIZE):
+                for row in rows:
+                    if writer is not None:
+                        writer.writerow([_csv_value(row[column]) for column in columns])
+                    else:
+                        buffer.write(json.dumps(row, default=_json_default))
+                        buffer.write("\n")
+                yield buffer.getvalue().encode("utf-8")
+                buffer.seek(0)
+                buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")